@@ -0,0 +1,164 @@
+"""
+Сравнение последовательной и параллельной отправки страницы объявлений
+на локальном фейковом Bot API.
+
+Сервер отвечает на каждый вызов с задержкой --latency и на каждый
+--flood-every-й вызов возвращает 429 с retry_after, поэтому замер
+включает и повторы. Запросы идут через telegram.outbound, как в боте.
+Для каждого объявления проверяется, что его сообщения дошли по порядку.
+
+Запуск: python -m benchmarks.render_page --listings 5 --photos 15 \
+    --mode compact
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from aiohttp import web
+
+os.environ.setdefault("TELEGRAM_TOKEN", "42:benchmark")
+
+from aiogram import Bot, types  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+from telegram.outbound import outbound  # noqa: E402
+from telegram.rendering import (  # noqa: E402
+    ALBUM_SIZE, CARD_COMPACT, CARD_FULL, CARD_LAZY, Listing, render_page)
+
+
+CHAT_ID = 1
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float, flood_every: int) -> None:
+        self.latency = latency
+        self.flood_every = flood_every
+        self.calls = 0
+        self.received = []
+
+    def _message(self) -> dict:
+        return {
+            "message_id": len(self.received),
+            "date": int(time.time()),
+            "chat": {"id": CHAT_ID, "type": "private"},
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = await request.post()
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        if self.flood_every and self.calls % self.flood_every == 0:
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        if method == "sendMediaGroup":
+            media = json.loads(form["media"])
+            for item in media:
+                self.received.append(item["media"])
+                if item.get("caption"):
+                    self.received.append(item["caption"])
+            result = [self._message() for _ in media]
+        elif method == "sendPhoto":
+            self.received.extend((form["photo"], form["caption"]))
+            result = self._message()
+        else:
+            self.received.append(form["text"])
+            result = self._message()
+        return web.json_response({"ok": True, "result": result})
+
+
+def make_listings(count: int, photos: int) -> list:
+    return [
+        Listing(i, [f"listing{i}-photo{j}" for j in range(photos)],
+                f"listing{i}-text")
+        for i in range(count)
+    ]
+
+
+def check_order(received: list, listings: list, mode: str) -> bool:
+    """
+    Сообщения каждого объявления пришли по порядку: текст (или подпись)
+    дошел, фотографии — в исходном порядке (в режиме lazy — только
+    первая).
+    """
+    for listing in listings:
+        prefix = f"listing{listing.apartment_id}-"
+        own = [item for item in received if item.startswith(prefix)]
+        photos = [item for item in own if item != listing.text]
+        expected = listing.photo_ids[:1] if mode == CARD_LAZY else (
+            listing.photo_ids)
+        if photos != expected or listing.text not in own:
+            return False
+    return True
+
+
+async def send_sequentially(bot: Bot, listings: list) -> None:
+    for _, photo_ids, text, _, _ in listings:
+        for i in range(0, len(photo_ids), ALBUM_SIZE):
+            await bot.send_media_group(CHAT_ID, media=[
+                types.InputMediaPhoto(media=file_id)
+                for file_id in photo_ids[i:i + ALBUM_SIZE]])
+        await bot.send_message(CHAT_ID, text)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=5)
+    parser.add_argument("--photos", type=int, default=15)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--flood-every", type=int, default=0)
+    parser.add_argument(
+        "--mode", choices=(CARD_FULL, CARD_COMPACT, CARD_LAZY),
+        default=CARD_COMPACT)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency, args.flood_every)
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    server = TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")
+    listings = make_listings(args.listings, args.photos)
+
+    # Прежний вариант: прямые вызовы без диспетчера.
+    plain_bot = Bot(os.environ["TELEGRAM_TOKEN"],
+                    session=AiohttpSession(api=server))
+    bot = Bot(os.environ["TELEGRAM_TOKEN"], session=AiohttpSession(api=server))
+    bot.session.middleware(outbound)
+    await outbound.start()
+
+    try:
+        if not args.flood_every:
+            started = time.perf_counter()
+            await send_sequentially(plain_bot, listings)
+            print(f"sequential: {time.perf_counter() - started:.2f}s, "
+                  f"{api.calls} calls")
+
+        api.calls = 0
+        api.received.clear()
+        started = time.perf_counter()
+        sent = await render_page(bot, CHAT_ID, listings, args.mode)
+        print(f"render_page: {time.perf_counter() - started:.2f}s, "
+              f"{api.calls} calls, {sent}/{len(listings)} listings, "
+              f"order ok: {check_order(api.received, listings, args.mode)}")
+        print(f"outbound: {outbound.stats()}")
+    finally:
+        await outbound.stop()
+        await plain_bot.session.close()
+        await bot.session.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Нагрузочная проверка приема апдейтов через webhook.
+
+Каждый из --chats чатов отправляет по --per-chat синтетических апдейтов
+POST-запросами на --url, не дожидаясь обработки (как Telegram, каждый
+чат — по очереди). С --self-test поднимается локальный сервер
+telegram.webhook с отдельным диспетчером, обработчик которого «работает»
+--handler-delay секунд и запоминает порядок сообщений: так проверяются
+пропускная способность, ответы 503 при переполнении очередей и порядок
+апдейтов внутри чата.
+
+Запуск: python -m benchmarks.webhook_load --self-test --chats 200 \
+    --per-chat 10 --workers 16
+"""
+import argparse
+import asyncio
+import collections
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+os.environ.setdefault("TELEGRAM_TOKEN", "42:benchmark")
+
+from aiogram import Bot, Dispatcher, Router, types  # noqa: E402
+
+from telegram.webhook import (  # noqa: E402
+    SECRET_HEADER, UpdateWorkers, create_app)
+
+
+def make_update(update_id: int, chat_id: int, seq: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": seq,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": str(seq),
+        },
+    }
+
+
+def make_dispatcher(delay: float, processed: dict) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def handle(message: types.Message) -> None:
+        await asyncio.sleep(delay)
+        processed[message.chat.id].append(int(message.text))
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def run_load(
+    url: str,
+    secret: str,
+    chats: int,
+    per_chat: int
+) -> tuple:
+    statuses = collections.Counter()
+    accepted = collections.defaultdict(list)
+    headers = {SECRET_HEADER: secret} if secret else {}
+
+    async def chat_sender(http: aiohttp.ClientSession, chat_id: int):
+        for seq in range(per_chat):
+            update = make_update(chat_id * per_chat + seq, chat_id, seq)
+            async with http.post(url, json=update, headers=headers) as resp:
+                statuses[resp.status] += 1
+                if resp.status == 200:
+                    accepted[chat_id].append(seq)
+
+    connector = aiohttp.TCPConnector(limit=chats)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(chat_sender(http, chat_id) for chat_id in range(1, chats + 1)))
+        elapsed = time.perf_counter() - started
+    return elapsed, statuses, accepted
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--per-chat", type=int, default=10)
+    parser.add_argument("--self-test", action="store_true")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument("--enqueue-timeout", type=float, default=1.0)
+    parser.add_argument("--handler-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if not args.self_test:
+        elapsed, statuses, _ = await run_load(
+            args.url, args.secret, args.chats, args.per_chat)
+        total = sum(statuses.values())
+        print(f"{total} updates in {elapsed:.2f}s "
+              f"({total / elapsed:.0f} rps), statuses: {dict(statuses)}")
+        return
+
+    processed = collections.defaultdict(list)
+    bot = Bot(os.environ["TELEGRAM_TOKEN"])
+    workers = UpdateWorkers(
+        make_dispatcher(args.handler_delay, processed), bot,
+        args.workers, args.queue_size)
+    app = create_app(
+        workers, "/webhook", args.secret, args.enqueue_timeout)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    await workers.start()
+
+    try:
+        elapsed, statuses, accepted = await run_load(
+            f"http://127.0.0.1:{port}/webhook", args.secret,
+            args.chats, args.per_chat)
+        total = sum(statuses.values())
+        print(f"ingest: {total} updates in {elapsed:.2f}s "
+              f"({total / elapsed:.0f} rps), statuses: {dict(statuses)}")
+        started = time.perf_counter()
+        await workers.stop(timeout=60)
+        print(f"drain: {time.perf_counter() - started:.2f}s, "
+              f"workers: {workers.stats()}")
+        print(f"order ok: {dict(processed) == dict(accepted)}")
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
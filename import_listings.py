@@ -0,0 +1,51 @@
+"""
+Массовый импорт объявлений из CSV или JSON без бота:
+
+    python import_listings.py listings.csv --owner 123456789
+
+Подписчики о таких объявлениях не уведомляются — это делает только
+процесс бота при импорте через /import.
+"""
+import argparse
+import asyncio
+
+from telegram.config import GAZETTEER_PATH
+from telegram.geocoding import gazetteer, nominatim
+from telegram.listing_import import CHUNK_SIZE, import_listings
+from telegram_db.db import init_db
+
+
+async def print_progress(done: int, total: int) -> None:
+    print(f"{done}/{total}")
+
+
+async def runner(args: argparse.Namespace) -> None:
+    await init_db()
+    if GAZETTEER_PATH:
+        gazetteer.load_csv(GAZETTEER_PATH)
+    await nominatim.start()
+    try:
+        with open(args.file, "rb") as file:
+            data = file.read()
+        result = await import_listings(
+            data, args.file, args.owner, geocode=not args.no_geocode,
+            chunk_size=args.chunk, progress=print_progress)
+    finally:
+        await nominatim.close()
+
+    for number, error in result.errors:
+        print(f"Row {number}: {error}")
+    print(f"Inserted {result.inserted} of {result.total} rows in "
+          f"{result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import listings.")
+    parser.add_argument("file", help="CSV or JSON file")
+    parser.add_argument("--owner", required=True,
+                        help="Telegram ID of the listings owner")
+    parser.add_argument("--no-geocode", action="store_true",
+                        help="do not geocode, rows must have a city")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE,
+                        help="rows per transaction")
+    asyncio.run(runner(parser.parse_args()))
@@ -0,0 +1,12 @@
+import asyncio
+
+from telegram.main import cluster_main
+from telegram_db.db import init_db
+
+
+async def runner():
+    await init_db()
+    await cluster_main()
+
+if __name__ == "__main__":
+    asyncio.run(runner())
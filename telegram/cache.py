@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кэш в памяти процесса со сроком жизни
+    записей (общим или своим у записи). Считает попадания и промахи.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Возвращает значение по ключу или None, если его нет или срок
+        жизни истек. Найденная запись становится самой свежей.
+        """
+        item = self._data.get(key)
+        if item is not None and item[1] is not None:
+            if time.monotonic() > item[1]:
+                del self._data[key]
+                item = None
+        if item is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None
+    ) -> None:
+        """
+        Сохраняет значение, вытесняя самые давние записи. ttl задает
+        срок жизни записи вместо общего.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Удаляет запись и возвращает ее значение."""
+        item = self._data.pop(key, None)
+        return item[0] if item is not None else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
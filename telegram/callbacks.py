@@ -0,0 +1,97 @@
+"""
+Типизированные callback data кнопок.
+
+Кнопки перелистывания и действий с объявлениями несут в себе все, что
+нужно для обработки нажатия: курсор соседней страницы, номер страницы,
+общее число результатов и хэш набора фильтров. Поэтому нажатие не
+читает и не меняет состояние FSM, а старые кнопки продолжают работать.
+Упакованные данные укладываются в 64 байта, которые допускает Telegram.
+"""
+import datetime
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from telegram.cache import TTLCache
+from telegram_db.crud import get_filter_set, save_filter_set
+from telegram_db.search import Cursor
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+_filter_sets = TTLCache(maxsize=10000, ttl=24 * 3600)
+
+
+class RentalsPage(CallbackData, prefix="rp"):
+    """Переход к соседней странице результатов поиска."""
+    search: str
+    forward: bool
+    page: int
+    total: int
+    # Курсор (created_at в микросекундах, id, релевантность) объявления,
+    # от которого строится страница.
+    ts: int
+    id: int
+    rank: Optional[int] = None
+
+    @classmethod
+    def from_cursor(
+        cls,
+        search: str,
+        forward: bool,
+        page: int,
+        total: int,
+        cursor: Cursor
+    ) -> "RentalsPage":
+        created_at = datetime.datetime.fromisoformat(cursor[0])
+        return cls(
+            search=search, forward=forward, page=page, total=total,
+            ts=(created_at - _EPOCH) // _MICROSECOND, id=cursor[1],
+            rank=cursor[2] if len(cursor) > 2 else None)
+
+    @property
+    def cursor(self) -> Cursor:
+        created_at = _EPOCH + self.ts * _MICROSECOND
+        cursor = (created_at.isoformat(), self.id)
+        if self.rank is not None:
+            cursor += (self.rank,)
+        return cursor
+
+
+class PublicationsPage(CallbackData, prefix="pp"):
+    """Переход к странице «Мои публикации»."""
+    page: int
+
+
+class ListingAction(CallbackData, prefix="la"):
+    """Действие владельца с объявлением: delete или toggle."""
+    action: str
+    id: int
+    page: int = 0
+
+
+class MorePhotos(CallbackData, prefix="mp"):
+    """Дослать остальные фотографии карточки."""
+    id: int
+
+
+async def remember_filters(session: AsyncSession, filters: dict) -> str:
+    """Сохраняет набор фильтров и возвращает его хэш для кнопок."""
+    filters_key = await save_filter_set(session, filters)
+    _filter_sets.set(filters_key, filters)
+    return filters_key
+
+
+async def resolve_filters(
+    session: AsyncSession,
+    filters_key: str
+) -> Optional[dict]:
+    """Возвращает набор фильтров по хэшу из кнопки или None."""
+    filters = _filter_sets.get(filters_key)
+    if filters is None:
+        filters = await get_filter_set(session, filters_key)
+        if filters is not None:
+            _filter_sets.set(filters_key, filters)
+    return filters
@@ -0,0 +1,180 @@
+"""
+Многопроцессный режим: апдейты обрабатывают несколько процессов.
+
+Фронт-процесс получает апдейты (long polling или webhook) и через
+ShardRouter кладет каждый в очередь процесса-воркера с номером
+id чата % число воркеров. Воркер читает свою очередь по порядку и
+передает апдейты своему пулу UpdateWorkers (см. telegram.webhook),
+поэтому апдейты одного чата обрабатываются одним процессом и по очереди,
+а разные чаты — на разных ядрах.
+
+Общее состояние:
+  - FSM: ключ FSM содержит id чата, поэтому состояние чата живет в том
+    процессе, куда идут его апдейты; SQLStorage работает и без этого;
+  - наборы фильтров кнопок и кэш геокодера хранятся в базе;
+  - кэш поиска и индекс подписок — в памяти каждого процесса и
+    обновляются событиями telegram.events, которые воркеры пересылают
+    друг другу через отдельные неограниченные очереди.
+"""
+import asyncio
+import multiprocessing
+import queue
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramNetworkError
+
+from telegram import events
+from telegram.webhook import UpdateWorkers, update_chat_id
+
+
+# Сколько секунд поток чтения ждет очередь, прежде чем проверить, не
+# отменена ли задача.
+POLL_INTERVAL = 0.5
+
+
+class ShardRouter:
+    """
+    Распределяет апдейты по очередям процессов-воркеров. Совместим с
+    UpdateWorkers по submit и bot, поэтому подходит для create_app.
+
+    Параметры:
+      bot: бот фронт-процесса.
+      inboxes: очереди апдейтов воркеров (multiprocessing.Queue).
+    """
+
+    def __init__(self, bot: Bot, inboxes: Sequence) -> None:
+        self.bot = bot
+        self.inboxes = list(inboxes)
+        self.routed = [0] * len(self.inboxes)
+        self.rejected = 0
+
+    async def submit(
+        self,
+        update: types.Update,
+        timeout: Optional[float]
+    ) -> bool:
+        """
+        Кладет апдейт в очередь воркера его чата. Возвращает False, если
+        очередь не освободилась за timeout секунд.
+        """
+        shard = update_chat_id(update) % len(self.inboxes)
+        message = ("update", update.model_dump_json(
+            exclude_unset=True, by_alias=True))
+        try:
+            self.inboxes[shard].put_nowait(message)
+        except queue.Full:
+            try:
+                await asyncio.to_thread(
+                    self.inboxes[shard].put, message, True, timeout)
+            except queue.Full:
+                self.rejected += 1
+                return False
+        self.routed[shard] += 1
+        return True
+
+    def stats(self) -> dict:
+        return {"routed": list(self.routed), "rejected": self.rejected}
+
+
+async def _get(inbox) -> tuple:
+    while True:
+        try:
+            return await asyncio.to_thread(inbox.get, True, POLL_INTERVAL)
+        except queue.Empty:
+            continue
+
+
+async def receive_updates(inbox, workers: UpdateWorkers) -> None:
+    """
+    Передает апдейты из очереди воркера в пул workers по порядку до
+    сообщения «stop». Если пул занят, чтение очереди приостанавливается.
+    """
+    while True:
+        message = await _get(inbox)
+        if message[0] == "stop":
+            return
+        update = types.Update.model_validate_json(
+            message[1], context={"bot": workers.bot})
+        await workers.submit(update, None)
+
+
+async def receive_events(inbox) -> None:
+    """Выполняет события, присланные другими воркерами."""
+    while True:
+        _, name, args = await _get(inbox)
+        events.deliver(name, args)
+
+
+def start_shards(
+    count: int,
+    queue_size: int,
+    target: Callable
+) -> Tuple[list, list, list]:
+    """
+    Запускает count процессов-воркеров target(index, inbox, event_queues).
+
+    Возвращает:
+      Процессы, их очереди апдейтов (не длиннее queue_size) и очереди
+      событий.
+    """
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue(queue_size) for _ in range(count)]
+    event_queues = [context.Queue() for _ in range(count)]
+    processes = [
+        context.Process(
+            target=target, args=(index, inboxes[index], event_queues),
+            name=f"bot-shard-{index}")
+        for index in range(count)]
+    for process in processes:
+        process.start()
+    return processes, inboxes, event_queues
+
+
+async def stop_shards(
+    processes: List,
+    inboxes: List,
+    timeout: float = 30
+) -> None:
+    """
+    Отправляет воркерам «stop» после уже полученных апдейтов и ждет
+    их завершения; не успевшие за timeout секунд завершаются принудительно.
+    """
+    for inbox in inboxes:
+        try:
+            await asyncio.to_thread(inbox.put, ("stop",), True, timeout)
+        except queue.Full:
+            pass
+        inbox.cancel_join_thread()
+    for process in processes:
+        await asyncio.to_thread(process.join, timeout)
+        if process.is_alive():
+            print(f"{process.name} did not stop in time, terminating")
+            process.terminate()
+
+
+async def poll_updates(
+    bot: Bot,
+    router: ShardRouter,
+    allowed_updates: List[str],
+    enqueue_timeout: float
+) -> None:
+    """
+    Получает апдейты long polling'ом и передает их router. Пропущенные
+    за время простоя апдейты отбрасываются.
+    """
+    await bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except TelegramNetworkError as e:
+            print(f"Polling failed: {e!r}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            # В отличие от webhook, апдейт некому вернуть: ждем очередь.
+            while not await router.submit(update, enqueue_timeout):
+                print(f"Shard queues are full: {router.stats()}")
+            offset = update.update_id + 1
@@ -21,3 +21,73 @@ DATABASE_URL: str = (
 
 TELEGRAM_TOKEN = config("TELEGRAM_TOKEN")
 BOT_EMAIL = config("BOT_EMAIL", default="default@example.com")
+
+GEOCODE_CACHE_SIZE: int = config("GEOCODE_CACHE_SIZE", default=10000, cast=int)
+GEOCODE_CACHE_TTL: int = config(
+    "GEOCODE_CACHE_TTL", default=7 * 24 * 3600, cast=int)
+# Срок жизни пустого результата геокодирования: адрес могли ввести с
+# опечаткой или Nominatim мог временно его не найти.
+GEOCODE_NEGATIVE_TTL: int = config(
+    "GEOCODE_NEGATIVE_TTL", default=10 * 60, cast=int)
+
+NOMINATIM_URL: str = config(
+    "NOMINATIM_URL", default="https://nominatim.openstreetmap.org")
+NOMINATIM_RATE: float = config("NOMINATIM_RATE", default=1.0, cast=float)
+NOMINATIM_TIMEOUT: float = config("NOMINATIM_TIMEOUT", default=10, cast=float)
+NOMINATIM_RETRIES: int = config("NOMINATIM_RETRIES", default=3, cast=int)
+
+GAZETTEER_PATH: str = config("GAZETTEER_PATH", default="")
+
+SEARCH_CACHE_SIZE: int = config("SEARCH_CACHE_SIZE", default=1000, cast=int)
+SEARCH_CACHE_MAX_IDS: int = config(
+    "SEARCH_CACHE_MAX_IDS", default=1000, cast=int)
+SEARCH_CACHE_LISTINGS: int = config(
+    "SEARCH_CACHE_LISTINGS", default=5000, cast=int)
+
+RENDER_CONCURRENCY: int = config("RENDER_CONCURRENCY", default=8, cast=int)
+
+OUTBOUND_RATE: float = config("OUTBOUND_RATE", default=30.0, cast=float)
+OUTBOUND_CHAT_RATE: float = config(
+    "OUTBOUND_CHAT_RATE", default=1.0, cast=float)
+OUTBOUND_CHAT_BURST: int = config("OUTBOUND_CHAT_BURST", default=20, cast=int)
+OUTBOUND_RETRIES: int = config("OUTBOUND_RETRIES", default=3, cast=int)
+OUTBOUND_STATS_INTERVAL: float = config(
+    "OUTBOUND_STATS_INTERVAL", default=0, cast=float)
+LISTING_CARD_MODE: str = config("LISTING_CARD_MODE", default="compact")
+PAGINATION_MODE: str = config("PAGINATION_MODE", default="messages")
+
+FSM_STORAGE: str = config("FSM_STORAGE", default="memory")
+FSM_TTL: int = config("FSM_TTL", default=7 * 24 * 3600, cast=int)
+FSM_MEMORY_BUDGET: int = config(
+    "FSM_MEMORY_BUDGET", default=64 * 1024 * 1024, cast=int)
+FSM_IDLE_TTL: int = config("FSM_IDLE_TTL", default=24 * 3600, cast=int)
+FSM_STATS_INTERVAL: float = config("FSM_STATS_INTERVAL", default=0, cast=float)
+DB_STATS_INTERVAL: float = config("DB_STATS_INTERVAL", default=0, cast=float)
+
+# Наибольшее расстояние Хэмминга между dHash почти одинаковых фотографий.
+PHOTO_HASH_DISTANCE: int = config("PHOTO_HASH_DISTANCE", default=4, cast=int)
+
+# Сколько строк файла массового импорта можно геокодировать: Nominatim
+# отвечает не чаще NOMINATIM_RATE раз в секунду.
+IMPORT_MAX_GEOCODED: int = config(
+    "IMPORT_MAX_GEOCODED", default=200, cast=int)
+
+# Сколько секунд ждать следующую фотографию альбома перед его сохранением.
+MEDIA_GROUP_DELAY: float = config(
+    "MEDIA_GROUP_DELAY", default=0.5, cast=float)
+
+WEBHOOK_URL: str = config("WEBHOOK_URL", default="")
+WEBHOOK_PATH: str = config("WEBHOOK_PATH", default="/webhook")
+WEBHOOK_SECRET: str = config("WEBHOOK_SECRET", default="")
+WEBHOOK_HOST: str = config("WEBHOOK_HOST", default="0.0.0.0")
+WEBHOOK_PORT: int = config("WEBHOOK_PORT", default=8080, cast=int)
+WEBHOOK_WORKERS: int = config("WEBHOOK_WORKERS", default=16, cast=int)
+WEBHOOK_QUEUE_SIZE: int = config("WEBHOOK_QUEUE_SIZE", default=100, cast=int)
+WEBHOOK_ENQUEUE_TIMEOUT: float = config(
+    "WEBHOOK_ENQUEUE_TIMEOUT", default=1.0, cast=float)
+
+# Число процессов-воркеров в многопроцессном режиме (0 — по числу ядер)
+# и длина очереди апдейтов каждого из них. Внутри процесса апдейты
+# обрабатывает пул из WEBHOOK_WORKERS задач.
+CLUSTER_PROCESSES: int = config("CLUSTER_PROCESSES", default=0, cast=int)
+CLUSTER_QUEUE_SIZE: int = config("CLUSTER_QUEUE_SIZE", default=1000, cast=int)
@@ -0,0 +1,63 @@
+"""
+События между процессами бота.
+
+В многопроцессном режиме (см. telegram.cluster) у каждого процесса-
+воркера свои кэши и индексы в памяти. Изменение, после которого их
+нужно обновить в других процессах, рассылается событием: emit() отправляет
+его остальным воркерам, а там вызывается обработчик, зарегистрированный
+через on(). В однопроцессном режиме emit() ничего не делает, и модули
+вызывают у себя то же, что и обработчик.
+
+Здесь же хранится номер шарда процесса: owns() сообщает, обрабатывает
+ли этот процесс апдейты чата.
+"""
+from typing import Any, Callable, Dict, List
+
+
+_handlers: Dict[str, Callable[..., Any]] = {}
+# Входящие очереди остальных воркеров (multiprocessing.Queue).
+_peers: List[Any] = []
+shard_index = 0
+shard_count = 1
+
+
+def on(name: str, handler: Callable[..., Any]) -> None:
+    """Регистрирует обработчик события name из других процессов."""
+    _handlers[name] = handler
+
+
+def connect(index: int, count: int, peers: List[Any]) -> None:
+    """
+    Настраивает процесс-воркер: его номер, число воркеров и входящие
+    очереди остальных воркеров.
+    """
+    global shard_index, shard_count
+    shard_index, shard_count = index, count
+    _peers[:] = peers
+
+
+def shard_of(chat_id) -> int:
+    """Номер воркера, который обрабатывает апдейты чата chat_id."""
+    return int(chat_id) % shard_count
+
+
+def owns(chat_id) -> bool:
+    return shard_of(chat_id) == shard_index
+
+
+def emit(name: str, *args: Any) -> None:
+    """Отправляет событие остальным воркерам (аргументы — pickle)."""
+    for queue in _peers:
+        queue.put(("event", name, args))
+
+
+def deliver(name: str, args: tuple) -> None:
+    """Вызывает обработчик события, пришедшего из другого процесса."""
+    handler = _handlers.get(name)
+    if handler is None:
+        print(f"No handler for event {name}")
+        return
+    try:
+        handler(*args)
+    except Exception as e:
+        print(f"Event {name} failed: {e!r}")
@@ -0,0 +1,426 @@
+"""
+Хранилища состояний FSM: в базе данных и ограниченное в памяти.
+
+SQLStorage хранит состояние и данные каждого ключа FSM одной строкой
+таблицы fsm_states, поэтому черновики объявлений и поиски переживают
+перезапуск, а несколько процессов бота видят одно и то же состояние.
+Данные сериализуются в компактный JSON и при размере больше
+COMPRESS_THRESHOLD сжимаются zlib; у каждой строки есть срок жизни.
+
+Чтобы обработка одного апдейта стоила одного чтения и одной записи,
+FSMSnapshotMiddleware открывает на время апдейта снимок: первое
+обращение к ключу загружает состояние и данные одним запросом, все
+последующие чтения идут из снимка, а изменения записываются одним
+upsert после успешного обработчика. Если тот же ключ за это время
+записали (параллельный апдейт того же чата, альбом), изменения снимка
+сливаются с записанным по полям, а не затирают его.
+
+BoundedMemoryStorage — замена MemoryStorage для одного процесса: записи
+хранятся в том же упакованном виде, неактивные дольше idle_ttl удаляются,
+а при превышении бюджета памяти вытесняются давно не использованные.
+"""
+import asyncio
+import datetime
+import json
+import sys
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from telegram.config import FSM_IDLE_TTL, FSM_MEMORY_BUDGET, FSM_TTL
+from telegram_db.db import upsert
+from telegram_db.models import FSMRecord
+
+
+COMPRESS_THRESHOLD = 256
+# Примерные накладные расходы на запись BoundedMemoryStorage: ключ,
+# кортеж записи и узел OrderedDict.
+ENTRY_OVERHEAD = 400
+
+_RAW, _ZLIB = b"j", b"z"
+
+# Снимок текущего апдейта: ключ → _Entry.
+_snapshot: ContextVar[Optional[Dict[str, "_Entry"]]] = ContextVar(
+    "fsm_snapshot", default=None)
+
+
+def pack_data(data: Mapping[str, Any]) -> Optional[bytes]:
+    """Сериализует данные FSM: JSON, сжатый zlib, если он большой."""
+    if not data:
+        return None
+    raw = json.dumps(
+        data, ensure_ascii=False, separators=(",", ":")).encode()
+    if len(raw) > COMPRESS_THRESHOLD:
+        return _ZLIB + zlib.compress(raw)
+    return _RAW + raw
+
+
+def unpack_data(blob: Optional[bytes]) -> dict:
+    if not blob:
+        return {}
+    raw = blob[1:]
+    if blob[:1] == _ZLIB:
+        raw = zlib.decompress(raw)
+    return json.loads(raw)
+
+
+def _storage_key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id,
+        key.business_connection_id, key.destiny))
+
+
+class _KeyGuard:
+    """Блокировка записи ключа и номер последней записи этим процессом."""
+    __slots__ = ("lock", "version", "__weakref__")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.version = 0
+
+
+class _Entry:
+    """Ключ в снимке: текущие и загруженные состояние и данные."""
+    __slots__ = (
+        "state", "data", "dirty", "guard", "version", "loaded_state",
+        "loaded_blob")
+
+    def __init__(
+        self,
+        guard: _KeyGuard,
+        state: Optional[str],
+        blob: Optional[bytes]
+    ) -> None:
+        self.guard = guard
+        self.version = guard.version
+        self.state = self.loaded_state = state
+        self.data = unpack_data(blob)
+        self.loaded_blob = blob
+        self.dirty = False
+
+    def merge(self, state: Optional[str], data: dict) -> tuple:
+        """
+        Накладывает изменения снимка на состояние и данные, записанные
+        после его загрузки: измененные и удаленные обработчиком поля
+        берутся из снимка, остальные — из записанных.
+        """
+        loaded = unpack_data(self.loaded_blob)
+        if self.state != self.loaded_state:
+            state = self.state
+        merged = {field: value for field, value in data.items()
+                  if field in self.data or field not in loaded}
+        merged.update({field: value for field, value in self.data.items()
+                       if field not in loaded or loaded[field] != value})
+        return state, merged
+
+
+class SQLStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_states.
+
+    Записи одного ключа этим процессом выполняются под общей
+    блокировкой. Снимок, загруженный до чужой записи того же ключа
+    (например, отложенного обработчика альбома или параллельного апдейта
+    того же чата при polling), при сохранении сливается с ней, а не
+    затирает ее. Апдейты чата всегда приходят в один процесс (см.
+    telegram.cluster), поэтому блокировки в памяти процесса достаточно.
+
+    Параметры:
+      session_factory: фабрика асинхронных сессий SQLAlchemy.
+      ttl: срок жизни записи в секундах с последнего изменения.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        ttl: int = FSM_TTL
+    ) -> None:
+        self.session_factory = session_factory
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.reads = 0
+        self.writes = 0
+        self.merges = 0
+        self._guards = weakref.WeakValueDictionary()
+
+    def _guard(self, key: str) -> _KeyGuard:
+        guard = self._guards.get(key)
+        if guard is None:
+            guard = self._guards[key] = _KeyGuard()
+        return guard
+
+    async def _load(self, key: str) -> tuple:
+        self.reads += 1
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(FSMRecord.state, FSMRecord.data).where(
+                    FSMRecord.key == key,
+                    FSMRecord.expires_at > datetime.datetime.utcnow()))
+            row = result.first()
+        if row is None:
+            return None, None
+        return row.state, row.data
+
+    async def _save(self, key: str, state: Optional[str], data: dict):
+        self.writes += 1
+        async with self.session_factory() as session:
+            if state is None and not data:
+                await session.execute(
+                    delete(FSMRecord).where(FSMRecord.key == key))
+            else:
+                await session.execute(upsert(
+                    session.bind.dialect.name,
+                    FSMRecord.__table__,
+                    {
+                        "key": key,
+                        "state": state,
+                        "data": pack_data(data),
+                        "expires_at": datetime.datetime.utcnow() + self.ttl,
+                    },
+                    index_elements=["key"]
+                ))
+            await session.commit()
+        self._guard(key).version += 1
+
+    async def _entry(self, key: str) -> _Entry:
+        snapshot = _snapshot.get()
+        entry = snapshot.get(key) if snapshot is not None else None
+        if entry is None:
+            guard = self._guard(key)
+            entry = _Entry(guard, *await self._load(key))
+            if snapshot is not None:
+                snapshot[key] = entry
+        return entry
+
+    async def _change(
+        self,
+        key: str,
+        state: StateType = ...,
+        data: Optional[Mapping[str, Any]] = None,
+        update: bool = False
+    ) -> dict:
+        """
+        Меняет состояние (если state передан) и данные ключа: в снимке —
+        до конца апдейта, без снимка — сразу, под блокировкой ключа.
+        """
+        if isinstance(state, State):
+            state = state.state
+        snapshot = _snapshot.get()
+        if snapshot is not None:
+            entry = await self._entry(key)
+            self._apply(entry, state, data, update)
+            return dict(entry.data)
+        guard = self._guard(key)
+        async with guard.lock:
+            entry = await self._entry(key)
+            self._apply(entry, state, data, update)
+            await self._save(key, entry.state, entry.data)
+        return dict(entry.data)
+
+    @staticmethod
+    def _apply(entry: _Entry, state, data, update: bool) -> None:
+        if state is not ...:
+            entry.state = state
+        if data is not None:
+            entry.data = {**entry.data, **data} if update else dict(data)
+        entry.dirty = True
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(_storage_key(key))).state
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._entry(_storage_key(key))).data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None):
+        await self._change(_storage_key(key), state=state)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]):
+        await self._change(_storage_key(key), data=data)
+
+    async def update_data(
+        self,
+        key: StorageKey,
+        data: Mapping[str, Any]
+    ) -> Dict[str, Any]:
+        return await self._change(_storage_key(key), data=data, update=True)
+
+    async def flush(self, snapshot: Dict[str, _Entry]) -> None:
+        """
+        Записывает измененные в снимке ключи. Если ключ записали после
+        загрузки снимка, изменения снимка сливаются с записанным;
+        очистка состояния (clear) применяется целиком.
+        """
+        for key, entry in snapshot.items():
+            if not entry.dirty:
+                continue
+            async with entry.guard.lock:
+                state, data = entry.state, entry.data
+                if (entry.guard.version != entry.version
+                        and (state is not None or data)):
+                    self.merges += 1
+                    current_state, blob = await self._load(key)
+                    state, data = entry.merge(
+                        current_state, unpack_data(blob))
+                await self._save(key, state, data)
+
+    async def purge_expired(self) -> int:
+        """Удаляет записи с истекшим сроком жизни и возвращает их число."""
+        async with self.session_factory() as session:
+            result = await session.execute(delete(FSMRecord).where(
+                FSMRecord.expires_at <= datetime.datetime.utcnow()))
+            await session.commit()
+            return result.rowcount
+
+    def stats(self) -> dict:
+        return {"reads": self.reads, "writes": self.writes,
+                "merges": self.merges}
+
+    async def close(self) -> None:
+        pass
+
+
+def refresh_snapshot() -> None:
+    """
+    Забывает неизмененные ключи снимка текущего апдейта, чтобы следующее
+    чтение загрузило их заново. Нужно обработчику, который ждал, пока
+    состояние чата меняли вне апдейта (см. telegram.media_groups).
+    """
+    snapshot = _snapshot.get()
+    if snapshot is not None:
+        for key in [key for key, entry in snapshot.items()
+                    if not entry.dirty]:
+            del snapshot[key]
+
+
+class FSMSnapshotMiddleware(BaseMiddleware):
+    """
+    Outer middleware апдейтов: на время обработки апдейта включает
+    снимок состояний SQLStorage и записывает изменения после нее. Если
+    обработчик завершился ошибкой, изменения не записываются.
+    Регистрируется раньше FSMContextMiddleware (см. telegram.main).
+    """
+
+    def __init__(self, storage: SQLStorage) -> None:
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        snapshot: Dict[str, _Entry] = {}
+        token = _snapshot.set(snapshot)
+        try:
+            result = await handler(event, data)
+        finally:
+            _snapshot.reset(token)
+        await self.storage.flush(snapshot)
+        return result
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    Хранилище FSM в памяти процесса с бюджетом памяти, сроком жизни
+    неактивных записей и вытеснением давно не использованных (LRU).
+
+    Параметры:
+      memory_budget: примерный предел памяти под записи в байтах.
+      idle_ttl: через сколько секунд без обращений запись удаляется.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = FSM_MEMORY_BUDGET,
+        idle_ttl: float = FSM_IDLE_TTL
+    ) -> None:
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self.memory = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Ключ → (состояние, упакованные данные, время последнего обращения).
+        self._records: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _size(record: tuple) -> int:
+        state, blob, _ = record
+        return (ENTRY_OVERHEAD + (len(blob) if blob else 0)
+                + (sys.getsizeof(state) if state else 0))
+
+    def _pop(self, key: StorageKey) -> None:
+        record = self._records.pop(key, None)
+        if record is not None:
+            self.memory -= self._size(record)
+
+    def _expire(self) -> None:
+        # Записи упорядочены по последнему обращению: истекшие — в начале.
+        deadline = time.monotonic() - self.idle_ttl
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record[2] > deadline:
+                break
+            self._pop(key)
+            self.expirations += 1
+
+    def _get(self, key: StorageKey) -> tuple:
+        self._expire()
+        record = self._records.get(key)
+        if record is None:
+            return None, None
+        self._records[key] = (record[0], record[1], time.monotonic())
+        self._records.move_to_end(key)
+        return record[0], record[1]
+
+    def _put(
+        self,
+        key: StorageKey,
+        state: Optional[str],
+        blob: Optional[bytes]
+    ) -> None:
+        self._pop(key)
+        if state is None and not blob:
+            return
+        record = (state, blob, time.monotonic())
+        self._records[key] = record
+        self.memory += self._size(record)
+        while self.memory > self.memory_budget and len(self._records) > 1:
+            self._pop(next(iter(self._records)))
+            self.evictions += 1
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._get(key)[0]
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return unpack_data(self._get(key)[1])
+
+    async def set_state(self, key: StorageKey, state: StateType = None):
+        if isinstance(state, State):
+            state = state.state
+        self._put(key, state, self._get(key)[1])
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]):
+        self._put(key, self._get(key)[0], pack_data(data))
+
+    def stats(self) -> dict:
+        """Число записей, примерный объем памяти и счетчики удалений."""
+        self._expire()
+        return {
+            "entries": len(self._records),
+            "memory": self.memory,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    async def close(self) -> None:
+        self._records.clear()
+        self.memory = 0
@@ -0,0 +1,173 @@
+"""
+Локальный справочник адресов (газеттир) для геокодирования без сети.
+
+Справочник загружается из CSV с колонками ``city``, ``road``,
+``house_number`` и необязательными ``region``, ``lat`` и ``lon``.
+Улицы хранятся в отсортированном массиве нормализованных названий,
+поэтому поиск по префиксу названия — это бинарный поиск, а дома
+улицы — словарь по нормализованному номеру.
+"""
+import bisect
+import csv
+import re
+from typing import Dict, List, Optional
+
+
+_PUNCTUATION_RE = re.compile(r"[^\w]+")
+_HOUSE_NUMBER_RE = re.compile(r"^\d+[\w/]*$")
+
+# Типы улиц не участвуют в сравнении: «ул. Тверская» и «Тверская улица»
+# считаются одной улицей.
+STREET_TYPES = frozenset({
+    "ул", "улица", "пр", "просп", "проспект", "пер", "переулок", "пл",
+    "площадь", "бул", "бульвар", "ш", "шоссе", "наб", "набережная",
+    "проезд", "туп", "тупик", "д", "дом",
+})
+
+
+def normalize_query(address: str) -> str:
+    """
+    Приводит адрес к виду для сравнения: нижний регистр, «ё» заменена
+    на «е», пунктуация и лишние пробелы убраны.
+    """
+    address = address.lower().replace("ё", "е")
+    return " ".join(_PUNCTUATION_RE.sub(" ", address).split())
+
+
+def _street_key(road: str) -> str:
+    return " ".join(
+        token for token in normalize_query(road).split()
+        if token not in STREET_TYPES)
+
+
+class Gazetteer:
+    """
+    Индекс адресов город → улица → дом с поиском улицы по префиксу.
+    """
+
+    def __init__(self) -> None:
+        self._cities: Dict[str, int] = {}
+        self._city_names: List[str] = []
+        self._max_city_words = 0
+        self._street_index: Dict[tuple, int] = {}
+        # Отсортированные ключи (название улицы, id города, id улицы).
+        self._street_keys: List[tuple] = []
+        self._streets: List[tuple] = []
+        self._houses: List[Dict[str, tuple]] = []
+
+    def __len__(self) -> int:
+        return sum(len(houses) for houses in self._houses)
+
+    def add(
+        self,
+        city: str,
+        road: str,
+        house_number: str,
+        region: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None
+    ) -> None:
+        """
+        Добавляет дом в справочник. После добавления всех домов нужно
+        вызвать build().
+        """
+        city_key = normalize_query(city)
+        city_id = self._cities.get(city_key)
+        if city_id is None:
+            city_id = self._cities[city_key] = len(self._city_names)
+            self._city_names.append(city)
+            self._max_city_words = max(
+                self._max_city_words, len(city_key.split()))
+
+        key = (_street_key(road), city_id)
+        street_id = self._street_index.get(key)
+        if street_id is None:
+            street_id = self._street_index[key] = len(self._streets)
+            self._streets.append((road, region or "Не указан", city_id))
+            self._houses.append({})
+        self._houses[street_id][normalize_query(house_number)] = (
+            house_number, lat, lon)
+
+    def build(self) -> None:
+        """Сортирует индекс улиц для поиска по префиксу."""
+        self._street_keys = sorted(
+            (name, city_id, street_id)
+            for (name, city_id), street_id in self._street_index.items())
+
+    def load_csv(self, path: str) -> int:
+        """
+        Загружает справочник из CSV-файла и возвращает число домов.
+        """
+        with open(path, encoding="utf-8", newline="") as file:
+            for row in csv.DictReader(file):
+                self.add(
+                    row["city"], row["road"], row["house_number"],
+                    row.get("region"),
+                    float(row["lat"]) if row.get("lat") else None,
+                    float(row["lon"]) if row.get("lon") else None)
+        self.build()
+        return len(self)
+
+    def _find_city(self, tokens: List[str]) -> tuple:
+        """
+        Ищет в токенах запроса название города. Возвращает id города и
+        оставшиеся токены.
+        """
+        for size in range(min(self._max_city_words, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                city_id = self._cities.get(
+                    " ".join(tokens[start:start + size]))
+                if city_id is not None:
+                    return city_id, tokens[:start] + tokens[start + size:]
+        return None, tokens
+
+    def _streets_with_prefix(self, prefix: str):
+        position = bisect.bisect_left(self._street_keys, (prefix,))
+        while position < len(self._street_keys):
+            name, city_id, street_id = self._street_keys[position]
+            if not name.startswith(prefix):
+                break
+            yield city_id, street_id
+            position += 1
+
+    def search(
+        self,
+        address: str,
+        limit: int = 5
+    ) -> List[Dict[str, Optional[str]]]:
+        """
+        Ищет адрес в справочнике и возвращает до limit вариантов в том же
+        виде, что и geocode_address. Улица сравнивается по префиксу
+        названия, город и номер дома — точно.
+        """
+        tokens = normalize_query(address).split()
+        city_id, tokens = self._find_city(tokens)
+        house_tokens = [t for t in tokens if _HOUSE_NUMBER_RE.match(t)]
+        street = " ".join(
+            t for t in tokens
+            if t not in STREET_TYPES and t not in house_tokens)
+        if not street or not house_tokens:
+            return []
+        house_key = house_tokens[-1]
+
+        addresses = []
+        for street_city_id, street_id in self._streets_with_prefix(street):
+            if city_id is not None and street_city_id != city_id:
+                continue
+            house = self._houses[street_id].get(house_key)
+            if house is None:
+                continue
+            road, region, _ = self._streets[street_id]
+            city = self._city_names[street_city_id]
+            addresses.append({
+                "house_number": house[0],
+                "road": road,
+                "region": region,
+                "city": city,
+                "display_name": f"{house[0]}, {road}, {region}, {city}",
+                "lat": house[1],
+                "lon": house[2],
+            })
+            if len(addresses) >= limit:
+                break
+        return addresses
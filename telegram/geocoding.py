@@ -1,42 +1,231 @@
+import asyncio
+import datetime
 from typing import List, Dict, Optional
 
 import aiohttp
 
-from telegram.config import BOT_EMAIL
+from telegram.cache import TTLCache
+from telegram.config import (
+    BOT_EMAIL, GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL, GEOCODE_NEGATIVE_TTL,
+    NOMINATIM_RATE, NOMINATIM_RETRIES, NOMINATIM_TIMEOUT, NOMINATIM_URL)
+from telegram.gazetteer import Gazetteer, normalize_query
+from telegram.ratelimit import TokenBucket
+from telegram_db.crud import get_cached_geocode, save_cached_geocode
+from telegram_db.db import AsyncSessionLocal
+
+
+_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL)
+_stats = {"gazetteer_hits": 0, "memory_hits": 0, "db_hits": 0, "misses": 0}
+
+gazetteer = Gazetteer()
+
+
+def geocode_stats() -> Dict[str, int]:
+    """
+    Возвращает счетчики геокодирования: попадания в локальный справочник,
+    в кэш в памяти, в базу и промахи (запросы к Nominatim).
+    """
+    return {**_stats, "memory_size": len(_cache)}
+
+
+def _cache_addresses(query: str, addresses: list) -> None:
+    _cache.set(query, addresses,
+               ttl=None if addresses else GEOCODE_NEGATIVE_TTL)
 
 
 async def geocode_address(address: str) -> List[Dict[str, Optional[str]]]:
     """
     Геокодирует адрес и возвращает до 5 вариантов адресов с городами.
+    Сначала адрес ищется в локальном справочнике, повторные запросы
+    обслуживаются из кэша в памяти или из базы; Nominatim вызывается
+    только при промахе. Пустой результат кэшируется только на
+    GEOCODE_NEGATIVE_TTL секунд. Если Nominatim недоступен, выбрасывает
+    GeocodingError; такой результат не кэшируется.
+    """
+    addresses = gazetteer.search(address)
+    if addresses:
+        _stats["gazetteer_hits"] += 1
+        return addresses
+
+    query = normalize_query(address)
+    addresses = _cache.get(query)
+    if addresses is not None:
+        _stats["memory_hits"] += 1
+        return addresses
+
+    # Кэш читается и пишется короткими отдельными сессиями, чтобы не
+    # занимать соединение на время запроса к Nominatim.
+    async with AsyncSessionLocal() as session:
+        addresses = await get_cached_geocode(
+            session, query, datetime.timedelta(seconds=GEOCODE_CACHE_TTL),
+            datetime.timedelta(seconds=GEOCODE_NEGATIVE_TTL))
+    if addresses is not None:
+        _stats["db_hits"] += 1
+        _cache_addresses(query, addresses)
+        return addresses
+
+    _stats["misses"] += 1
+    addresses = await nominatim.search(address)
+    _cache_addresses(query, addresses)
+    async with AsyncSessionLocal() as session:
+        await save_cached_geocode(session, query, addresses)
+        await session.commit()
+    return addresses
+
+
+class GeocodingError(Exception):
+    """Сервис геокодирования недоступен или ответил ошибкой."""
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_nominatim(result: list) -> List[Dict[str, Optional[str]]]:
+    """
+    Отбирает из ответа Nominatim адреса с номером дома, улицей и городом.
+    Координаты дома возвращаются в ключах lat и lon.
+    """
+    addresses = []
+
+    for location in result:
+        addr = location.get("address", {})
+        house_number = addr.get("house_number")
+        road = (addr.get("road") or addr.get("pedestrian") or
+                addr.get("path"))
+        city = (addr.get("city") or addr.get("town") or
+                addr.get("village"))
+        region = (addr.get("county") or addr.get("state_district") or
+                  addr.get("state"))
+
+        if house_number and road and city:
+            addresses.append({
+                "house_number": house_number,
+                "road": road,
+                "region": region if region else "Не указан",
+                "city": city,
+                "display_name": location["display_name"],
+                "lat": _to_float(location.get("lat")),
+                "lon": _to_float(location.get("lon"))
+            })
+
+    return addresses
+
+
+class NominatimClient:
+    """
+    Долгоживущий клиент Nominatim.
+
+    Держит одну aiohttp-сессию с пулом keep-alive соединений, объединяет
+    одинаковые одновременные запросы в один (single-flight) и ставит
+    запросы в очередь так, чтобы не превышать rate запросов в секунду
+    (политика Nominatim — 1 запрос в секунду). Ошибки сети, 429 и 5xx
+    повторяются не более retries раз с экспоненциальной паузой.
     """
-    url = ("https://nominatim.openstreetmap.org/"
-           f"search?q={address}&format=json&addressdetails=1&limit=5")
-    headers = {
-        "User-Agent": f"Botinok19_bot/1.0 ({BOT_EMAIL})"
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            result = await response.json()
-            addresses = []
-
-            for location in result:
-                addr = location.get("address", {})
-                house_number = addr.get("house_number")
-                road = (addr.get("road") or addr.get("pedestrian") or
-                        addr.get("path"))
-                city = (addr.get("city") or addr.get("town") or
-                        addr.get("village"))
-                region = (addr.get("county") or addr.get("state_district") or
-                          addr.get("state"))
-
-                if house_number and road and city:
-                    addresses.append({
-                        "house_number": house_number,
-                        "road": road,
-                        "region": region if region else "Не указан",
-                        "city": city,
-                        "display_name": location["display_name"]
-                    })
 
+    def __init__(
+        self,
+        base_url: str,
+        user_agent: str,
+        rate: float = 1.0,
+        timeout: float = 10,
+        retries: int = 3
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.retries = retries
+        self.limiter = TokenBucket(rate)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def start(self) -> None:
+        """Открывает сессию, если она еще не открыта."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=4, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": self.user_agent},
+            )
+
+    async def close(self) -> None:
+        """Закрывает сессию и ее соединения."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def search(self, address: str) -> List[Dict[str, Optional[str]]]:
+        """
+        Геокодирует адрес. Если такой же (после нормализации) запрос уже
+        выполняется, дожидается его результата вместо нового запроса.
+        Если первый вызов отменен, ожидающие его получают GeocodingError,
+        а не отмену чужой задачи.
+        """
+        key = normalize_query(address)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            addresses = await self._request(address)
+        except asyncio.CancelledError:
+            self._fail(future, GeocodingError("Запрос к Nominatim отменен"))
+            raise
+        except Exception as e:
+            self._fail(future, e)
+            raise
+        else:
+            future.set_result(addresses)
             return addresses
+        finally:
+            del self._inflight[key]
+
+    @staticmethod
+    def _fail(future: asyncio.Future, error: Exception) -> None:
+        future.set_exception(error)
+        # Помечаем исключение полученным: без ожидающих его никто не
+        # заберет, а первому вызову оно пробрасывается и так.
+        future.exception()
+
+    async def _request(self, address: str) -> List[Dict[str, Optional[str]]]:
+        await self.start()
+        params = {
+            "q": address,
+            "format": "json",
+            "addressdetails": 1,
+            "limit": 5,
+        }
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with self._session.get(
+                    f"{self.base_url}/search", params=params
+                ) as response:
+                    if response.status == 429 or response.status >= 500:
+                        error = GeocodingError(
+                            f"Nominatim ответил {response.status}")
+                    elif response.status >= 400:
+                        raise GeocodingError(
+                            f"Nominatim ответил {response.status}")
+                    else:
+                        return parse_nominatim(await response.json())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = GeocodingError(f"Nominatim недоступен: {e!r}")
+            if attempt < self.retries:
+                await asyncio.sleep(2 ** attempt)
+        raise error
+
+
+nominatim = NominatimClient(
+    NOMINATIM_URL,
+    user_agent=f"Botinok19_bot/1.0 ({BOT_EMAIL})",
+    rate=NOMINATIM_RATE,
+    timeout=NOMINATIM_TIMEOUT,
+    retries=NOMINATIM_RETRIES,
+)
@@ -1,11 +1,14 @@
-from aiogram import Router, types
+from aiogram import F, Router, types
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from telegram_db.crud import create_apartment
+from telegram_db.crud import create_apartment, find_duplicate
+from telegram_db.db import after_commit
 from telegram.states import Form
-from telegram.geocoding import geocode_address
+from telegram.geocoding import GeocodingError, geocode_address
+from telegram.subscriptions import notifier
 
 
 router = Router()
@@ -18,7 +21,13 @@ async def process_address(message: types.Message, state: FSMContext) -> None:
     возможность отправить на модерацию.
     """
     address = message.text
-    addresses = await geocode_address(address)
+    try:
+        addresses = await geocode_address(address)
+    except GeocodingError:
+        await message.reply(
+            "⚠️ Сервис поиска адресов временно недоступен. "
+            "Попробуйте отправить адрес ещё раз через минуту.")
+        return
 
     if not addresses:
         builder = InlineKeyboardBuilder()
@@ -79,18 +88,145 @@ async def show_address_options(
     await state.set_state(Form.confirm_address)
 
 
+@router.callback_query(
+    StateFilter(Form.confirm_address), F.data.contains("|"))
+async def choose_address(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession
+) -> None:
+    """Создает объявление с выбранным вариантом адреса."""
+    user_data = await state.get_data()
+    _, index = callback.data.split("|")
+    all_addresses = user_data.get("all_addresses", [])
+
+    try:
+        chosen_address = all_addresses[int(index)]
+    except (IndexError, ValueError):
+        await callback.answer(
+            "⚠️ Ошибка выбора варианта. Попробуйте снова.",
+            show_alert=True)
+        return
+
+    city = chosen_address["city"]
+    street = chosen_address["road"]
+    full_address = (
+        f"{chosen_address['road']}, {chosen_address['house_number']}, "
+        f"{chosen_address['region']}, {city}"
+    )
+
+    await state.update_data(
+        address=full_address,
+        city=city,
+        street=street,
+        latitude=chosen_address.get("lat"),
+        longitude=chosen_address.get("lon"))
+    user_data = await state.get_data()
+
+    duplicate_id = await find_duplicate(
+        session,
+        address=full_address,
+        price=user_data["price"],
+        rooms=user_data["rooms"],
+        storey=user_data["storey"],
+        photo_unique_ids=user_data.get("photo_unique_ids"),
+        photo_hashes=user_data.get("photo_hashes"))
+    if duplicate_id is not None:
+        await state.update_data(duplicate_id=duplicate_id)
+        builder = InlineKeyboardBuilder()
+        builder.button(
+            text="✅ Опубликовать всё равно", callback_data="dup_publish")
+        builder.button(text="✏️ Изменить", callback_data="dup_edit")
+        builder.adjust(1)
+        await callback.message.answer(
+            f"⚠️ Похожее объявление уже опубликовано (№{duplicate_id}): "
+            "совпадают адрес и цена или фотографии. Опубликовать ваше "
+            "объявление всё равно или изменить его?",
+            reply_markup=builder.as_markup())
+        await callback.answer()
+        return
+
+    await publish_draft(callback, state, session, user_data)
+
+
+@router.callback_query(
+    StateFilter(Form.confirm_address), F.data == "dup_publish")
+async def publish_duplicate(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession
+) -> None:
+    """Публикует объявление, похожее на уже опубликованное."""
+    user_data = await state.get_data()
+    if user_data.get("duplicate_id") is None:
+        await callback.answer("⚠️ Действие уже недоступно.", show_alert=True)
+        return
+    await publish_draft(callback, state, session, user_data)
+
+
+async def publish_draft(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user_data: dict
+) -> None:
+    """Создает объявление из данных состояния и очищает состояние."""
+    apartment = await create_apartment(
+        session,
+        owner_id=user_data["owner_id"],
+        city=user_data["city"],
+        street=user_data["street"],
+        address=user_data["address"],
+        price=user_data["price"],
+        storey=user_data["storey"],
+        rooms=user_data["rooms"],
+        description=user_data["description"],
+        photo_file_ids=user_data["photo_file_ids"],
+        latitude=user_data.get("latitude"),
+        longitude=user_data.get("longitude"),
+        photo_unique_ids=user_data.get("photo_unique_ids"),
+        photo_hashes=user_data.get("photo_hashes")
+    )
+
+    after_commit(session, notifier.publish, apartment)
+
+    await callback.message.answer(
+        f"✅ Вы выбрали адрес:\n\n"
+        f"Город: {user_data['city']}\nАдрес: {user_data['address']}"
+        "\n\n🎉 Объявление успешно создано!"
+    )
+    await state.clear()
+    await callback.answer()
+
+
 @router.callback_query(StateFilter(Form.confirm_address))
 async def confirm_address(
     callback: types.CallbackQuery,
     state: FSMContext
 ) -> None:
     """
-    Обработчик нажатий на кнопки выбора адреса и дополнительных действий.
+    Обработчик кнопок повтора ввода, отправки на модерацию, следующих
+    вариантов адреса и изменения повторного объявления. Выбор варианта
+    обрабатывает choose_address, публикацию повтора — publish_duplicate.
     """
     data = callback.data
     current_state = await state.get_state()
     user_data = await state.get_data()
 
+    if data == "dup_edit":
+        if user_data.get("duplicate_id") is None:
+            await callback.answer(
+                "⚠️ Действие уже недоступно.",
+                show_alert=True)
+            return
+        await state.update_data(duplicate_id=None, editing_draft=True)
+        await state.set_state(Form.basic)
+        await callback.message.answer(
+            "✏️ Отправьте данные объявления заново в формате: Цена, этаж, "
+            "количество комнат, описание. Загруженные фото сохранятся.")
+        await callback.answer()
+        return
+
     if data == "addr_retry":
         if current_state not in [
             Form.confirm_address.state,
@@ -138,51 +274,3 @@ async def confirm_address(
         await state.update_data(current_index=user_data["current_index"])
         await show_address_options(callback.message, state)
         await callback.answer()
-        return
-
-    if "|" in data:
-        if current_state != Form.confirm_address.state:
-            await callback.answer(
-                "⚠️ Действие уже не актуально.",
-                show_alert=True)
-            return
-
-        _, index = data.split("|")
-        all_addresses = user_data.get("all_addresses", [])
-
-        try:
-            chosen_address = all_addresses[int(index)]
-        except (IndexError, ValueError):
-            await callback.answer(
-                "⚠️ Ошибка выбора варианта. Попробуйте снова.",
-                show_alert=True)
-            return
-
-        city = chosen_address["city"]
-        street = chosen_address["road"]
-        full_address = (
-            f"{chosen_address['road']}, {chosen_address['house_number']}, "
-            f"{chosen_address['region']}, {city}"
-        )
-
-        await state.update_data(address=full_address, city=city, street=street)
-
-        await create_apartment(
-                owner_id=user_data["owner_id"],
-                city=city,
-                street=street,
-                address=full_address,
-                price=user_data["price"],
-                storey=user_data["storey"],
-                rooms=user_data["rooms"],
-                description=user_data["description"],
-                photo_file_ids=user_data["photo_file_ids"]
-            )
-
-        await callback.message.answer(
-            f"✅ Вы выбрали адрес:\n\n"
-            f"Город: {city}\nАдрес: {full_address}"
-            "\n\n🎉 Объявление успешно создано!"
-        )
-        await state.clear()
-        await callback.answer()
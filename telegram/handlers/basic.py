@@ -10,31 +10,44 @@ from telegram.states import Form
 router = Router()
 
 
-def validate_basic_data(text: str) -> Tuple[float, str, int]:
+def validate_basic_data(text: str) -> Tuple[float, float, int, str]:
     """
     Парсит строку с базовыми данными в формате:
       "Цена, этаж, количество комнат, описание."
-    и возвращает кортеж (price, description, rooms).
+    и возвращает кортеж (price, storey, rooms, description).
     Выбрасывает ValueError, если формат неверный.
     """
     parts = [x.strip() for x in text.split(',', 3)]
     if len(parts) != 4:
         raise ValueError(
             "Ожидается 4 параметра: Цена, этаж, количество комнат, описание.")
+    return validate_basic_fields(*parts)
+
+
+def validate_basic_fields(
+    price: str,
+    storey: str,
+    rooms: str,
+    description: str
+) -> Tuple[float, float, int, str]:
+    """
+    Проверяет и преобразует базовые данные объявления по отдельности
+    (их же проверяет массовый импорт, см. telegram.listing_import).
+    Выбрасывает ValueError, если значение неверное.
+    """
     try:
-        price = float(parts[0])
-    except ValueError:
+        price = float(price)
+    except (TypeError, ValueError):
         raise ValueError("Цена должна быть числом.")
     try:
-        storey = float(parts[1])
-    except ValueError:
-        raise ValueError("Цена должна быть числом.")
+        storey = float(storey)
+    except (TypeError, ValueError):
+        raise ValueError("Этаж должен быть числом.")
     try:
-        rooms = int(parts[2])
-    except ValueError:
+        rooms = int(rooms)
+    except (TypeError, ValueError):
         raise ValueError("Количество комнат должно быть целым числом.")
-    description = parts[3]
-    return price, storey, rooms, description,
+    return price, storey, rooms, (description or "").strip()
 
 
 @router.message(StateFilter(Form.basic))
@@ -42,22 +55,38 @@ async def process_basic_info(
     message: types.Message,
     state: FSMContext
 ) -> None:
-    """Обрабатывает базовые данные и переходит к загрузке фото."""
+    """
+    Обрабатывает базовые данные и переходит к загрузке фото. При
+    изменении черновика (см. telegram.handlers.address) уже загруженные
+    фото сохраняются.
+    """
     try:
         price, storey, rooms, description = validate_basic_data(message.text)
     except ValueError as e:
         await message.reply(f"Ошибка: {e}")
         return
 
-    await state.update_data(
+    data = await state.get_data()
+    editing = data.get("editing_draft", False)
+    photos = data.get("photo_file_ids", []) if editing else []
+    update = dict(
         price=price,
         storey=storey,
         rooms=rooms,
         description=description,
         owner_id=str(message.from_user.id),
-        photo_file_ids=[]
+        photo_file_ids=photos,
+        editing_draft=False
     )
+    if not editing:
+        update.update(photo_unique_ids=[], photo_hashes=[])
+    await state.update_data(**update)
     await state.set_state(Form.photos)
+    if photos:
+        await message.reply(
+            f"Данные обновлены, загружено фото: {len(photos)}. "
+            "Отправьте ещё или /done.")
+        return
     await message.reply(
         "Теперь отправьте минимум одно фото. "
         "После завершения введите - /done.")
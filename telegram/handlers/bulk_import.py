@@ -0,0 +1,111 @@
+import asyncio
+import time
+from typing import Dict
+
+from aiogram import Router, types, F
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.filters import Command, StateFilter
+
+from telegram.listing_import import import_listings
+from telegram.states import Form
+
+
+router = Router()
+
+# Bot API отдает ботам файлы не больше 20 МБ.
+MAX_FILE_SIZE = 20 * 1024 * 1024
+MAX_ERRORS_SHOWN = 20
+PROGRESS_INTERVAL = 2
+
+# Идущие импорты: Telegram ID пользователя → задача импорта.
+_imports: Dict[int, asyncio.Task] = {}
+
+
+@router.message(Command("import"))
+async def import_help(message: types.Message) -> None:
+    """Объясняет формат файла для массового импорта объявлений."""
+    await message.answer(
+        "📥 Массовый импорт объявлений\n\n"
+        "Отправьте файл CSV или JSON. Колонки (ключи): цена, этаж, "
+        "комнаты, описание, адрес — обязательно; город, улица, широта, "
+        "долгота, фото (file_id через «;») — по желанию. Город и "
+        "координаты, если их нет, определяются по адресу.\n\n"
+        "Пример CSV:\n"
+        "цена;этаж;комнаты;описание;адрес\n"
+        "35000;4;2;Светлая квартира;Москва, Тверская, 7")
+
+
+@router.message(
+    StateFilter(None, Form.search_filters),
+    F.document.file_name.lower().endswith((".csv", ".json"))
+)
+async def import_document(message: types.Message) -> None:
+    """
+    Запускает импорт объявлений из присланного файла в фоне и сразу
+    отвечает: геокодирование адресов может занять минуты, а обработчик
+    не должен держать апдейт. Итог приходит отдельным сообщением.
+    У пользователя идет не больше одного импорта.
+    """
+    document = message.document
+    if document.file_size and document.file_size > MAX_FILE_SIZE:
+        await message.reply("⚠️ Файл больше 20 МБ, разделите его на части.")
+        return
+    user_id = message.from_user.id
+    if user_id in _imports:
+        await message.reply(
+            "⏳ Предыдущий импорт еще идет, дождитесь его итога.")
+        return
+
+    status = await message.reply(
+        "⏳ Импорт запущен, пришлю итог, когда он закончится.")
+    task = asyncio.create_task(run_import(message, status))
+    _imports[user_id] = task
+    task.add_done_callback(lambda _: _imports.pop(user_id, None))
+
+
+async def run_import(message: types.Message, status: types.Message) -> None:
+    """
+    Импортирует файл сообщения, показывает прогресс в сообщении status
+    (не чаще раза в PROGRESS_INTERVAL секунд), затем удаляет его и
+    отвечает итогом.
+    """
+    document = message.document
+    last_update = 0.0
+
+    async def progress(done: int, total: int) -> None:
+        nonlocal last_update
+        if time.monotonic() - last_update < PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        try:
+            await status.edit_text(f"⏳ Обработано {done} из {total}...")
+        except TelegramBadRequest:
+            pass
+
+    try:
+        data = (await message.bot.download(document)).read()
+        result = await import_listings(
+            data, document.file_name, str(message.from_user.id),
+            progress=progress)
+    except (UnicodeDecodeError, ValueError) as e:
+        text = f"❌ Файл не импортирован: {e}"
+    except Exception as e:
+        print(f"Bulk import failed: {e!r}")
+        text = "❌ Импорт прерван из-за ошибки, попробуйте позже."
+    else:
+        text = (
+            f"✅ Импортировано {result.inserted} из {result.total} "
+            f"объявлений за {result.seconds:.1f} с "
+            f"({result.rows_per_second:.0f} строк/с)."
+        )
+        if result.errors:
+            text += f"\n\n⚠️ Пропущено строк: {len(result.errors)}\n"
+            text += "\n".join(
+                f"Строка {number}: {error}"
+                for number, error in result.errors[:MAX_ERRORS_SHOWN])
+
+    try:
+        await status.delete()
+    except TelegramAPIError:
+        pass
+    await message.reply(text)
@@ -0,0 +1,47 @@
+from aiogram import Router, types
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from telegram_db.crud import get_apartment_photo_ids
+from telegram.callbacks import MorePhotos
+from telegram.rendering import send_albums
+
+
+router = Router()
+
+
+@router.callback_query(MorePhotos.filter())
+async def more_photos_callback(
+    callback: types.CallbackQuery,
+    callback_data: MorePhotos,
+    session: AsyncSession
+) -> None:
+    """
+    Досылает остальные фотографии карточки, показанной с одной первой
+    фотографией, и убирает кнопку «Ещё фото».
+    """
+    photo_ids = await get_apartment_photo_ids(
+        session, callback_data.id, str(callback.from_user.id))
+    if not photo_ids:
+        await callback.answer(
+            "⚠️ Объявление снято с публикации.", show_alert=True)
+        return
+    if len(photo_ids) == 1:
+        await callback.answer("⚠️ Других фотографий нет.", show_alert=True)
+        return
+    await callback.answer()
+
+    await send_albums(callback.bot, callback.message.chat.id, photo_ids[1:])
+
+    markup = callback.message.reply_markup
+    if markup is not None:
+        builder = InlineKeyboardBuilder()
+        for row in markup.inline_keyboard:
+            buttons = [
+                button for button in row
+                if button.callback_data != callback.data
+            ]
+            if buttons:
+                builder.row(*buttons)
+        await callback.message.edit_reply_markup(
+            reply_markup=builder.as_markup())
@@ -1,8 +1,16 @@
+import asyncio
+from typing import List, Optional
+
 from aiogram import Router, types
+from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 
+from telegram.fsm_storage import refresh_snapshot
+from telegram.media_groups import media_groups
 from telegram.states import Form
+from telegram_db.crud import MAX_PHOTOS
+from telegram_db.dedup import HASHING_AVAILABLE, dhash
 
 
 router = Router()
@@ -13,21 +21,78 @@ router = Router()
     lambda message: message.content_type == "photo"
 )
 async def process_photo(message: types.Message, state: FSMContext) -> None:
-    """Сохраняет входящие фотографии при загрузке объявления."""
+    """
+    Сохраняет входящие фотографии при загрузке объявления. Фотографии
+    альбома сохраняются вместе, после того как придет весь альбом.
+    """
+    if message.media_group_id:
+        media_groups.add(
+            message, lambda messages: save_photos(messages, state))
+        return
+    async with media_groups.lock(message.chat.id):
+        await save_photos([message], state)
+
+
+async def photo_hash(message: types.Message) -> Optional[int]:
+    """
+    Перцептивный хэш самой маленькой копии фотографии для поиска
+    повторов или None, если его не удалось посчитать.
+    """
+    if not HASHING_AVAILABLE:
+        return None
+    try:
+        data = await message.bot.download(message.photo[0])
+    except TelegramAPIError:
+        return None
+    return dhash(data.read())
+
+
+async def save_photos(
+    messages: List[types.Message],
+    state: FSMContext
+) -> None:
+    """
+    Добавляет фотографии сообщений к объявлению одной записью состояния
+    и отвечает одним сообщением. Фотографии сверх MAX_PHOTOS
+    отбрасываются.
+    """
+    refresh_snapshot()
     data = await state.get_data()
     photos = data.get("photo_file_ids", [])
+    free = max(MAX_PHOTOS - len(photos), 0)
+    received = [message.photo[-1].file_id for message in messages]
+    accepted = received[:free]
 
-    if message.photo:
-        file_id = message.photo[-1].file_id
-        photos.append(file_id)
-        await state.update_data(photo_file_ids=photos)
-        await message.reply(
-            f"Фото получено (всего: {len(photos)}). Отправьте ещё или /done.")
+    if accepted:
+        hashes = await asyncio.gather(
+            *(photo_hash(message) for message in messages[:free]))
+        await state.update_data({
+            "photo_file_ids": photos + accepted,
+            "photo_unique_ids": data.get("photo_unique_ids", []) + [
+                message.photo[-1].file_unique_id
+                for message in messages[:free]],
+            "photo_hashes": data.get("photo_hashes", []) + list(hashes),
+        })
+    if not free:
+        text = (f"Можно загрузить максимум {MAX_PHOTOS} фотографий. "
+                "Отправьте /done.")
+    elif len(accepted) < len(received):
+        text = (f"Получено фото: {len(accepted)}, остальные не сохранены — "
+                f"можно загрузить максимум {MAX_PHOTOS}. Отправьте /done.")
+    elif len(accepted) > 1:
+        text = (f"Получено фото: {len(accepted)} (всего: "
+                f"{len(photos) + len(accepted)}). Отправьте ещё или /done.")
+    else:
+        text = (f"Фото получено (всего: {len(photos) + 1}). "
+                "Отправьте ещё или /done.")
+    await messages[0].reply(text)
 
 
 @router.message(StateFilter(Form.photos), Command("done"))
 async def finish_photos(message: types.Message, state: FSMContext) -> None:
     """Завершает создание объявления после загрузки фотографий."""
+    await media_groups.flush(message.chat.id)
+    refresh_snapshot()
     data = await state.get_data()
     photos = data.get("photo_file_ids", [])
     if not photos:
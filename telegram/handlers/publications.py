@@ -1,10 +1,15 @@
 from aiogram import Router, types, F
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from telegram_db.crud import (
-    get_apartments_by_owner, delete_apartment, update_apartment_availability)
-from telegram_db.db import AsyncSessionLocal
+    get_owner_page, delete_apartment, update_apartment_availability)
+from telegram_db.db import after_commit
+from telegram.callbacks import ListingAction, PublicationsPage
+from telegram.rendering import (
+    Listing, edit_card, edit_pagination, navigation_buttons, render_page,
+    send_card)
+from telegram.subscriptions import notifier
 
 
 router = Router()
@@ -12,39 +17,61 @@ PAGE_SIZE = 5
 
 
 @router.message(F.text == "📃 Мои публикации")
-async def my_publications(message: types.Message, state: FSMContext) -> None:
+async def my_publications(
+    message: types.Message,
+    session: AsyncSession
+) -> None:
     """
     Обработчик команды «Мои публикации».
-    Инициализирует текущую страницу и показывает публикации пользователя.
+    Показывает первую страницу публикаций пользователя.
     """
-    await state.update_data(current_publications_page=0)
-    await show_user_publications(message, state, user_id=message.from_user.id)
+    await show_user_publications(
+        message, session, user_id=message.from_user.id)
+
+
+def publications_page_size() -> int:
+    """При перелистывании одной карточкой на странице одно объявление."""
+    return 1 if edit_pagination() else PAGE_SIZE
 
 
 async def show_user_publications(
     message: types.Message,
-    state: FSMContext,
-    user_id: int
+    session: AsyncSession,
+    user_id: int,
+    current_page: int = 0,
+    edit: bool = False,
+    same_photo: bool = False
 ) -> None:
     """
-    Извлекает публикации пользователя по user_id, делит их на страницы и
-    отправляет сообщения.
+    Загружает страницу current_page публикаций пользователя по user_id
+    (вместе с их общим числом) и отправляет ее. Номер страницы
+    передается в кнопках, а не хранится в FSM. В режиме перелистывания
+    одной карточкой публикация показывается одним сообщением, и при
+    edit=True это сообщение (message) редактируется; same_photo — у
+    карточки меняется только подпись.
     """
     owner_id = str(user_id)
-    apartments = await get_apartments_by_owner(owner_id)
-
-    if not apartments:
+    page_size = publications_page_size()
+    # После удаления последней публикации страницы может уже не быть —
+    # тогда get_owner_page вернет последнюю.
+    pubs_page, total, current_page = await get_owner_page(
+        session, owner_id, current_page, page_size)
+
+    if not pubs_page:
+        if edit and edit_pagination():
+            await message.delete()
         await message.answer("📃 У вас нет публикаций.")
         return
 
-    data = await state.get_data()
-    current_page = data.get("current_publications_page", 0)
-    total_pages = (len(apartments) - 1) // PAGE_SIZE + 1
+    total_pages = (total - 1) // page_size + 1
 
-    start_index = current_page * PAGE_SIZE
-    end_index = start_index + PAGE_SIZE
-    pubs_page = apartments[start_index:end_index]
+    prev_data = next_data = None
+    if current_page > 0:
+        prev_data = PublicationsPage(page=current_page - 1).pack()
+    if current_page < total_pages - 1:
+        next_data = PublicationsPage(page=current_page + 1).pack()
 
+    listings = []
     for apt in pubs_page:
         response = (
             f"📢 Объявление ID: {apt.id}\n"
@@ -58,109 +85,115 @@ async def show_user_publications(
             f"📝 Описание: {apt.description}\n"
         )
 
-        if apt.photos:
-            photo_ids = [photo.file_id for photo in apt.photos]
-            chunks = [photo_ids[i:i + 5] for i in range(0, len(photo_ids), 5)]
-            for chunk in chunks:
-                media = [
-                    types.InputMediaPhoto(media=file_id) for file_id in chunk]
-                await message.bot.send_media_group(
-                    chat_id=message.chat.id, media=media)
-
         action_kb = InlineKeyboardBuilder()
         action_kb.button(
-            text="❌ Удалить", callback_data=f"delete|{apt.id}")
+            text="❌ Удалить",
+            callback_data=ListingAction(
+                action="delete", id=apt.id, page=current_page))
         action_kb.button(
-            text="🔄 Изменить статус", callback_data=f"toggle|{apt.id}")
+            text="🔄 Изменить статус",
+            callback_data=ListingAction(
+                action="toggle", id=apt.id, page=current_page))
         action_kb.adjust(2)
-        await message.answer(response, reply_markup=action_kb.as_markup())
+        listings.append(Listing(
+            apt.id, [photo.file_id for photo in apt.photos], response,
+            action_kb.as_markup(), parse_mode=None))
+
+    if edit_pagination():
+        listing = listings[0]._replace(
+            text=f"{listings[0].text}\n{current_page + 1} из {total_pages}")
+        navigation = navigation_buttons(prev_data, next_data)
+        if edit:
+            await edit_card(message, listing, navigation, same_photo)
+        else:
+            await send_card(message.bot, message.chat.id, listing, navigation)
+        return
+
+    await render_page(message.bot, message.chat.id, listings)
 
     nav_kb = InlineKeyboardBuilder()
-    if current_page > 0:
-        nav_kb.button(text="⬅️ Назад", callback_data="pubs_prev")
-    if current_page < total_pages - 1:
-        nav_kb.button(text="➡️ Далее", callback_data="pubs_next")
-    nav_kb.adjust(1)
-    if nav_kb.buttons:
+    for button in navigation_buttons(prev_data, next_data):
+        nav_kb.row(button)
+    if prev_data or next_data:
         await message.answer(f"Страница {current_page + 1} из {total_pages}",
                              reply_markup=nav_kb.as_markup())
 
-    await state.update_data(current_publications_page=current_page)
-
 
-@router.callback_query(F.data.in_(["pubs_next", "pubs_prev"]))
+@router.callback_query(PublicationsPage.filter())
 async def publications_pagination(
     callback: types.CallbackQuery,
-    state: FSMContext
+    callback_data: PublicationsPage,
+    session: AsyncSession
 ) -> None:
     """
-    Обработчик нажатий на кнопки навигации. Обновляет номер страницы и
-    вызывает отображение публикаций.
+    Обработчик нажатий на кнопки навигации: показывает страницу, номер
+    которой записан в кнопке.
     """
-    data = await state.get_data()
-    current_page = data.get("current_publications_page", 0)
-    user_id = callback.from_user.id
-
-    apartments = await get_apartments_by_owner(str(user_id))
-    total_pages = (len(apartments) - 1) // PAGE_SIZE + 1
-
-    if callback.data == "pubs_next" and current_page < total_pages - 1:
-        current_page += 1
-    elif callback.data == "pubs_prev" and current_page > 0:
-        current_page -= 1
-
-    await state.update_data(current_publications_page=current_page)
-    await show_user_publications(callback.message, state, user_id=user_id)
+    await show_user_publications(
+        callback.message, session, user_id=callback.from_user.id,
+        current_page=callback_data.page, edit=True)
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("delete|"))
+@router.callback_query(ListingAction.filter(F.action == "delete"))
 async def delete_publication(
     callback: types.CallbackQuery,
-    state: FSMContext
+    callback_data: ListingAction,
+    session: AsyncSession
 ) -> None:
     """
     Обрабатывает кнопку "Удалить" для публикации.
     Извлекает id объявления из callback_data и удаляет его из базы,
     если публикация принадлежит текущему пользователю.
     """
-    _, apt_id_str = callback.data.split("|")
-    apt_id = int(apt_id_str)
+    apt_id = callback_data.id
     owner_id = str(callback.from_user.id)
 
-    async with AsyncSessionLocal() as session:
-        try:
-            await delete_apartment(session, apt_id, owner_id)
-        except ValueError as e:
-            await callback.answer(str(e), show_alert=True)
-            return
+    try:
+        await delete_apartment(session, apt_id, owner_id)
+    except ValueError as e:
+        await callback.answer(str(e), show_alert=True)
+        return
+    if edit_pagination():
+        await callback.answer(f"Объявление {apt_id} удалено.")
+        await show_user_publications(
+            callback.message, session, user_id=callback.from_user.id,
+            current_page=callback_data.page, edit=True)
+        return
     await callback.message.answer(f"Объявление {apt_id} удалено.")
     await callback.answer()
 
-    await my_publications(callback.message, state)
+    await show_user_publications(
+        callback.message, session, user_id=callback.from_user.id)
 
 
-@router.callback_query(F.data.startswith("toggle|"))
+@router.callback_query(ListingAction.filter(F.action == "toggle"))
 async def toggle_availability(
     callback: types.CallbackQuery,
-    state: FSMContext
+    callback_data: ListingAction,
+    session: AsyncSession
 ) -> None:
     """
     Обрабатывает кнопку "Изменить статус" для публикации.
     Извлекает id объявления и переключает его доступность.
     """
-    _, apt_id_str = callback.data.split("|")
-    apt_id = int(apt_id_str)
+    apt_id = callback_data.id
     owner_id = str(callback.from_user.id)
 
-    async with AsyncSessionLocal() as session:
-        try:
-            apt = await update_apartment_availability(
-                session, apt_id, owner_id)
-        except ValueError as e:
-            await callback.answer(str(e), show_alert=True)
-            return
+    try:
+        apt = await update_apartment_availability(session, apt_id, owner_id)
+    except ValueError as e:
+        await callback.answer(str(e), show_alert=True)
+        return
+    if apt.is_available:
+        after_commit(session, notifier.publish, apt)
     new_status = "✅ Доступно" if apt.is_available else "❌ Занято"
+    if edit_pagination():
+        await callback.answer(f"Статус изменен на {new_status}.")
+        await show_user_publications(
+            callback.message, session, user_id=callback.from_user.id,
+            current_page=callback_data.page, edit=True, same_photo=True)
+        return
     await callback.message.answer(
         f"Статус объявления {apt_id} изменен на {new_status}.")
     await callback.answer()
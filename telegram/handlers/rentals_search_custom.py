@@ -1,16 +1,48 @@
+import json
+from typing import Optional
+
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import Command
+from aiogram.filters import Command, StateFilter
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from telegram_db.db import AsyncSessionLocal
+from telegram_db.crud import (
+    create_saved_search, delete_saved_search, get_saved_searches)
+from telegram_db.db import after_commit
+from telegram_db.fulltext import parse_query
 from telegram_db.models import Apartment
+from telegram_db.geo import MAX_RADIUS_KM, parse_point
+from telegram_db.search import (
+    PAGE_SIZE, DEFAULT_RADIUS_KM, FUZZY_FILTER, KEYWORDS_FILTER, NEAR_FILTER,
+    POINT_FILTER, RADIUS_FILTER, SearchPage, count_apartments,
+    search_apartments_page)
+from telegram.callbacks import RentalsPage, remember_filters, resolve_filters
+from telegram.geocoding import GeocodingError, geocode_address
+from telegram.rendering import (
+    Listing, edit_card, edit_pagination, navigation_buttons, render_page,
+    send_card)
 from telegram.states import Form
+from telegram.subscriptions import subscriptions
 
 router = Router()
-PAGE_SIZE = 5
+
+
+def initial_filters() -> dict:
+    """Возвращает пустой набор фильтров поиска."""
+    return {
+        "город": "",
+        "адрес": "",
+        "цена мин": "",
+        "цена макс": "",
+        "комнаты": "",
+        "этаж": "",
+        KEYWORDS_FILTER: "",
+        NEAR_FILTER: "",
+        RADIUS_FILTER: "",
+        POINT_FILTER: "",
+        FUZZY_FILTER: ""
+    }
 
 
 @router.message(Command("search_rentals"))
@@ -21,17 +53,8 @@ async def start_custom_search(
     """
     Инициализирует фильтры и переводит пользователя в состояние поиска аренды.
     """
-    initial_filters = {
-        "город": "",
-        "адрес": "",
-        "цена мин": "",
-        "цена макс": "",
-        "комнаты": "",
-        "этаж": ""
-    }
     await state.update_data(
-        search_filters=initial_filters,
-        current_rentals_page=0,
+        search_filters=initial_filters(),
         current_edit_field=None
     )
     await state.set_state(Form.search_filters)
@@ -64,10 +87,25 @@ async def show_filters_form(message: types.Message, state: FSMContext) -> None:
     builder.button(
         text=f"Этаж: {filters.get('этаж') or 'Не указано'}",
         callback_data="edit_этаж")
+    builder.button(
+        text=("Ключевые слова: "
+              f"{filters.get(KEYWORDS_FILTER) or 'Не указано'}"),
+        callback_data=f"edit_{KEYWORDS_FILTER}")
+    builder.button(
+        text=f"Рядом с: {filters.get(NEAR_FILTER) or 'Не указано'}",
+        callback_data=f"edit_{NEAR_FILTER}")
+    builder.button(
+        text=(f"Радиус, км: {filters.get(RADIUS_FILTER) or DEFAULT_RADIUS_KM}"
+              if filters.get(NEAR_FILTER) else "Радиус, км: Не указано"),
+        callback_data=f"edit_{RADIUS_FILTER}")
+    builder.button(
+        text=f"Нечеткий поиск: {'✅' if filters.get(FUZZY_FILTER) else '❌'}",
+        callback_data="toggle_fuzzy")
     builder.adjust(1)
 
     builder.button(text="🔄 Сбросить фильтры", callback_data="reset_filters")
     builder.button(text="✅ Применить фильтры", callback_data="apply_filters")
+    builder.button(text="🔔 Сохранить поиск", callback_data="save_search")
 
     await message.answer(
         "Заполните фильтры поиска (нажмите, чтобы изменить):",
@@ -86,7 +124,111 @@ async def edit_filter_callback(
     """
     field = callback.data.replace("edit_", "")
     await state.update_data(current_edit_field=field)
-    await callback.message.answer(f"Введите новое значение для '{field}':")
+    if field == NEAR_FILTER:
+        await callback.message.answer(
+            "Отправьте адрес, координаты (например, 55.75, 37.61) "
+            "или геопозицию:")
+    elif field == KEYWORDS_FILTER:
+        await callback.message.answer(
+            "Введите слова, которые должны быть в описании, например: "
+            "балкон мебель. «-слово» исключает описания с этим словом, "
+            "«or» разделяет варианты.")
+    else:
+        await callback.message.answer(
+            f"Введите новое значение для '{field}':")
+    await callback.answer()
+
+
+@router.callback_query(F.data == "toggle_fuzzy")
+async def toggle_fuzzy_callback(
+    callback: types.CallbackQuery,
+    state: FSMContext
+) -> None:
+    """
+    Включает или выключает нечеткий поиск по городу и адресу: с ним
+    находятся и варианты с опечатками, а результаты сортируются по
+    сходству с запросом.
+    """
+    data = await state.get_data()
+    search_filters = data.get("search_filters", {})
+    search_filters[FUZZY_FILTER] = (
+        "" if search_filters.get(FUZZY_FILTER) else "да")
+    await state.update_data(search_filters=search_filters)
+    await show_filters_form(callback.message, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "save_search")
+async def save_search_callback(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession
+) -> None:
+    """
+    Сохраняет текущие фильтры как подписку: о новых подходящих
+    объявлениях пользователь получит уведомление.
+    """
+    data = await state.get_data()
+    filters = data.get("search_filters", {})
+    saved_search = await create_saved_search(
+        session,
+        user_id=str(callback.from_user.id),
+        chat_id=str(callback.message.chat.id),
+        filters=filters
+    )
+    after_commit(
+        session, subscriptions.add,
+        saved_search.id, saved_search.user_id, saved_search.chat_id, filters)
+    await callback.message.answer(
+        "🔔 Поиск сохранен. Мы сообщим о новых подходящих объявлениях.\n"
+        "Список сохраненных поисков: /my_searches")
+    await callback.answer()
+
+
+@router.message(Command("my_searches"))
+async def my_searches(
+    message: types.Message,
+    session: AsyncSession
+) -> None:
+    """
+    Показывает сохраненные поиски пользователя с кнопками удаления.
+    """
+    saved_searches = await get_saved_searches(
+        session, str(message.from_user.id))
+    if not saved_searches:
+        await message.answer("У вас нет сохраненных поисков.")
+        return
+
+    for saved_search in saved_searches:
+        filters = json.loads(saved_search.filters)
+        description = "\n".join(
+            f"{field}: {value}" for field, value in filters.items()
+            if value and field != POINT_FILTER
+        ) or "Все объявления"
+        builder = InlineKeyboardBuilder()
+        builder.button(
+            text="❌ Удалить", callback_data=f"unsub|{saved_search.id}")
+        await message.answer(
+            f"🔔 Поиск #{saved_search.id}\n{description}",
+            reply_markup=builder.as_markup())
+
+
+@router.callback_query(F.data.startswith("unsub|"))
+async def delete_saved_search_callback(
+    callback: types.CallbackQuery,
+    session: AsyncSession
+) -> None:
+    """Удаляет сохраненный поиск."""
+    _, search_id_str = callback.data.split("|")
+    search_id = int(search_id_str)
+    try:
+        await delete_saved_search(
+            session, search_id, str(callback.from_user.id))
+    except ValueError as e:
+        await callback.answer(str(e), show_alert=True)
+        return
+    after_commit(session, subscriptions.remove, search_id)
+    await callback.message.answer(f"Сохраненный поиск #{search_id} удален.")
     await callback.answer()
 
 
@@ -98,47 +240,67 @@ async def reset_filters_callback(
     """
     Сбрасывает фильтры в исходное состояние.
     """
-    initial_filters = {
-        "город": "",
-        "адрес": "",
-        "цена мин": "",
-        "цена макс": "",
-        "комнаты": "",
-        "этаж": ""
-    }
     await state.update_data(
-        search_filters=initial_filters,
-        current_edit_field=None,
-        current_rentals_page=0
+        search_filters=initial_filters(),
+        current_edit_field=None
     )
     await callback.message.answer("Фильтры сброшены.")
     await show_filters_form(callback.message, state)
     await callback.answer("Фильтры сброшены.")
 
 
-@router.message()
+async def editing_filter(message: types.Message, state: FSMContext) -> bool:
+    """Пропускает сообщения, когда пользователь меняет фильтр поиска."""
+    return bool((await state.get_data()).get("current_edit_field"))
+
+
+@router.message(StateFilter(Form.search_filters), editing_filter)
 async def process_field_value(
     message: types.Message,
     state: FSMContext
 ) -> None:
     """
-    Обрабатывает текстовые сообщения.
-    Если в FSM установлено поле для редактирования, считается, что
-    это новое значение для него.
+    Обрабатывает новое значение фильтра, выбранного для редактирования
+    (current_edit_field в FSM).
     """
     data = await state.get_data()
-    current_field = data.get("current_edit_field")
-    if not current_field:
-        return
+    current_field = data["current_edit_field"]
 
     search_filters = data.get("search_filters", {})
-    if current_field in ["цена мин", "цена макс"]:
+    if current_field == NEAR_FILTER:
+        point = await resolve_point(message)
+        if point is None:
+            return
+        search_filters[POINT_FILTER] = f"{point[0]:.6f},{point[1]:.6f}"
+        search_filters[NEAR_FILTER] = (
+            message.text if message.text else "📍 Геопозиция")
+        await state.update_data(
+            search_filters=search_filters, current_edit_field=None)
+        await message.answer(f"Значение для '{current_field}' обновлено.")
+        await show_filters_form(message, state)
+        return
+    if current_field == RADIUS_FILTER:
+        try:
+            radius = float(message.text)
+        except (TypeError, ValueError):
+            radius = 0
+        if not 0 < radius <= MAX_RADIUS_KM:
+            await message.answer(
+                f"Введите радиус в километрах от 0 до {MAX_RADIUS_KM}.")
+            return
+    elif current_field in ["цена мин", "цена макс"]:
         try:
             float(message.text)
         except ValueError:
             await message.answer(
                 "Введите корректное числовое значение для цены.")
             return
+    elif current_field == KEYWORDS_FILTER:
+        if not parse_query(message.text or ""):
+            await message.answer(
+                "Введите хотя бы одно значимое слово для поиска в "
+                "описании.")
+            return
     elif current_field in ["комнаты", "этаж"]:
         try:
             int(message.text)
@@ -153,172 +315,176 @@ async def process_field_value(
     await show_filters_form(message, state)
 
 
+async def resolve_point(message: types.Message) -> Optional[tuple]:
+    """
+    Определяет координаты центра поиска по геопозиции, координатам
+    в тексте или адресу. Если не удалось, сообщает об этом пользователю
+    и возвращает None.
+    """
+    if message.location:
+        return message.location.latitude, message.location.longitude
+    if not message.text:
+        await message.answer("Отправьте адрес, координаты или геопозицию.")
+        return None
+
+    point = parse_point(message.text)
+    if point:
+        return point
+    try:
+        addresses = await geocode_address(message.text)
+    except GeocodingError:
+        await message.answer(
+            "⚠️ Сервис поиска адресов временно недоступен. "
+            "Отправьте координаты или геопозицию.")
+        return None
+    for address in addresses:
+        if None not in (address.get("lat"), address.get("lon")):
+            return address["lat"], address["lon"]
+    await message.answer(
+        "❌ Не удалось определить координаты этого адреса. "
+        "Уточните адрес или отправьте геопозицию.")
+    return None
+
+
 @router.callback_query(F.data == "apply_filters")
 async def apply_filters_callback(
     callback: types.CallbackQuery,
-    state: FSMContext
+    state: FSMContext,
+    session: AsyncSession
 ) -> None:
     """
     При нажатии кнопки «Применить фильтры» выполняется запрос в БД с учетом
-    указанных фильтров и выводятся результаты.
+    указанных фильтров и выводится первая страница результатов.
     """
     data = await state.get_data()
     filters = data.get("search_filters", {})
-    async with AsyncSessionLocal() as session:
-        stmt = (
-            select(Apartment)
-            .options(selectinload(Apartment.photos))
-            .where(Apartment.is_available)
-        )
-        if filters.get("город"):
-            stmt = stmt.where(Apartment.city.ilike(f"%{filters['город']}%"))
-        if filters.get("адрес"):
-            stmt = stmt.where(Apartment.address.ilike(f"%{filters['адрес']}%"))
-        if filters.get("цена мин"):
-            try:
-                price_min = float(filters["цена мин"])
-                stmt = stmt.where(Apartment.price >= price_min)
-            except ValueError:
-                pass
-        if filters.get("цена макс"):
-            try:
-                price_max = float(filters["цена макс"])
-                stmt = stmt.where(Apartment.price <= price_max)
-            except ValueError:
-                pass
-        if filters.get("комнаты"):
-            try:
-                rooms = int(filters["комнаты"])
-                stmt = stmt.where(Apartment.rooms == rooms)
-            except ValueError:
-                pass
-        if filters.get("этаж"):
-            try:
-                storey = int(filters["этаж"])
-                stmt = stmt.where(Apartment.storey == storey)
-            except ValueError:
-                pass
-        result = await session.execute(stmt)
-        apartments = result.scalars().all()
-
-    if not apartments:
+    total = await count_apartments(session, filters)
+    page = await search_apartments_page(
+        session, filters, limit=rentals_page_size())
+
+    if not page.apartments:
         await callback.message.answer(
             "❌ По заданным фильтрам ничего не найдено.")
         await callback.answer()
         return
 
-    await state.update_data(current_rentals_page=0)
-    await display_custom_rentals(callback.message, state, apartments)
+    filters_key = await remember_filters(session, filters)
+    await display_custom_rentals(
+        callback.message, filters_key, page, 0, total)
     await callback.answer("Фильтры применены!")
 
 
+def rentals_page_size() -> int:
+    """При перелистывании одной карточкой на странице одно объявление."""
+    return 1 if edit_pagination() else PAGE_SIZE
+
+
+def format_rental(apt: Apartment) -> str:
+    """Формирует текст карточки найденного объявления."""
+    return (
+        f"📢 <b>Объявление ID:</b> {apt.id}\n"
+        f"🏠 <b>Город:</b> {apt.city}\n"
+        f"🛏️ <b>Улица:</b> {apt.street}\n"
+        f"🏠 <b>Адрес:</b> {apt.address}\n"
+        f"🏢 <b>Этаж:</b> {apt.storey}\n"
+        f"🛏️ <b>Комнат:</b> {apt.rooms}\n"
+        f"💰 <b>Цена:</b> {apt.price} руб.\n"
+        f"📝 <b>Описание:</b> {apt.description}\n"
+        f"👤 <b>Владелец:</b> "
+        f"<a href='tg://user?id={apt.owner_id}'>Контакт</a>\n"
+    )
+
+
 async def display_custom_rentals(
     message: types.Message,
-    state: FSMContext,
-    apartments: list
+    filters_key: str,
+    page: SearchPage,
+    page_number: int,
+    total: int,
+    edit: bool = False
 ) -> None:
     """
-    Отображает найденные объявления с пагинацией (PAGE_SIZE на страницу).
+    Отображает страницу найденных объявлений и кнопки навигации.
+    Объявления отправляются параллельно (см. telegram.rendering), кнопки
+    навигации — после них. В режиме перелистывания одной карточкой
+    объявление с кнопками навигации показывается одним сообщением, и
+    при edit=True это сообщение (message) редактируется.
+    Кнопки навигации несут курсоры первого и последнего объявления
+    страницы и хэш фильтров (см. telegram.callbacks).
     """
-    data = await state.get_data()
-    current_page = data.get("current_rentals_page", 0)
-    total_pages = (len(apartments) - 1) // PAGE_SIZE + 1
-    start_index = current_page * PAGE_SIZE
-    end_index = start_index + PAGE_SIZE
-    rentals_page = apartments[start_index:end_index]
-
-    for apt in rentals_page:
-        if apt.photos:
-            photo_ids = [photo.file_id for photo in apt.photos]
-            chunks = [photo_ids[i:i+5] for i in range(0, len(photo_ids), 5)]
-            for chunk in chunks:
-                media = [
-                    types.InputMediaPhoto(media=file_id) for file_id in chunk]
-                await message.bot.send_media_group(
-                    chat_id=message.chat.id, media=media)
-        response = (
-            f"📢 <b>Объявление ID:</b> {apt.id}\n"
-            f"🏠 <b>Город:</b> {apt.city}\n"
-            f"🛏️ <b>Улица:</b> {apt.street}\n"
-            f"🏠 <b>Адрес:</b> {apt.address}\n"
-            f"🏢 <b>Этаж:</b> {apt.storey}\n"
-            f"🛏️ <b>Комнат:</b> {apt.rooms}\n"
-            f"💰 <b>Цена:</b> {apt.price} руб.\n"
-            f"📝 <b>Описание:</b> {apt.description}\n"
-            f"👤 <b>Владелец:</b> <a href='tg://user?id={apt.owner_id}'>Контакт</a>\n"
-        )
-        await message.answer(response, parse_mode="HTML")
+    total_pages = max((total - 1) // rentals_page_size() + 1, 1)
+    prev_data = next_data = None
+    if page_number > 0:
+        prev_data = RentalsPage.from_cursor(
+            filters_key, False, page_number - 1, total,
+            page.first_cursor).pack()
+    if page_number < total_pages - 1:
+        next_data = RentalsPage.from_cursor(
+            filters_key, True, page_number + 1, total,
+            page.last_cursor).pack()
 
-    builder = InlineKeyboardBuilder()
-    if current_page > 0:
-        builder.button(text="⬅️ Назад", callback_data="custom_prev")
-    if current_page < total_pages - 1:
-        builder.button(text="➡️ Далее", callback_data="custom_next")
-    builder.adjust(1)
-    if builder.buttons:
+    listings = [
+        Listing(apt.id, [photo.file_id for photo in apt.photos],
+                format_rental(apt))
+        for apt in page.apartments
+    ]
+
+    if edit_pagination():
+        listing = listings[0]._replace(
+            text=f"{listings[0].text}\n{page_number+1} из {total_pages}")
+        navigation = navigation_buttons(prev_data, next_data)
+        if edit:
+            await edit_card(message, listing, navigation)
+        else:
+            await send_card(message.bot, message.chat.id, listing, navigation)
+        return
+
+    await render_page(message.bot, message.chat.id, listings)
+
+    navigation = navigation_buttons(prev_data, next_data)
+    if navigation:
+        builder = InlineKeyboardBuilder()
+        for button in navigation:
+            builder.row(button)
         await message.answer(
-            f"Страница {current_page+1} из {total_pages}",
+            f"Страница {page_number+1} из {total_pages}",
             reply_markup=builder.as_markup())
-    await state.update_data(current_rentals_page=current_page)
 
 
-@router.callback_query(F.data.startswith("custom_"))
+@router.callback_query(RentalsPage.filter())
 async def custom_rentals_pagination(
     callback: types.CallbackQuery,
-    state: FSMContext
+    callback_data: RentalsPage,
+    session: AsyncSession
 ) -> None:
     """
-    Обрабатывает кнопки навигации по страницам (custom_prev и custom_next),
-    обновляя номер текущей страницы и выводя объявления.
+    Обрабатывает кнопки навигации по страницам. Загружается только
+    запрошенная страница: от курсора из кнопки. Состояние FSM не
+    используется, поэтому работают и кнопки старых сообщений.
     """
-    data_cb = callback.data
-    user_data = await state.get_data()
-    current_page = user_data.get("current_rentals_page", 0)
-    filters = user_data.get("search_filters", {})
-
-    async with AsyncSessionLocal() as session:
-        stmt = (
-            select(Apartment)
-            .options(selectinload(Apartment.photos))
-            .where(Apartment.is_available)
-        )
-        if filters.get("город"):
-            stmt = stmt.where(Apartment.city.ilike(f"%{filters['город']}%"))
-        if filters.get("адрес"):
-            stmt = stmt.where(Apartment.address.ilike(f"%{filters['адрес']}%"))
-        if filters.get("цена мин"):
-            try:
-                price_min = float(filters["цена мин"])
-                stmt = stmt.where(Apartment.price >= price_min)
-            except ValueError:
-                pass
-        if filters.get("цена макс"):
-            try:
-                price_max = float(filters["цена макс"])
-                stmt = stmt.where(Apartment.price <= price_max)
-            except ValueError:
-                pass
-        if filters.get("комнаты"):
-            try:
-                rooms = int(filters["комнаты"])
-                stmt = stmt.where(Apartment.rooms == rooms)
-            except ValueError:
-                pass
-        if filters.get("этаж"):
-            try:
-                storey = int(filters["этаж"])
-                stmt = stmt.where(Apartment.storey == storey)
-            except ValueError:
-                pass
-        result = await session.execute(stmt)
-        apartments = result.scalars().all()
-
-    total_pages = (len(apartments) - 1) // PAGE_SIZE + 1
-    if data_cb == "custom_next" and current_page < total_pages - 1:
-        current_page += 1
-    elif data_cb == "custom_prev" and current_page > 0:
-        current_page -= 1
-
-    await state.update_data(current_rentals_page=current_page)
-    await display_custom_rentals(callback.message, state, apartments)
+    filters = await resolve_filters(session, callback_data.search)
+    if filters is None:
+        await callback.answer(
+            "⚠️ Поиск устарел. Примените фильтры заново.", show_alert=True)
+        return
+
+    after = before = None
+    if callback_data.forward:
+        after = callback_data.cursor
+    else:
+        before = callback_data.cursor
+
+    page = await search_apartments_page(
+        session, filters, after=after, before=before,
+        limit=rentals_page_size())
+
+    if not page.apartments:
+        await callback.answer(
+            "⚠️ Объявления на этой странице больше недоступны.",
+            show_alert=True)
+        return
+
+    await display_custom_rentals(
+        callback.message, callback_data.search, page, callback_data.page,
+        callback_data.total, edit=True)
     await callback.answer()
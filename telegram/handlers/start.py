@@ -2,6 +2,7 @@ from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from telegram.handlers import publications, rentals_search_custom
 from telegram.states import Form
@@ -100,12 +101,15 @@ async def add_publication_button(
 
 
 @router.message(F.text == "📃 Мои публикации")
-async def my_publications_handler(message: types.Message, state) -> None:
+async def my_publications_handler(
+    message: types.Message,
+    session: AsyncSession
+) -> None:
     """
     Обработчик кнопки '📃 Мои публикации'.
     Передаёт управление в модуль publications.
     """
-    await publications.my_publications(message, state)
+    await publications.my_publications(message, session)
 
 
 @router.message(F.text == "Назад")
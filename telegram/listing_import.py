@@ -0,0 +1,262 @@
+"""
+Массовый импорт объявлений из CSV или JSON.
+
+Файл разбирается целиком, каждая строка проверяется по тем же правилам,
+что и ввод объявления в боте (validate_basic_fields). Строки без
+координат геокодируются (справочник, кэш, затем Nominatim), после чего
+объявления вставляются пачками по chunk_size многострочными INSERT —
+каждая пачка в своей транзакции, так что ошибка не откатывает уже
+вставленные пачки, а прогресс виден по мере работы. Повторы уже
+опубликованных объявлений и строк файла (по отпечатку, см.
+telegram_db.dedup) пропускаются. Файл, в котором больше max_geocoded
+строк без города или широты, отклоняется целиком: при лимите
+Nominatim такой импорт шел бы слишком долго.
+
+Колонки (в CSV — заголовок, в JSON — ключи объектов списка):
+  price/цена, storey/этаж, rooms/комнаты, description/описание,
+  address/адрес — обязательно;
+  city/город, street/улица — если нет, берутся из геокодера;
+  lat/широта, lon/долгота — если есть вместе с городом, адрес не
+    геокодируется;
+  photos/фото — file_id фотографий через пробел или «;».
+"""
+import asyncio
+import csv
+import io
+import json
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Tuple
+
+from telegram.config import IMPORT_MAX_GEOCODED
+from telegram.geocoding import GeocodingError, geocode_address
+from telegram.handlers.basic import validate_basic_fields
+from telegram.subscriptions import notifier
+from telegram_db.crud import (
+    MAX_PHOTOS, bulk_create_apartments, find_fingerprints)
+from telegram_db.db import AsyncSessionLocal
+from telegram_db.dedup import listing_fingerprint
+from telegram_db.models import Apartment
+
+
+CHUNK_SIZE = 500
+GEOCODE_CONCURRENCY = 8
+
+_ALIASES = {
+    "цена": "price",
+    "этаж": "storey",
+    "комнаты": "rooms",
+    "описание": "description",
+    "адрес": "address",
+    "город": "city",
+    "улица": "street",
+    "широта": "lat",
+    "долгота": "lon",
+    "фото": "photos",
+}
+
+# Колбэк прогресса: (обработано строк, всего строк).
+Progress = Callable[[int, int], Awaitable[None]]
+
+
+class ImportResult(NamedTuple):
+    """Итог импорта: ошибки — пары (номер строки, текст ошибки)."""
+    total: int
+    inserted: int
+    errors: List[Tuple[int, str]]
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.inserted / self.seconds if self.seconds else 0.0
+
+
+def parse_file(data: bytes, filename: str) -> List[dict]:
+    """
+    Разбирает CSV (разделитель «,», «;» или табуляция) или JSON-список
+    объектов. Ключи приводятся к английским названиям колонок.
+    """
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        records = json.loads(text)
+        if not isinstance(records, list):
+            raise ValueError("JSON должен содержать список объявлений.")
+    else:
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        records = list(csv.DictReader(io.StringIO(text), dialect=dialect))
+    return [
+        {_ALIASES.get(str(key).strip().lower(), str(key).strip().lower()):
+         value for key, value in record.items()}
+        if isinstance(record, dict) else {}
+        for record in records
+    ]
+
+
+def _coordinate(value) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Координаты должны быть числами.")
+
+
+def needs_geocoding(record: dict) -> bool:
+    """Нужно ли геокодировать адрес записи файла."""
+    return any(record.get(key) in (None, "") for key in ("city", "lat"))
+
+
+def validate_record(record: dict, owner_id: str) -> dict:
+    """
+    Проверяет запись файла и возвращает поля объявления для
+    bulk_create_apartments. Выбрасывает ValueError, если запись неверна.
+    """
+    price, storey, rooms, description = validate_basic_fields(
+        record.get("price"), record.get("storey"), record.get("rooms"),
+        record.get("description"))
+    address = str(record.get("address") or "").strip()
+    if not address:
+        raise ValueError("Не указан адрес.")
+    photos = record.get("photos") or []
+    if isinstance(photos, str):
+        photos = photos.replace(";", " ").split()
+    if len(photos) > MAX_PHOTOS:
+        raise ValueError(f"Можно загрузить максимум {MAX_PHOTOS} фотографий.")
+    return {
+        "owner_id": owner_id,
+        "city": str(record.get("city") or "").strip() or None,
+        "street": str(record.get("street") or "").strip() or None,
+        "address": address,
+        "price": price,
+        "storey": storey,
+        "rooms": rooms,
+        "description": description,
+        "latitude": _coordinate(record.get("lat")),
+        "longitude": _coordinate(record.get("lon")),
+        "photo_file_ids": list(photos),
+    }
+
+
+async def _geocode(apartment: dict, semaphore: asyncio.Semaphore) -> None:
+    if apartment["city"] and apartment["latitude"] is not None:
+        return
+    async with semaphore:
+        addresses = await geocode_address(apartment["address"])
+    if not addresses:
+        if apartment["city"]:
+            return
+        raise ValueError("Адрес не найден, укажите город.")
+    found = addresses[0]
+    apartment["city"] = apartment["city"] or found["city"]
+    apartment["street"] = apartment["street"] or found["road"]
+    if apartment["latitude"] is None or apartment["longitude"] is None:
+        apartment["latitude"] = found.get("lat")
+        apartment["longitude"] = found.get("lon")
+
+
+async def import_listings(
+    data: bytes,
+    filename: str,
+    owner_id: str,
+    geocode: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Progress] = None,
+    max_geocoded: int = IMPORT_MAX_GEOCODED
+) -> ImportResult:
+    """
+    Импортирует объявления владельца owner_id из файла.
+
+    Параметры:
+      data: содержимое файла.
+      filename: имя файла; по расширению .json выбирается формат.
+      owner_id: Telegram ID владельца объявлений.
+      geocode: геокодировать адреса без координат или города. Если
+        False, город обязателен.
+      chunk_size: число объявлений в одной транзакции.
+      progress: вызывается после каждой пачки.
+      max_geocoded: наибольшее число строк, которые нужно геокодировать.
+
+    Возвращает:
+      ImportResult. Неверные строки пропускаются и перечисляются в errors
+      (номера строк считаются с 1, без заголовка).
+
+    Выбрасывает ValueError, если файл не разобрать или в нем больше
+    max_geocoded строк без города или широты.
+    """
+    started = time.perf_counter()
+    records = parse_file(data, filename)
+    if geocode:
+        to_geocode = sum(1 for record in records if needs_geocoding(record))
+        if to_geocode > max_geocoded:
+            raise ValueError(
+                f"Строк без города или широты — {to_geocode}, можно не "
+                f"больше {max_geocoded}. Укажите город и координаты.")
+    errors = []
+    inserted = 0
+    semaphore = asyncio.Semaphore(GEOCODE_CONCURRENCY)
+    seen = set()
+
+    for chunk_start in range(0, len(records), chunk_size):
+        chunk = []
+        for number, record in enumerate(
+                records[chunk_start:chunk_start + chunk_size],
+                start=chunk_start + 1):
+            try:
+                chunk.append((number, validate_record(record, owner_id)))
+            except ValueError as e:
+                errors.append((number, str(e)))
+
+        if geocode:
+            results = await asyncio.gather(
+                *(_geocode(apartment, semaphore) for _, apartment in chunk),
+                return_exceptions=True)
+            valid = []
+            for (number, apartment), result in zip(chunk, results):
+                if isinstance(result, GeocodingError):
+                    errors.append((number, "Геокодер недоступен."))
+                elif isinstance(result, Exception):
+                    errors.append((number, str(result)))
+                else:
+                    valid.append((number, apartment))
+            chunk = valid
+        for number, apartment in chunk:
+            if not apartment["city"]:
+                errors.append((number, "Не указан город."))
+        chunk = [(number, apartment) for number, apartment in chunk
+                 if apartment["city"]]
+
+        if chunk:
+            async with AsyncSessionLocal() as session:
+                fingerprints = {
+                    number: listing_fingerprint(
+                        apartment["address"], apartment["price"],
+                        apartment["rooms"], apartment["storey"])
+                    for number, apartment in chunk}
+                seen |= await find_fingerprints(
+                    session, fingerprints.values())
+                apartments = []
+                for number, apartment in chunk:
+                    if fingerprints[number] in seen:
+                        errors.append((number, "Повтор объявления."))
+                    else:
+                        seen.add(fingerprints[number])
+                        apartments.append(apartment)
+                ids = []
+                if apartments:
+                    ids = await bulk_create_apartments(session, apartments)
+                    await session.commit()
+            inserted += len(ids)
+            for apartment_id, apartment in zip(ids, apartments):
+                notifier.publish(Apartment(
+                    id=apartment_id, is_available=True,
+                    **{key: value for key, value in apartment.items()
+                       if key != "photo_file_ids"}))
+        if progress is not None:
+            await progress(
+                min(chunk_start + chunk_size, len(records)), len(records))
+
+    errors.sort()
+    return ImportResult(
+        len(records), inserted, errors, time.perf_counter() - started)
@@ -1,25 +1,209 @@
+import asyncio
+import os
+
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from telegram.config import TELEGRAM_TOKEN
+from aiohttp import web
+
+from telegram import cluster, events
+from telegram.config import (
+    CLUSTER_PROCESSES, CLUSTER_QUEUE_SIZE, DB_STATS_INTERVAL,
+    FSM_STATS_INTERVAL, FSM_STORAGE,
+    GAZETTEER_PATH, NOMINATIM_RATE, OUTBOUND_RATE, TELEGRAM_TOKEN,
+    WEBHOOK_ENQUEUE_TIMEOUT, WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_SECRET, WEBHOOK_URL, WEBHOOK_WORKERS)
+from telegram.fsm_storage import (
+    BoundedMemoryStorage, FSMSnapshotMiddleware, SQLStorage)
+from telegram.geocoding import gazetteer, geocode_stats, nominatim
+from telegram.middlewares import DbSessionMiddleware
+from telegram.outbound import outbound
+from telegram.ratelimit import TokenBucket
+from telegram.subscriptions import notifier
+from telegram.webhook import UpdateWorkers, create_app
 from telegram.handlers import (
-    basic, photos, address, start, publications, rentals_search_custom)
+    basic, bulk_import, cards, photos, address, start, publications,
+    rentals_search_custom)
+from telegram_db.db import AsyncSessionLocal, engine
+from telegram_db.dedup import photo_index
+from telegram_db.keyword_index import keyword_index
+from telegram_db.search_cache import search_cache
 
 
 bot = Bot(token=TELEGRAM_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+if FSM_STORAGE == "sql":
+    storage = SQLStorage(AsyncSessionLocal)
+else:
+    storage = BoundedMemoryStorage()
+dp = Dispatcher(
+    storage=storage, disable_fsm=isinstance(storage, SQLStorage))
+if isinstance(storage, SQLStorage):
+    # Снимок должен открываться до того, как FSMContextMiddleware
+    # прочитает состояние, поэтому FSM подключается вручную после него.
+    dp.update.outer_middleware(FSMSnapshotMiddleware(storage))
+    dp.update.outer_middleware(dp.fsm)
+db_sessions = DbSessionMiddleware(AsyncSessionLocal)
+dp.message.middleware(db_sessions)
+dp.callback_query.middleware(db_sessions)
 
 
 dp.include_router(start.router)
+dp.include_router(cards.router)
 dp.include_router(basic.router)
 dp.include_router(photos.router)
 dp.include_router(address.router)
 dp.include_router(publications.router)
+dp.include_router(bulk_import.router)
 dp.include_router(rentals_search_custom.router)
 
 
-async def main():
+async def report_storage_stats(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        print(f"FSM storage: {storage.stats()}")
+
+
+async def report_db_stats(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        print(f"DB sessions: {db_sessions.stats()}")
+        print(f"Geocoding: {geocode_stats()}")
+        print(f"Search cache: {search_cache.stats()}")
+
+
+async def on_startup(bot: Bot) -> None:
+    if FSM_STATS_INTERVAL > 0:
+        asyncio.create_task(report_storage_stats(FSM_STATS_INTERVAL))
+    if DB_STATS_INTERVAL > 0:
+        asyncio.create_task(report_db_stats(DB_STATS_INTERVAL))
+    if isinstance(storage, SQLStorage):
+        purged = await storage.purge_expired()
+        print(f"FSM storage: {purged} expired states removed")
+    if GAZETTEER_PATH:
+        count = await asyncio.to_thread(gazetteer.load_csv, GAZETTEER_PATH)
+        print(f"Gazetteer loaded: {count} addresses")
+    async with AsyncSessionLocal() as session:
+        count = await photo_index.load(session)
+    print(f"Photo hash index loaded: {count} photos")
+    if engine.dialect.name != "postgresql":
+        async with AsyncSessionLocal() as session:
+            count = await keyword_index.load(session)
+        print(f"Keyword index loaded: {count} listings")
+    await outbound.start()
+    await nominatim.start()
+    await notifier.start(bot)
+
+
+async def on_shutdown() -> None:
+    await notifier.stop()
+    await nominatim.close()
+    await outbound.stop()
+
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+
+def create_bot() -> Bot:
     bot = Bot(token=TELEGRAM_TOKEN)
+    bot.session.middleware(outbound)
+    return bot
+
+
+async def main():
+    bot = create_bot()
     print("Bot is running...")
     await dp.start_polling(bot, skip_updates=True)
+
+
+async def webhook_main():
+    """
+    Запускает бота в режиме webhook: aiohttp-сервер принимает апдейты
+    и передает их пулу воркеров (см. telegram.webhook).
+    """
+    if not WEBHOOK_URL:
+        raise ValueError("Для режима webhook нужно указать WEBHOOK_URL.")
+    bot = create_bot()
+    workers = UpdateWorkers(dp, bot, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    await workers.start()
+    try:
+        await serve_webhook(bot, workers)
+    finally:
+        await workers.stop()
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await bot.session.close()
+
+
+async def serve_webhook(bot: Bot, workers) -> None:
+    """
+    Принимает апдейты webhook'ом и передает их workers (UpdateWorkers
+    или cluster.ShardRouter), пока задачу не отменят.
+    """
+    app = create_app(
+        workers, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_ENQUEUE_TIMEOUT)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    await bot.set_webhook(
+        WEBHOOK_URL + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True
+    )
+    print(f"Bot is running (webhook on port {WEBHOOK_PORT})...")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def cluster_main():
+    """
+    Запускает бота в нескольких процессах (см. telegram.cluster). Этот
+    процесс только принимает апдейты: webhook'ом, если задан WEBHOOK_URL,
+    иначе long polling'ом.
+    """
+    count = CLUSTER_PROCESSES or os.cpu_count() or 1
+    processes, inboxes, _ = cluster.start_shards(
+        count, CLUSTER_QUEUE_SIZE, shard_worker)
+    bot = Bot(token=TELEGRAM_TOKEN)
+    router = cluster.ShardRouter(bot, inboxes)
+    print(f"Bot is running in {count} processes...")
+    try:
+        if WEBHOOK_URL:
+            await serve_webhook(bot, router)
+        else:
+            await cluster.poll_updates(
+                bot, router, dp.resolve_used_update_types(),
+                WEBHOOK_ENQUEUE_TIMEOUT)
+    finally:
+        await cluster.stop_shards(processes, inboxes)
+        await bot.session.close()
+
+
+def shard_worker(index: int, inbox, event_queues: list) -> None:
+    """Точка входа процесса-воркера номер index."""
+    events.connect(
+        index, len(event_queues),
+        [q for i, q in enumerate(event_queues) if i != index])
+    asyncio.run(_run_shard(inbox, event_queues[index]))
+
+
+async def _run_shard(inbox, event_inbox) -> None:
+    # Лимиты Telegram и Nominatim общие для всех процессов.
+    rate = OUTBOUND_RATE / events.shard_count
+    outbound.bot_bucket = TokenBucket(rate, capacity=rate)
+    nominatim.limiter = TokenBucket(NOMINATIM_RATE / events.shard_count)
+
+    bot = create_bot()
+    workers = UpdateWorkers(dp, bot, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    await workers.start()
+    listener = asyncio.create_task(cluster.receive_events(event_inbox))
+    try:
+        await cluster.receive_updates(inbox, workers)
+    finally:
+        listener.cancel()
+        await workers.stop()
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await bot.session.close()
@@ -0,0 +1,101 @@
+"""
+Сборка альбомов (media group) из отдельных апдейтов.
+
+Альбом из N фотографий Telegram присылает N отдельными сообщениями с
+общим media_group_id. MediaGroupBuffer копит их и, когда новых сообщений
+альбома не было delay секунд, один раз вызывает обработчик со всем
+альбомом. Апдейт при этом не ждет: обработчик сообщения только кладет его
+в буфер, поэтому пул обработки (см. telegram.webhook) не простаивает.
+
+Обработчики альбомов и одиночных сообщений одного чата выполняются под
+общей блокировкой lock(chat_id), так что их чтение-запись состояния FSM
+не перемешиваются. Апдейты чата всегда приходят в один процесс (см.
+telegram.cluster), поэтому блокировки в памяти процесса достаточно.
+Отложенный обработчик альбома выполняется в пустом контексте, вне
+снимка состояний апдейта (см. telegram.fsm_storage).
+"""
+import asyncio
+import contextvars
+import weakref
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import types
+
+from telegram.config import MEDIA_GROUP_DELAY
+
+
+AlbumHandler = Callable[[List[types.Message]], Awaitable[None]]
+
+
+class _Album:
+    def __init__(self, handler: AlbumHandler) -> None:
+        self.handler = handler
+        self.messages: List[types.Message] = []
+        self.timer: asyncio.Task = None
+
+
+class MediaGroupBuffer:
+    """
+    Буфер альбомов.
+
+    Параметры:
+      delay: сколько секунд ждать следующее сообщение альбома.
+    """
+
+    def __init__(self, delay: float = MEDIA_GROUP_DELAY) -> None:
+        self.delay = delay
+        self._albums: Dict[Tuple[int, str], _Album] = {}
+        self._locks = weakref.WeakValueDictionary()
+
+    def lock(self, chat_id: int) -> asyncio.Lock:
+        """Блокировка, под которой выполняются обработчики чата."""
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        return lock
+
+    def add(self, message: types.Message, handler: AlbumHandler) -> None:
+        """
+        Добавляет сообщение в альбом и откладывает вызов handler еще на
+        delay секунд. Вызывается обработчик первого сообщения альбома.
+        """
+        key = (message.chat.id, message.media_group_id)
+        album = self._albums.get(key)
+        if album is None:
+            album = self._albums[key] = _Album(handler)
+        else:
+            album.timer.cancel()
+        album.messages.append(message)
+        # Задача копирует контекст, в котором создана: создаем ее в
+        # пустом, чтобы обработчик шел вне снимка апдейта (аргумент
+        # context у create_task появился только в Python 3.11).
+        album.timer = contextvars.Context().run(
+            asyncio.create_task, self._flush_later(key))
+
+    async def flush(self, chat_id: int) -> None:
+        """
+        Сразу обрабатывает накопленные альбомы чата и дожидается
+        обработчиков, которые уже выполняются.
+        """
+        for key in [key for key in self._albums if key[0] == chat_id]:
+            album = self._albums.pop(key)
+            album.timer.cancel()
+            await self._run(chat_id, album)
+        async with self.lock(chat_id):
+            pass
+
+    async def _flush_later(self, key: Tuple[int, str]) -> None:
+        await asyncio.sleep(self.delay)
+        album = self._albums.pop(key)
+        await self._run(key[0], album)
+
+    async def _run(self, chat_id: int, album: _Album) -> None:
+        messages = sorted(album.messages, key=lambda m: m.message_id)
+        async with self.lock(chat_id):
+            try:
+                await album.handler(messages)
+            except Exception as e:
+                print(f"Media group handler failed: {e!r}")
+
+
+media_groups = MediaGroupBuffer()
@@ -0,0 +1,121 @@
+"""
+Сессия базы данных на время обработки апдейта.
+
+DbSessionMiddleware создает одну AsyncSession (единицу работы) для
+обработчика, у которого есть параметр session, и передает ее ему; CRUD-
+функции получают эту сессию от обработчика и сами не фиксируют
+изменения. После обработчика сессия фиксируется одним commit, а при
+исключении откатывается.
+
+Сессия ленивая: соединение берется из пула только при первом запросе к
+базе и возвращается сразу после commit, поэтому отправка сообщений и
+геокодирование до первого запроса соединение не держат. Апдейт занимает
+не больше одного соединения пула.
+
+Ожидание соединения из пула (pool wait) и время, на которое оно занято
+(hold), накапливаются в stats().
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+
+# Ключи session.info: время первого запроса к базе и получения
+# соединения. Отмечаются только сессии DbSessionMiddleware.
+_REQUESTED = "db_requested_at"
+_CHECKED_OUT = "db_checked_out_at"
+
+
+def _mark_requested(session: Session) -> None:
+    if _REQUESTED in session.info and session.info[_REQUESTED] is None:
+        session.info[_REQUESTED] = time.perf_counter()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_execute(orm_execute_state) -> None:
+    _mark_requested(orm_execute_state.session)
+
+
+@event.listens_for(Session, "before_flush")
+def _on_flush(session: Session, flush_context, instances) -> None:
+    _mark_requested(session)
+
+
+@event.listens_for(Session, "after_begin")
+def _on_checkout(session: Session, transaction, connection) -> None:
+    if _REQUESTED in session.info and _CHECKED_OUT not in session.info:
+        session.info[_CHECKED_OUT] = time.perf_counter()
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Inner middleware сообщений и нажатий кнопок (см. telegram.main).
+
+    Параметры:
+      session_factory: фабрика асинхронных сессий SQLAlchemy.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker) -> None:
+        self.session_factory = session_factory
+        self.sessions = 0
+        self.rollbacks = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if "session" not in data["handler"].params:
+            return await handler(event, data)
+
+        async with self.session_factory() as session:
+            session.info[_REQUESTED] = None
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                self.rollbacks += 1
+                await session.rollback()
+                raise
+            else:
+                await session.commit()
+            finally:
+                self._record(session.info)
+            return result
+
+    def _record(self, info: dict) -> None:
+        checked_out = info.get(_CHECKED_OUT)
+        if checked_out is None:
+            return
+        wait = checked_out - (info[_REQUESTED] or checked_out)
+        hold = time.perf_counter() - checked_out
+        self.sessions += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.hold_total += hold
+        self.hold_max = max(self.hold_max, hold)
+
+    def stats(self) -> dict:
+        """
+        Число апдейтов, обратившихся к базе, и откатов, среднее и
+        максимальное ожидание пула и время, на которое занято соединение.
+        """
+        sessions = max(self.sessions, 1)
+        return {
+            "sessions": self.sessions,
+            "rollbacks": self.rollbacks,
+            "pool_wait_avg": self.wait_total / sessions,
+            "pool_wait_max": self.wait_max,
+            "hold_avg": self.hold_total / sessions,
+            "hold_max": self.hold_max,
+        }
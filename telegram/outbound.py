@@ -0,0 +1,202 @@
+"""
+Общий диспетчер исходящих запросов к Bot API.
+
+Диспетчер подключается к сессии бота как request middleware, поэтому
+через него проходят все вызовы: message.answer, send_media_group,
+callback.answer и т. д. Перед отправкой запрос ждет токен бакета своего
+чата и место в очереди бота; очередь бота выдает токены общего лимита
+сначала интерактивным ответам (ответы на кнопки, сообщения формы), а
+массовые отправки (альбомы, уведомления) получают не меньше одного
+токена из каждых BULK_EVERY, чтобы не ждать бесконечно. На ответ 429
+бакет чата (или всего бота) приостанавливается на retry_after, и
+запрос повторяется. Альбом стоит столько токенов, сколько в нем
+сообщений. Бакеты чатов хранятся в LRU-кэше и вытесняются только самые
+давно не писавшие чаты.
+"""
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware, NextRequestMiddlewareType)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    SendAnimation, SendDocument, SendMediaGroup, SendPhoto, SendVideo,
+    TelegramMethod)
+
+from telegram.cache import TTLCache
+from telegram.config import (
+    OUTBOUND_CHAT_BURST, OUTBOUND_CHAT_RATE, OUTBOUND_RATE, OUTBOUND_RETRIES,
+    OUTBOUND_STATS_INTERVAL)
+from telegram.ratelimit import TokenBucket
+
+
+INTERACTIVE, BULK = 0, 1
+BULK_EVERY = 5
+
+_BULK_METHODS = (
+    SendAnimation, SendDocument, SendMediaGroup, SendPhoto, SendVideo)
+
+_priority: ContextVar[Optional[int]] = ContextVar(
+    "outbound_priority", default=None)
+
+
+@contextmanager
+def bulk_priority():
+    """
+    Все запросы внутри блока отправляются с низким приоритетом
+    (например, рассылка уведомлений).
+    """
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """
+    Request middleware с лимитами бота и чатов и приоритетной очередью.
+    """
+
+    def __init__(
+        self,
+        rate: float = OUTBOUND_RATE,
+        chat_rate: float = OUTBOUND_CHAT_RATE,
+        chat_burst: int = OUTBOUND_CHAT_BURST,
+        retries: int = OUTBOUND_RETRIES
+    ) -> None:
+        self.bot_bucket = TokenBucket(rate, capacity=rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.retries = retries
+        self.sent = 0
+        self.flood_waits = 0
+        self._chat_buckets = TTLCache(maxsize=10000)
+        self._queues = (deque(), deque())
+        self._bulk_skipped = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._reporter: Optional[asyncio.Task] = None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def start(self, stats_interval: float = OUTBOUND_STATS_INTERVAL):
+        """
+        Запускает выдачу токенов и, если stats_interval > 0, печать
+        метрик очередей с этим интервалом.
+        """
+        self._ensure_worker()
+        if stats_interval > 0:
+            self._reporter = asyncio.create_task(self._report(stats_interval))
+
+    async def stop(self) -> None:
+        for task in (self._worker, self._reporter):
+            if task is not None:
+                task.cancel()
+        self._worker = self._reporter = None
+
+    def _next_queue(self) -> Optional[deque]:
+        interactive, bulk = self._queues
+        for queue in self._queues:
+            while queue and queue[0][0].done():
+                queue.popleft()
+        if bulk and (not interactive or self._bulk_skipped >= BULK_EVERY - 1):
+            self._bulk_skipped = 0
+            return bulk
+        if interactive:
+            if bulk:
+                self._bulk_skipped += 1
+            return interactive
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            if self._next_queue() is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self.bot_bucket.acquire()
+            # Пока ждали токен, мог прийти более срочный запрос.
+            queue = self._next_queue()
+            if queue is not None:
+                future, tokens = queue.popleft()
+                # Остальные токены запроса из нескольких сообщений.
+                if tokens > 1:
+                    await self.bot_bucket.acquire(tokens - 1)
+                if not future.done():
+                    future.set_result(None)
+
+    async def _wait_turn(self, priority: int, tokens: int) -> None:
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append((future, tokens))
+        self._wakeup.set()
+        await future
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ):
+        chat_id = getattr(method, "chat_id", None)
+        tokens = (len(method.media) if isinstance(method, SendMediaGroup)
+                  else 1)
+        priority = _priority.get()
+        if priority is None:
+            priority = (BULK if isinstance(method, _BULK_METHODS)
+                        else INTERACTIVE)
+
+        for attempt in range(self.retries + 1):
+            bucket = (self._chat_bucket(chat_id) if chat_id is not None
+                      else self.bot_bucket)
+            if chat_id is not None:
+                await bucket.acquire(tokens)
+            await self._wait_turn(priority, tokens)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.flood_waits += 1
+                if attempt == self.retries:
+                    raise
+                print(f"Flood control ({type(method).__name__}, "
+                      f"chat {chat_id}): retry in {e.retry_after}s")
+                bucket.pause(e.retry_after)
+                continue
+            self.sent += 1
+            return response
+
+    def stats(self) -> dict:
+        """Метрики: глубина очередей и счетчики отправок."""
+        interactive, bulk = (
+            sum(not future.done() for future, _ in queue)
+            for queue in self._queues)
+        return {
+            "interactive_queue": interactive,
+            "bulk_queue": bulk,
+            "sent": self.sent,
+            "flood_waits": self.flood_waits,
+            "chats": len(self._chat_buckets),
+        }
+
+    async def _report(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            print(f"Outbound queues: {self.stats()}")
+
+
+outbound = OutboundDispatcher()
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Асинхронный ограничитель частоты «token bucket».
+
+    Бакет пополняется со скоростью rate токенов в секунду и вмещает не
+    более capacity токенов. acquire() не отклоняет запросы сверх лимита,
+    а ставит их в очередь в порядке поступления.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, tokens: float = 1) -> float:
+        """Возвращает, сколько секунд придется ждать tokens токенов."""
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Ждет, пока в бакете наберется tokens токенов, и забирает их."""
+        async with self._lock:
+            wait = self.delay(tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= tokens
+
+    def pause(self, seconds: float) -> None:
+        """
+        Запрещает выдачу токенов на seconds секунд (например, по
+        retry_after из ответа сервера).
+        """
+        self._refill()
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
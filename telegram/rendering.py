@@ -0,0 +1,257 @@
+"""
+Параллельная отправка страницы объявлений.
+
+Каждое объявление — цепочка вызовов Bot API, которые выполняются строго
+по очереди, поэтому внутри объявления порядок сообщений сохраняется.
+Цепочки разных объявлений идут одновременно; число одновременных
+запросов ограничено семафором. Лимиты Telegram и повторы после 429
+обеспечивает telegram.outbound, через который проходят все запросы бота.
+
+Вид карточки задает LISTING_CARD_MODE:
+  full — альбомы фотографий, затем отдельное сообщение с текстом;
+  compact — текст в подписи первой фотографии альбома, кнопки (если
+    есть) — отдельным сообщением;
+  lazy — одна первая фотография с подписью и кнопками, остальные
+    фотографии загружаются по кнопке «Ещё фото».
+
+При PAGINATION_MODE = edit страница списка — одна карточка-сообщение
+(фото с подписью и кнопками навигации), которое при перелистывании
+редактируется (send_card и edit_card), а не отправляется заново.
+"""
+import asyncio
+import re
+from typing import List, NamedTuple, Optional, Sequence
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from telegram.callbacks import MorePhotos
+from telegram.config import (
+    LISTING_CARD_MODE, PAGINATION_MODE, RENDER_CONCURRENCY)
+
+
+ALBUM_SIZE = 5
+CAPTION_LIMIT = 1024
+
+CARD_FULL, CARD_COMPACT, CARD_LAZY = "full", "compact", "lazy"
+PAGINATION_MESSAGES, PAGINATION_EDIT = "messages", "edit"
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+_semaphore = asyncio.Semaphore(RENDER_CONCURRENCY)
+
+
+class Listing(NamedTuple):
+    """Карточка объявления на странице."""
+    apartment_id: int
+    photo_ids: List[str]
+    text: str
+    reply_markup: Optional[types.InlineKeyboardMarkup] = None
+    parse_mode: Optional[str] = "HTML"
+
+
+def _fits_caption(listing: Listing) -> bool:
+    text = listing.text
+    if listing.parse_mode == "HTML":
+        text = _TAG_RE.sub("", text)
+    return len(text) <= CAPTION_LIMIT
+
+
+async def _call(request):
+    async with _semaphore:
+        return await request
+
+
+async def send_albums(
+    bot: Bot,
+    chat_id: int,
+    photo_ids: List[str],
+    caption: Optional[str] = None,
+    parse_mode: Optional[str] = None
+) -> None:
+    """
+    Отправляет фотографии альбомами по ALBUM_SIZE. caption становится
+    подписью первой фотографии.
+    """
+    for i in range(0, len(photo_ids), ALBUM_SIZE):
+        media = [types.InputMediaPhoto(media=file_id)
+                 for file_id in photo_ids[i:i + ALBUM_SIZE]]
+        if i == 0 and caption is not None:
+            media[0] = types.InputMediaPhoto(
+                media=photo_ids[0], caption=caption, parse_mode=parse_mode)
+        await _call(bot.send_media_group(chat_id=chat_id, media=media))
+
+
+def edit_pagination() -> bool:
+    """Включен ли режим перелистывания одной карточкой."""
+    return PAGINATION_MODE == PAGINATION_EDIT
+
+
+def more_photos_markup(
+    listing: Listing,
+    navigation: Sequence[types.InlineKeyboardButton] = ()
+) -> Optional[types.InlineKeyboardMarkup]:
+    """
+    Кнопки карточки: «Ещё фото» (если фотографий больше одной), кнопки
+    самого объявления и ряд кнопок навигации. None — кнопок нет.
+    """
+    builder = InlineKeyboardBuilder()
+    if len(listing.photo_ids) > 1:
+        builder.button(
+            text=f"📷 Ещё фото ({len(listing.photo_ids) - 1})",
+            callback_data=MorePhotos(id=listing.apartment_id))
+    if listing.reply_markup is not None:
+        builder.attach(
+            InlineKeyboardBuilder.from_markup(listing.reply_markup))
+    if navigation:
+        builder.row(*navigation)
+    if not list(builder.buttons):
+        return None
+    return builder.as_markup()
+
+
+def navigation_buttons(
+    prev_data: Optional[str],
+    next_data: Optional[str]
+) -> List[types.InlineKeyboardButton]:
+    """Кнопки «Назад» и «Далее» (None — кнопки нет)."""
+    buttons = []
+    if prev_data is not None:
+        buttons.append(types.InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=prev_data))
+    if next_data is not None:
+        buttons.append(types.InlineKeyboardButton(
+            text="➡️ Далее", callback_data=next_data))
+    return buttons
+
+
+def _as_photo(listing: Listing) -> bool:
+    return bool(listing.photo_ids) and _fits_caption(listing)
+
+
+async def send_card(
+    bot: Bot,
+    chat_id: int,
+    listing: Listing,
+    navigation: Sequence[types.InlineKeyboardButton] = ()
+) -> types.Message:
+    """
+    Отправляет карточку одним сообщением: первая фотография с подписью
+    (или текст, если фотографий нет либо текст не помещается в подпись)
+    и кнопки карточки с навигацией.
+    """
+    markup = more_photos_markup(listing, navigation)
+    if _as_photo(listing):
+        return await bot.send_photo(
+            chat_id, listing.photo_ids[0], caption=listing.text,
+            parse_mode=listing.parse_mode, reply_markup=markup)
+    return await bot.send_message(
+        chat_id, listing.text, parse_mode=listing.parse_mode,
+        reply_markup=markup)
+
+
+async def edit_card(
+    message: types.Message,
+    listing: Listing,
+    navigation: Sequence[types.InlineKeyboardButton] = (),
+    same_photo: bool = False
+) -> None:
+    """
+    Показывает в сообщении-карточке другое объявление (или обновленное
+    то же самое) одним вызовом edit_message_media, edit_message_caption
+    или edit_message_text.
+
+    Параметры:
+      message: сообщение, отправленное send_card.
+      listing: новая карточка.
+      navigation: кнопки навигации.
+      same_photo: фотография не изменилась — достаточно сменить подпись.
+    """
+    markup = more_photos_markup(listing, navigation)
+    as_photo = _as_photo(listing)
+    try:
+        if as_photo and message.photo and same_photo:
+            await message.edit_caption(
+                caption=listing.text, parse_mode=listing.parse_mode,
+                reply_markup=markup)
+        elif as_photo and message.photo:
+            await message.edit_media(
+                types.InputMediaPhoto(
+                    media=listing.photo_ids[0], caption=listing.text,
+                    parse_mode=listing.parse_mode),
+                reply_markup=markup)
+        elif not as_photo and message.text is not None:
+            await message.edit_text(
+                listing.text, parse_mode=listing.parse_mode,
+                reply_markup=markup)
+        else:
+            # Текстовое сообщение нельзя превратить в фото и наоборот.
+            await send_card(message.bot, message.chat.id, listing, navigation)
+            await message.delete()
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+
+
+async def _send_listing(
+    bot: Bot,
+    chat_id: int,
+    listing: Listing,
+    mode: str
+) -> None:
+    photo_ids, text = listing.photo_ids, listing.text
+    if not photo_ids:
+        await _call(bot.send_message(
+            chat_id, text, parse_mode=listing.parse_mode,
+            reply_markup=listing.reply_markup))
+        return
+    if mode == CARD_FULL or not _fits_caption(listing):
+        await send_albums(bot, chat_id, photo_ids)
+        await _call(bot.send_message(
+            chat_id, text, parse_mode=listing.parse_mode,
+            reply_markup=listing.reply_markup))
+        return
+    if mode == CARD_LAZY:
+        await _call(send_card(bot, chat_id, listing))
+        return
+    # У альбома не бывает кнопок, поэтому они идут следующим сообщением.
+    await send_albums(bot, chat_id, photo_ids, text, listing.parse_mode)
+    if listing.reply_markup is not None:
+        await _call(bot.send_message(
+            chat_id, f"⬆️ Объявление ID: {listing.apartment_id}",
+            reply_markup=listing.reply_markup))
+
+
+async def render_page(
+    bot: Bot,
+    chat_id: int,
+    listings: Sequence[Listing],
+    mode: str = LISTING_CARD_MODE
+) -> int:
+    """
+    Отправляет объявления страницы в чат одновременно, сохраняя порядок
+    сообщений внутри каждого объявления.
+
+    Параметры:
+      bot: бот, через который отправляются сообщения.
+      chat_id: чат получателя.
+      listings: карточки объявлений.
+      mode: вид карточек (CARD_FULL, CARD_COMPACT или CARD_LAZY).
+        Текст длиннее подписи (1024 символа) всегда идет отдельным
+        сообщением.
+
+    Возвращает:
+      Число объявлений, отправленных без ошибок. Ошибка одного
+      объявления не прерывает отправку остальных.
+    """
+    results = await asyncio.gather(
+        *(_send_listing(bot, chat_id, listing, mode) for listing in listings),
+        return_exceptions=True)
+    sent = 0
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Failed to send listing to {chat_id}: {result!r}")
+        else:
+            sent += 1
+    return sent
@@ -0,0 +1,287 @@
+"""
+Сохраненные поиски и уведомления о подходящих новых объявлениях.
+
+Подписки хранятся в базе и при запуске загружаются в SubscriptionIndex.
+Индекс раскладывает их по корзинам (город, комнаты) и внутри корзины
+ищет по дереву интервалов цены, поэтому новое объявление сравнивается
+только с подписками, у которых совпадают город, комнаты и диапазон цены,
+а не со всеми подписками. Остальные фильтры проверяются уже у этих
+кандидатов. Уведомления отправляются фоновой задачей из очереди.
+
+В многопроцессном режиме каждый воркер держит в индексе только подписки
+своих чатов, а новое объявление рассылается остальным воркерам
+событием, и каждый уведомляет своих подписчиков.
+"""
+import asyncio
+import json
+import math
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from telegram import events
+from telegram.gazetteer import normalize_query
+from telegram.outbound import bulk_priority
+from telegram_db.crud import get_saved_searches
+from telegram_db.db import AsyncSessionLocal
+from telegram_db.models import Apartment
+from telegram_db.search import filters_match, is_fuzzy
+
+
+class IntervalTree:
+    """
+    Статическое центрированное дерево интервалов [low, high]: поиск всех
+    интервалов, содержащих точку, за O(log n + k).
+    """
+
+    def __init__(self, intervals: List[Tuple[float, float, int]]) -> None:
+        self.center = None
+        self.left = self.right = None
+        # Пустые интервалы (мин. цена больше макс.) ничему не соответствуют.
+        intervals = [interval for interval in intervals
+                     if interval[0] <= interval[1]]
+        if not intervals:
+            return
+        points = sorted(p for low, high, _ in intervals for p in (low, high))
+        self.center = points[len(points) // 2]
+        to_left, to_right, here = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                to_left.append(interval)
+            elif interval[0] > self.center:
+                to_right.append(interval)
+            else:
+                here.append(interval)
+        self.by_low = sorted(here, key=lambda interval: interval[0])
+        self.by_high = sorted(here, key=lambda interval: -interval[1])
+        self.left = IntervalTree(to_left) if to_left else None
+        self.right = IntervalTree(to_right) if to_right else None
+
+    def stab(self, point: float) -> List[int]:
+        """Возвращает значения всех интервалов, содержащих point."""
+        result = []
+        node = self
+        while node is not None and node.center is not None:
+            if point < node.center:
+                for low, _, value in node.by_low:
+                    if low > point:
+                        break
+                    result.append(value)
+                node = node.left
+            elif point > node.center:
+                for _, high, value in node.by_high:
+                    if high < point:
+                        break
+                    result.append(value)
+                node = node.right
+            else:
+                result.extend(value for _, _, value in node.by_low)
+                break
+        return result
+
+
+class _Bucket:
+    def __init__(self) -> None:
+        self.intervals: Dict[int, Tuple[float, float]] = {}
+        self._tree: Optional[IntervalTree] = None
+
+    def add(self, search_id: int, low: float, high: float) -> None:
+        self.intervals[search_id] = (low, high)
+        self._tree = None
+
+    def remove(self, search_id: int) -> None:
+        if self.intervals.pop(search_id, None) is not None:
+            self._tree = None
+
+    def stab(self, price: float) -> List[int]:
+        if self._tree is None:
+            # Дерево перестраивается лениво, при первом поиске после
+            # изменения корзины.
+            self._tree = IntervalTree([
+                (low, high, search_id)
+                for search_id, (low, high) in self.intervals.items()
+            ])
+        return self._tree.stab(price)
+
+
+def _price_bound(filters: dict, key: str, default: float) -> float:
+    try:
+        return float(filters[key]) if filters.get(key) else default
+    except ValueError:
+        return default
+
+
+class SubscriptionIndex:
+    """
+    Индекс сохраненных поисков для сопоставления с новым объявлением.
+
+    Ключ корзины — (город, комнаты); None означает «любой». Город хранится
+    нормализованным, а при поиске перебираются все подстроки города
+    объявления, что повторяет семантику ILIKE '%город%'. Подписки
+    с нечетким поиском по городу лежат в корзине «любой город».
+    """
+
+    def __init__(self) -> None:
+        self._buckets: Dict[tuple, _Bucket] = {}
+        self._subscriptions: Dict[int, tuple] = {}
+        self._city_lengths: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def _bucket_key(self, filters: dict) -> tuple:
+        city = normalize_query(filters.get("город") or "") or None
+        if city is not None and is_fuzzy(filters):
+            city = None
+        try:
+            rooms = int(filters["комнаты"]) if filters.get("комнаты") else None
+        except ValueError:
+            rooms = None
+        return city, rooms
+
+    def add(
+        self,
+        search_id: int,
+        user_id: str,
+        chat_id: str,
+        filters: dict
+    ) -> None:
+        """Добавляет (или заменяет) сохраненный поиск."""
+        self.remove(search_id)
+        key = self._bucket_key(filters)
+        self._buckets.setdefault(key, _Bucket()).add(
+            search_id,
+            _price_bound(filters, "цена мин", -math.inf),
+            _price_bound(filters, "цена макс", math.inf))
+        self._subscriptions[search_id] = (key, user_id, chat_id, filters)
+        if key[0] is not None:
+            length = len(key[0])
+            self._city_lengths[length] = self._city_lengths.get(length, 0) + 1
+
+    def remove(self, search_id: int) -> None:
+        """Удаляет сохраненный поиск из индекса."""
+        subscription = self._subscriptions.pop(search_id, None)
+        if subscription is None:
+            return
+        key = subscription[0]
+        self._buckets[key].remove(search_id)
+        if not self._buckets[key].intervals:
+            del self._buckets[key]
+        if key[0] is not None:
+            length = len(key[0])
+            self._city_lengths[length] -= 1
+            if not self._city_lengths[length]:
+                del self._city_lengths[length]
+
+    def _city_keys(self, city: str) -> set:
+        """Все подстроки города, длина которых встречается в подписках."""
+        city = normalize_query(city or "")
+        keys = {None}
+        for length in self._city_lengths:
+            keys.update(
+                city[start:start + length]
+                for start in range(len(city) - length + 1))
+        return keys
+
+    def match(self, apartment: Apartment) -> List[Tuple[int, str, str]]:
+        """
+        Возвращает подписки, под которые подходит объявление, в виде
+        (id поиска, id пользователя, id чата).
+        """
+        if not apartment.is_available:
+            return []
+        matches = []
+        for city_key in self._city_keys(apartment.city):
+            for rooms_key in (apartment.rooms, None):
+                bucket = self._buckets.get((city_key, rooms_key))
+                if bucket is None:
+                    continue
+                for search_id in bucket.stab(apartment.price):
+                    _, user_id, chat_id, filters = (
+                        self._subscriptions[search_id])
+                    if filters_match(filters, apartment):
+                        matches.append((search_id, user_id, chat_id))
+        return matches
+
+
+class Notifier:
+    """
+    Очередь уведомлений о новых объявлениях. Сопоставление выполняется
+    сразу, а отправка сообщений — фоновой задачей с низким приоритетом,
+    не задерживая обработчик, создавший объявление, и ответы другим
+    пользователям.
+    """
+
+    def __init__(self, index: SubscriptionIndex) -> None:
+        self.index = index
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        events.on("apartment_published", self._on_published)
+
+    async def start(self, bot: Bot) -> None:
+        """Загружает подписки из базы и запускает отправку уведомлений."""
+        async with AsyncSessionLocal() as session:
+            saved_searches = await get_saved_searches(session)
+        for saved_search in saved_searches:
+            if not events.owns(saved_search.chat_id):
+                continue
+            self.index.add(
+                saved_search.id,
+                saved_search.user_id,
+                saved_search.chat_id,
+                json.loads(saved_search.filters))
+        self._worker = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def publish(self, apartment: Apartment) -> int:
+        """
+        Ставит в очередь уведомления всем подписчикам, которым подходит
+        объявление (кроме его владельца), и передает объявление остальным
+        воркерам. Возвращает число уведомлений в этом процессе.
+        """
+        events.emit("apartment_published", {
+            column.name: getattr(apartment, column.name)
+            for column in Apartment.__table__.columns})
+        return self._notify(apartment)
+
+    def _notify(self, apartment: Apartment) -> int:
+        notified_chats = set()
+        for _, user_id, chat_id in self.index.match(apartment):
+            if user_id == apartment.owner_id or chat_id in notified_chats:
+                continue
+            notified_chats.add(chat_id)
+            self._queue.put_nowait((chat_id, format_notification(apartment)))
+        return len(notified_chats)
+
+    def _on_published(self, columns: dict) -> None:
+        self._notify(Apartment(**columns))
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            chat_id, text = await self._queue.get()
+            try:
+                with bulk_priority():
+                    await bot.send_message(chat_id, text, parse_mode="HTML")
+            except Exception as e:
+                print(f"Notification to {chat_id} failed: {e!r}")
+            finally:
+                self._queue.task_done()
+
+
+def format_notification(apartment: Apartment) -> str:
+    return (
+        "🔔 <b>Новое объявление по вашему поиску</b>\n\n"
+        f"📢 <b>Объявление ID:</b> {apartment.id}\n"
+        f"🏠 <b>Город:</b> {apartment.city}\n"
+        f"🏠 <b>Адрес:</b> {apartment.address}\n"
+        f"🛏️ <b>Комнат:</b> {apartment.rooms}\n"
+        f"💰 <b>Цена:</b> {apartment.price} руб.\n"
+    )
+
+
+subscriptions = SubscriptionIndex()
+notifier = Notifier(subscriptions)
@@ -0,0 +1,155 @@
+"""
+Прием апдейтов через webhook.
+
+HTTP-обработчик проверяет секрет, разбирает апдейт и сразу отвечает
+Telegram, а обработка идет в пуле воркеров UpdateWorkers. Апдейты
+распределяются по воркерам по id чата, поэтому апдейты одного чата
+обрабатываются по очереди, в порядке поступления, а разные чаты —
+параллельно. У каждого воркера ограниченная очередь: если она
+заполнена и не освобождается за enqueue_timeout, обработчик отвечает
+503, и Telegram повторит доставку позже.
+"""
+import asyncio
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+from pydantic import ValidationError
+
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_chat_id(update: types.Update) -> int:
+    """
+    Возвращает id чата апдейта (или пользователя, если чата нет), по
+    которому апдейт закрепляется за воркером.
+    """
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        chat = getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else update.update_id
+
+
+class UpdateWorkers:
+    """
+    Пул воркеров, обрабатывающих апдейты через dispatcher.feed_update.
+
+    Параметры:
+      dispatcher: диспетчер aiogram.
+      bot: бот, от имени которого обрабатываются апдейты.
+      workers: число воркеров.
+      queue_size: длина очереди одного воркера.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        workers: int,
+        queue_size: int
+    ) -> None:
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._queues = [asyncio.Queue(queue_size) for _ in range(workers)]
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._run(queue)) for queue in self._queues]
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Дожидается обработки очередей (не дольше timeout) и
+        останавливает воркеры.
+        """
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout)
+        except asyncio.TimeoutError:
+            print("Webhook workers stopped with unprocessed updates")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def submit(
+        self,
+        update: types.Update,
+        timeout: float
+    ) -> bool:
+        """
+        Ставит апдейт в очередь воркера его чата. Возвращает False, если
+        очередь не освободилась за timeout секунд.
+        """
+        queue = self._queues[update_chat_id(update) % len(self._queues)]
+        try:
+            queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(queue.put(update), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            update = await queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Update {update.update_id} failed: {e!r}")
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict:
+        """Метрики: глубина очередей и счетчики апдейтов."""
+        sizes = [queue.qsize() for queue in self._queues]
+        return {
+            "queued": sum(sizes),
+            "max_queue": max(sizes),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+def create_app(
+    workers: UpdateWorkers,
+    path: str,
+    secret: Optional[str],
+    enqueue_timeout: float
+) -> web.Application:
+    """
+    Создает aiohttp-приложение с обработчиком webhook по пути path.
+    """
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        try:
+            update = types.Update.model_validate(
+                await request.json(), context={"bot": workers.bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+        if not await workers.submit(update, enqueue_timeout):
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    return app
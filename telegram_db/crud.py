@@ -1,12 +1,35 @@
-from sqlalchemy import select
+import datetime
+import json
+from typing import Iterable, NamedTuple, Optional
+
+from sqlalchemy import delete, func, insert, or_, select, update
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from telegram_db.models import Apartment, Photo
-from telegram_db.db import AsyncSessionLocal
+from telegram_db.models import (
+    Apartment, FilterSet, GeocodeCache, Photo, SavedSearch)
+from telegram_db.db import after_commit, upsert
+from telegram_db.dedup import (
+    index_photo_hashes, listing_fingerprint, photo_index)
+from telegram_db.geo import geo_cell
+from telegram_db.keyword_index import index_descriptions, unindex_apartments
+from telegram_db.search import filters_hash
+from telegram_db.search_cache import invalidate_search_cache
+
+
+MAX_PHOTOS = 15
+
+
+class ApartmentNotFoundError(ValueError):
+    """Объявления с таким id нет."""
+
+
+class ApartmentAccessError(ValueError):
+    """Объявление принадлежит другому пользователю."""
 
 
 async def create_apartment(
+    session: AsyncSession,
     owner_id: str,
     city: str,
     street: str,
@@ -16,13 +39,19 @@ async def create_apartment(
     rooms: int,
     description: str,
     photo_file_ids: list = None,
-    is_available: bool = True
+    is_available: bool = True,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    photo_unique_ids: list = None,
+    photo_hashes: list = None
 ) -> Apartment:
     """
     Создает новое объявление о квартире и, если передан список фотографий,
     сразу добавляет их к объявлению.
 
     Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy; фиксирует
+        изменения вызывающий код.
       owner_id (str): Telegram ID пользователя, который публикует объявление.
       city (str): Город, где находится квартира.
       street: (str): Улица, где находится квартираю.
@@ -33,58 +62,303 @@ async def create_apartment(
       description (str): Описание квартиры.
       photo_file_ids (list): Список идентификаторов файлов фотографий.
       is_available (bool): Статус доступности.
+      latitude (float): Широта дома, если известна.
+      longitude (float): Долгота дома, если известна.
+      photo_unique_ids (list): file_unique_id фотографий в порядке
+        photo_file_ids.
+      photo_hashes (list): Перцептивные хэши фотографий (или None) в
+        порядке photo_file_ids.
 
     Возвращает:
       Apartment: Объект объявления, сохраненный в базе данных.
     """
-    if photo_file_ids and len(photo_file_ids) > 15:
-        raise ValueError("Можно загрузить максимум 15 фотографий.")
-
-    async with AsyncSessionLocal() as session:
-        new_apartment = Apartment(
-            owner_id=owner_id,
-            city=city,
-            street=street,
-            address=address,
-            price=price,
-            storey=storey,
-            rooms=rooms,
-            description=description,
-            is_available=is_available
-        )
+    if photo_file_ids and len(photo_file_ids) > MAX_PHOTOS:
+        raise ValueError(
+            f"Можно загрузить максимум {MAX_PHOTOS} фотографий.")
 
-        if photo_file_ids:
-            for file_id in photo_file_ids:
-                photo = Photo(file_id=file_id)
-                new_apartment.photos.append(photo)
+    photo_file_ids = photo_file_ids or []
+    photo_unique_ids = photo_unique_ids or [None] * len(photo_file_ids)
+    photo_hashes = photo_hashes or [None] * len(photo_file_ids)
+    new_apartment = Apartment(
+        owner_id=owner_id,
+        city=city,
+        street=street,
+        address=address,
+        price=price,
+        storey=storey,
+        rooms=rooms,
+        description=description,
+        is_available=is_available,
+        fingerprint=listing_fingerprint(address, price, rooms, storey),
+        photos=[
+            Photo(file_id=file_id, file_unique_id=unique_id, phash=phash)
+            for file_id, unique_id, phash in zip(
+                photo_file_ids, photo_unique_ids, photo_hashes)]
+    )
+    if latitude is not None and longitude is not None:
+        new_apartment.latitude = latitude
+        new_apartment.longitude = longitude
+        new_apartment.geo_cell = geo_cell(latitude, longitude)
 
-        session.add(new_apartment)
-        await session.commit()
-        await session.refresh(new_apartment)
-        return new_apartment
+    session.add(new_apartment)
+    await session.flush()
+    after_commit(session, index_descriptions,
+                 [(new_apartment.id, new_apartment.description)])
+    after_commit(session, invalidate_search_cache,
+                 new_apartment.id, new_apartment.city)
+    hashes = [(phash, new_apartment.id)
+              for phash in photo_hashes if phash is not None]
+    if hashes:
+        after_commit(session, index_photo_hashes, hashes)
+    return new_apartment
 
 
-async def get_apartments_by_owner(owner_id: str) -> list[Apartment]:
+async def find_duplicate(
+    session: AsyncSession,
+    address: str,
+    price: float,
+    rooms: int,
+    storey: Optional[int],
+    photo_unique_ids: Optional[list] = None,
+    photo_hashes: Optional[list] = None
+) -> Optional[int]:
     """
-    Возвращает список объявлений для указанного владельца.
+    Ищет доступное объявление, повтором которого было бы новое: с тем же
+    отпечатком, с той же фотографией (file_unique_id) или с почти
+    такой же фотографией (см. telegram_db.dedup).
 
     Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      address, price, rooms, storey: поля нового объявления.
+      photo_unique_ids (list): file_unique_id его фотографий.
+      photo_hashes (list): перцептивные хэши его фотографий (или None).
+
+    Возвращает:
+      Optional[int]: id найденного объявления или None.
+    """
+    conditions = [Apartment.fingerprint == listing_fingerprint(
+        address, price, rooms, storey)]
+    unique_ids = [unique_id for unique_id in photo_unique_ids or ()
+                  if unique_id]
+    if unique_ids:
+        conditions.append(Apartment.id.in_(
+            select(Photo.apartment_id)
+            .where(Photo.file_unique_id.in_(unique_ids))))
+    similar = set()
+    for phash in photo_hashes or ():
+        if phash is not None:
+            similar |= photo_index.search(phash)
+    if similar:
+        conditions.append(Apartment.id.in_(similar))
+
+    return await session.scalar(
+        select(Apartment.id)
+        .where(Apartment.is_available, or_(*conditions))
+        .order_by(Apartment.id)
+        .limit(1))
+
+
+async def find_fingerprints(
+    session: AsyncSession,
+    fingerprints: Iterable[str]
+) -> set:
+    """Возвращает те отпечатки, которые уже есть у доступных объявлений."""
+    result = await session.scalars(
+        select(Apartment.fingerprint).where(
+            Apartment.is_available,
+            Apartment.fingerprint.in_(set(fingerprints))))
+    return set(result)
+
+
+async def bulk_create_apartments(
+    session: AsyncSession,
+    apartments: list[dict]
+) -> list[int]:
+    """
+    Вставляет объявления многострочными INSERT ... RETURNING id, а их
+    фотографии — одним многострочным INSERT. Транзакцию фиксирует
+    вызывающий код; этим задается размер пачки.
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      apartments (list): словари с полями Apartment (owner_id, city,
+        street, address, price, storey, rooms, description, latitude,
+        longitude) и списком file_id фотографий в photo_file_ids.
+
+    Возвращает:
+      List[int]: id созданных объявлений в порядке apartments.
+    """
+    rows = []
+    for apartment in apartments:
+        row = {key: value for key, value in apartment.items()
+               if key != "photo_file_ids"}
+        row.setdefault("is_available", True)
+        row.setdefault("created_at", datetime.datetime.utcnow())
+        row["fingerprint"] = listing_fingerprint(
+            row["address"], row["price"], row["rooms"], row.get("storey"))
+        latitude, longitude = row.get("latitude"), row.get("longitude")
+        row["geo_cell"] = (
+            geo_cell(latitude, longitude)
+            if latitude is not None and longitude is not None else None)
+        rows.append(row)
+
+    result = await session.execute(
+        insert(Apartment).returning(
+            Apartment.id, sort_by_parameter_order=True),
+        rows)
+    ids = list(result.scalars())
+
+    photos = [
+        {"apartment_id": apartment_id, "file_id": file_id}
+        for apartment_id, apartment in zip(ids, apartments)
+        for file_id in apartment.get("photo_file_ids") or ()
+    ]
+    if photos:
+        await session.execute(insert(Photo), photos)
+
+    after_commit(session, index_descriptions, [
+        (apartment_id, row.get("description"))
+        for apartment_id, row in zip(ids, rows)])
+    for city in {row["city"] for row in rows}:
+        after_commit(session, invalidate_search_cache, None, city)
+    return ids
+
+
+class OwnerPage(NamedTuple):
+    """Страница объявлений владельца."""
+    apartments: list[Apartment]
+    total: int
+    page: int
+
+
+def _owner_page_statement(owner_id: str, offset: int, limit: int):
+    # count(*) OVER () считает все объявления владельца до LIMIT, поэтому
+    # страница и общее число приходят одним запросом.
+    return (
+        select(Apartment, func.count().over().label("total"))
+        .where(Apartment.owner_id == owner_id)
+        .options(selectinload(Apartment.photos))
+        .order_by(Apartment.id)
+        .offset(offset)
+        .limit(limit)
+    )
+
+
+async def get_owner_page(
+    session: AsyncSession,
+    owner_id: str,
+    page: int,
+    page_size: int
+) -> OwnerPage:
+    """
+    Возвращает страницу объявлений владельца и их общее число одним
+    запросом; фотографии загружаются следующим запросом только для
+    объявлений страницы.
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
       owner_id (str): Telegram ID пользователя, который публиковал объявления.
+      page (int): номер страницы с нуля.
+      page_size (int): число объявлений на странице.
 
     Возвращает:
-      List[Apartment]: Список объектов Apartment, опубликованных данным
-        пользователем.
-    """
-    async with AsyncSessionLocal() as session:
-        stmt = (
-            select(Apartment)
-            .where(Apartment.owner_id == owner_id)
-            .options(selectinload(Apartment.photos))
-            .order_by(Apartment.id)
-        )
-        result = await session.execute(stmt)
-        apartments = result.scalars().all()
-        return apartments
+      OwnerPage: объявления страницы, их общее число и номер страницы.
+      Если страницы page уже нет (например, после удаления последнего
+      объявления), возвращается последняя страница.
+    """
+    result = await session.execute(
+        _owner_page_statement(owner_id, page * page_size, page_size))
+    rows = result.all()
+    if not rows and page > 0:
+        total = await session.scalar(
+            select(func.count(Apartment.id))
+            .where(Apartment.owner_id == owner_id))
+        if not total:
+            return OwnerPage([], 0, 0)
+        page = (total - 1) // page_size
+        result = await session.execute(
+            _owner_page_statement(owner_id, page * page_size, page_size))
+        rows = result.all()
+    total = rows[0].total if rows else 0
+    return OwnerPage([row.Apartment for row in rows], total, page)
+
+
+async def get_apartment_photo_ids(
+    session: AsyncSession,
+    apartment_id: int,
+    viewer_id: str
+) -> list[str]:
+    """
+    Возвращает file_id фотографий объявления в порядке загрузки. Как и в
+    поиске, фотографии снятого с публикации объявления видит только его
+    владелец; остальным возвращается пустой список.
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      apartment_id (int): id объявления.
+      viewer_id (str): Telegram ID пользователя, который смотрит фото.
+    """
+    result = await session.execute(
+        select(Photo.file_id)
+        .join(Apartment, Apartment.id == Photo.apartment_id)
+        .where(
+            Photo.apartment_id == apartment_id,
+            or_(Apartment.is_available, Apartment.owner_id == viewer_id))
+        .order_by(Photo.id)
+    )
+    return list(result.scalars())
+
+
+async def _ownership_error(
+    session: AsyncSession,
+    apartment_id: int,
+    message: str
+) -> ValueError:
+    """
+    Объясняет, почему запрос владельца не затронул объявление: его нет
+    или оно чужое. Выполняется только в этом редком случае.
+    """
+    exists = await session.scalar(
+        select(Apartment.id).where(Apartment.id == apartment_id))
+    if exists is None:
+        return ApartmentNotFoundError(
+            f"Объявление с id {apartment_id} не найдено.")
+    return ApartmentAccessError(message)
+
+
+async def delete_apartments(
+    session: AsyncSession,
+    apartment_ids: Iterable[int],
+    owner_id: str
+) -> list[int]:
+    """
+    Удаляет объявления владельца одним запросом
+    DELETE ... WHERE id IN (...) AND owner_id = ... RETURNING; фотографии
+    удаляет база (ON DELETE CASCADE).
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      apartment_ids: идентификаторы объявлений.
+      owner_id (str): Telegram ID владельца.
+
+    Возвращает:
+      List[int]: id удаленных объявлений. Несуществующие и чужие
+      объявления пропускаются.
+    """
+    result = await session.execute(
+        delete(Apartment)
+        .where(
+            Apartment.id.in_(list(apartment_ids)),
+            Apartment.owner_id == owner_id)
+        .returning(Apartment.id, Apartment.city)
+    )
+    deleted = result.all()
+    if deleted:
+        after_commit(session, unindex_apartments,
+                     [apartment_id for apartment_id, _ in deleted])
+    for apartment_id, city in deleted:
+        after_commit(session, invalidate_search_cache, apartment_id, city)
+    return [apartment_id for apartment_id, _ in deleted]
 
 
 async def delete_apartment(
@@ -103,26 +377,54 @@ async def delete_apartment(
         удалить объявление.
 
     Возвращает:
-      None. Если объявление не найдено или не принадлежит владельцу,
-      выбрасывает ValueError.
+      None. Если объявление не найдено, выбрасывает
+      ApartmentNotFoundError, если оно чужое — ApartmentAccessError.
     """
-    result = await session.execute(
-        select(Apartment).where(Apartment.id == apartment_id))
-    apartment = result.scalar_one_or_none()
-    if apartment is None:
-        raise ValueError(f"Объявление с id {apartment_id} не найдено.")
-    if apartment.owner_id != owner_id:
-        raise ValueError("Нельзя удалить чужое объявление.")
+    if not await delete_apartments(session, [apartment_id], owner_id):
+        raise await _ownership_error(
+            session, apartment_id, "Нельзя удалить чужое объявление.")
+
+
+async def toggle_apartments_availability(
+    session: AsyncSession,
+    apartment_ids: Iterable[int],
+    owner_id: str
+) -> list[Apartment]:
+    """
+    Переключает доступность объявлений владельца одним запросом
+    UPDATE ... SET is_available = NOT is_available ... RETURNING, поэтому
+    одновременные нажатия не теряют изменений.
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      apartment_ids: идентификаторы объявлений.
+      owner_id (str): Telegram ID владельца.
 
-    await session.delete(apartment)
-    await session.commit()
+    Возвращает:
+      List[Apartment]: обновленные объявления. Несуществующие и чужие
+      объявления пропускаются.
+    """
+    result = await session.scalars(
+        update(Apartment)
+        .where(
+            Apartment.id.in_(list(apartment_ids)),
+            Apartment.owner_id == owner_id)
+        .values(is_available=~Apartment.is_available)
+        .returning(Apartment),
+        execution_options={"populate_existing": True}
+    )
+    apartments = list(result)
+    for apartment in apartments:
+        after_commit(
+            session, invalidate_search_cache, apartment.id, apartment.city)
+    return apartments
 
 
 async def update_apartment_availability(
     session: AsyncSession, apartment_id: int, owner_id: str,
 ) -> Apartment:
     """
-    Обновляет поле is_available для объявления
+    Переключает поле is_available для объявления
     по его идентификатору, если оно принадлежит указанному владельцу.
 
     Параметры:
@@ -130,22 +432,166 @@ async def update_apartment_availability(
       apartment_id (int): идентификатор объявления.
       owner_id (str): Telegram ID пользователя, который пытается
         обновить объявление.
-      is_available (bool): новое значение для поля доступности.
 
     Возвращает:
-      Обновленный объект Apartment. Если объявление не найдено или не
-      принадлежит владельцу, выбрасывает ValueError.
+      Обновленный объект Apartment. Если объявление не найдено,
+      выбрасывает ApartmentNotFoundError, если оно чужое —
+      ApartmentAccessError.
     """
+    apartments = await toggle_apartments_availability(
+        session, [apartment_id], owner_id)
+    if not apartments:
+        raise await _ownership_error(
+            session, apartment_id,
+            "Нельзя изменить доступность чужого объявления.")
+    return apartments[0]
+
+
+async def get_cached_geocode(
+    session: AsyncSession,
+    query: str,
+    max_age: datetime.timedelta,
+    negative_max_age: Optional[datetime.timedelta] = None
+) -> Optional[list]:
+    """
+    Возвращает сохраненный результат геокодирования для нормализованного
+    запроса, если он не старше max_age.
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      query (str): нормализованный текст запроса.
+      max_age (timedelta): допустимый возраст записи.
+      negative_max_age (timedelta): допустимый возраст пустого
+        результата, если он меньше max_age.
+
+    Возвращает:
+      Список адресов или None, если записи нет или она устарела.
+    """
+    now = datetime.datetime.utcnow()
     result = await session.execute(
-        select(Apartment).where(Apartment.id == apartment_id))
-    apartment = result.scalar_one_or_none()
-    if apartment is None:
-        raise ValueError(f"Объявление с id {apartment_id} не найдено.")
-    if apartment.owner_id != owner_id:
-        raise ValueError("Нельзя изменить доступность чужого объявления.")
-
-    apartment.is_available = not apartment.is_available
-
-    await session.commit()
-    await session.refresh(apartment)
-    return apartment
+        select(GeocodeCache).where(
+            GeocodeCache.query == query,
+            GeocodeCache.created_at >= now - max_age
+        )
+    )
+    entry = result.scalar_one_or_none()
+    if entry is None:
+        return None
+    addresses = json.loads(entry.result)
+    if (not addresses and negative_max_age is not None
+            and entry.created_at < now - negative_max_age):
+        return None
+    return addresses
+
+
+async def save_cached_geocode(
+    session: AsyncSession,
+    query: str,
+    addresses: list
+) -> None:
+    """
+    Сохраняет (или перезаписывает) результат геокодирования для
+    нормализованного запроса.
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      query (str): нормализованный текст запроса.
+      addresses (list): найденные варианты адресов.
+    """
+    await session.execute(upsert(
+        session.bind.dialect.name,
+        GeocodeCache.__table__,
+        {
+            "query": query,
+            "result": json.dumps(addresses, ensure_ascii=False),
+            "created_at": datetime.datetime.utcnow(),
+        },
+        index_elements=["query"]
+    ))
+
+
+async def create_saved_search(
+    session: AsyncSession,
+    user_id: str,
+    chat_id: str,
+    filters: dict
+) -> SavedSearch:
+    """
+    Сохраняет набор фильтров поиска как подписку на новые объявления.
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      user_id (str): Telegram ID пользователя.
+      chat_id (str): чат, в который отправлять уведомления.
+      filters (dict): фильтры поиска.
+
+    Возвращает:
+      SavedSearch: сохраненная подписка.
+    """
+    saved_search = SavedSearch(
+        user_id=user_id,
+        chat_id=chat_id,
+        filters=json.dumps(filters, ensure_ascii=False)
+    )
+    session.add(saved_search)
+    await session.flush()
+    return saved_search
+
+
+async def get_saved_searches(
+    session: AsyncSession,
+    user_id: Optional[str] = None
+) -> list:
+    """
+    Возвращает сохраненные поиски пользователя или, если user_id не
+    указан, все сохраненные поиски.
+    """
+    stmt = select(SavedSearch).order_by(SavedSearch.id)
+    if user_id is not None:
+        stmt = stmt.where(SavedSearch.user_id == user_id)
+    result = await session.execute(stmt)
+    return result.scalars().all()
+
+
+async def delete_saved_search(
+    session: AsyncSession,
+    search_id: int,
+    user_id: str
+) -> None:
+    """
+    Удаляет сохраненный поиск, если он принадлежит пользователю.
+    Иначе выбрасывает ValueError.
+    """
+    saved_search = await session.get(SavedSearch, search_id)
+    if saved_search is None or saved_search.user_id != user_id:
+        raise ValueError(f"Сохраненный поиск {search_id} не найден.")
+    await session.delete(saved_search)
+    await session.flush()
+
+
+async def save_filter_set(session: AsyncSession, filters: dict) -> str:
+    """
+    Сохраняет набор фильтров поиска и возвращает его хэш, по которому
+    кнопки перелистывания находят фильтры без состояния FSM.
+    """
+    filters_key = filters_hash(filters)
+    await session.execute(upsert(
+        session.bind.dialect.name,
+        FilterSet.__table__,
+        {
+            "hash": filters_key,
+            "filters": json.dumps(filters, ensure_ascii=False),
+            "created_at": datetime.datetime.utcnow(),
+        },
+        index_elements=["hash"]
+    ))
+    return filters_key
+
+
+async def get_filter_set(
+    session: AsyncSession,
+    filters_key: str
+) -> Optional[dict]:
+    """Возвращает набор фильтров по хэшу или None."""
+    filter_set = await session.get(FilterSet, filters_key)
+    return json.loads(filter_set.filters) if filter_set else None
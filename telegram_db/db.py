@@ -1,12 +1,26 @@
+from typing import Any, Callable
+
+from sqlalchemy import Table, event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import Insert
 
-from telegram_db.models import Base
+from telegram_db.migrations import migrate
 from telegram.config import DATABASE_URL
 
 
 engine = create_async_engine(DATABASE_URL, echo=True)
 
+if engine.dialect.name == "sqlite":
+    # SQLite проверяет внешние ключи (и выполняет ON DELETE CASCADE),
+    # только если это включено для соединения.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     expire_on_commit=False,
@@ -14,6 +28,54 @@ AsyncSessionLocal = sessionmaker(
 )
 
 
+def after_commit(
+    session: AsyncSession,
+    callback: Callable[..., Any],
+    *args: Any
+) -> None:
+    """
+    Откладывает callback(*args) до фиксации транзакции сессии: кэши
+    сбрасываются и уведомления отправляются только для изменений, которые
+    действительно сохранены. При откате отложенные вызовы отменяются.
+    """
+    session.info.setdefault("after_commit", []).append((callback, args))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for callback, args in session.info.pop("after_commit", []):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"After-commit callback failed: {e!r}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session: Session) -> None:
+    session.info.pop("after_commit", None)
+
+
 async def init_db() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Приводит схему базы данных к актуальной версии миграций."""
+    await migrate(engine)
+
+
+def upsert(
+    dialect_name: str,
+    table: Table,
+    values: dict,
+    index_elements: list[str]
+) -> Insert:
+    """
+    Строит INSERT ... ON CONFLICT DO UPDATE для PostgreSQL или SQLite:
+    при конфликте по index_elements остальные колонки перезаписываются.
+    """
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    stmt = dialect.insert(table).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            key: stmt.excluded[key]
+            for key in values if key not in index_elements
+        }
+    )
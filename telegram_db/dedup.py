@@ -0,0 +1,177 @@
+"""
+Поиск повторно опубликованных объявлений.
+
+Объявление считается повтором уже опубликованного, если у них совпадает
+отпечаток (нормализованный адрес, цена, комнаты и этаж), совпадает
+file_unique_id хотя бы одной фотографии или фотографии почти одинаковы
+по перцептивному хэшу (dHash, 64 бита).
+
+Отпечаток и file_unique_id ищутся по индексам базы. Близкие хэши ищутся
+в PhotoHashIndex в памяти процесса: хэш делится на HASH_CHUNKS частей по
+16 бит, и каждая часть — ключ своей хэш-таблицы (multi-index hashing).
+Если хэши отличаются не больше чем на max_distance бит, то хотя бы одна
+их часть отличается не больше чем на max_distance // HASH_CHUNKS бит,
+поэтому достаточно перебрать соседей каждой части в этом радиусе и
+проверить только найденных кандидатов. Индекс загружается из базы при
+запуске, а новые хэши рассылаются остальным процессам событием.
+
+Хэш считается по самой маленькой копии фотографии, которую отдает
+Telegram. Pillow необязателен: без него хэши не считаются, и остаются
+проверки по отпечатку и file_unique_id.
+"""
+import hashlib
+import io
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from telegram import events
+from telegram.config import PHOTO_HASH_DISTANCE
+from telegram.gazetteer import STREET_TYPES, normalize_query
+from telegram_db.models import Photo
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+HASH_BITS = 64
+HASH_CHUNKS = 4
+_CHUNK_BITS = HASH_BITS // HASH_CHUNKS
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+_HASH_MASK = (1 << HASH_BITS) - 1
+
+HASHING_AVAILABLE = Image is not None
+
+
+def listing_fingerprint(
+    address: str,
+    price: float,
+    rooms: int,
+    storey: Optional[int]
+) -> str:
+    """
+    Отпечаток объявления: одинаков у объявлений с одним адресом (без
+    учета регистра, пунктуации, порядка слов и типа улицы), ценой,
+    числом комнат и этажом.
+    """
+    words = sorted(
+        word for word in set(normalize_query(address or "").split())
+        if word not in STREET_TYPES)
+    key = f"{' '.join(words)}|{float(price):.0f}|{rooms}|{storey or 0}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def dhash(data: bytes) -> Optional[int]:
+    """
+    Разностный хэш изображения: знаки разностей яркости соседних
+    пикселей уменьшенной до 9x8 копии. Возвращает 64-битное число со
+    знаком (для BigInteger) или None, если Pillow не установлен или
+    изображение не читается.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = list(
+                image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except (OSError, ValueError):
+        return None
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = (value << 1) | (left > pixels[row * 9 + column + 1])
+    return value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+
+def _neighbours(chunk: int, radius: int) -> Iterable[int]:
+    yield chunk
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(_CHUNK_BITS), distance):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            yield flipped
+
+
+class PhotoHashIndex:
+    """
+    Индекс перцептивных хэшей фотографий для поиска близких.
+
+    Параметры:
+      max_distance: наибольшее расстояние Хэмминга между хэшами почти
+        одинаковых фотографий.
+    """
+
+    def __init__(self, max_distance: int = PHOTO_HASH_DISTANCE) -> None:
+        self.max_distance = max_distance
+        self._radius = max_distance // HASH_CHUNKS
+        self._tables: List[Dict[int, Set[int]]] = [
+            {} for _ in range(HASH_CHUNKS)]
+        self._apartments: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._apartments)
+
+    @staticmethod
+    def _chunks(value: int) -> List[int]:
+        return [(value >> (index * _CHUNK_BITS)) & _CHUNK_MASK
+                for index in range(HASH_CHUNKS)]
+
+    def add(self, pairs: Iterable[Tuple[int, int]]) -> None:
+        """Добавляет пары (хэш фотографии, id объявления)."""
+        for value, apartment_id in pairs:
+            value &= _HASH_MASK
+            if value not in self._apartments:
+                self._apartments[value] = set()
+                for table, chunk in zip(self._tables, self._chunks(value)):
+                    table.setdefault(chunk, set()).add(value)
+            self._apartments[value].add(apartment_id)
+
+    def search(self, value: int) -> Set[int]:
+        """
+        Возвращает id объявлений с фотографиями, хэш которых отличается
+        от value не больше чем на max_distance бит. Удаленные объявления
+        остаются в индексе до перезапуска, их отбрасывает вызывающий код.
+        """
+        value &= _HASH_MASK
+        candidates = set()
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for neighbour in _neighbours(chunk, self._radius):
+                candidates.update(table.get(neighbour, ()))
+        found = set()
+        for candidate in candidates:
+            if (candidate ^ value).bit_count() <= self.max_distance:
+                found.update(self._apartments[candidate])
+        return found
+
+    async def load(self, session: AsyncSession) -> int:
+        """Загружает хэши всех фотографий из базы и возвращает их число."""
+        count = 0
+        result = await session.stream(
+            select(Photo.phash, Photo.apartment_id)
+            .where(Photo.phash.is_not(None))
+            .execution_options(yield_per=10000))
+        async for partition in result.partitions():
+            self.add(partition)
+            count += len(partition)
+        return count
+
+
+photo_index = PhotoHashIndex()
+
+
+def index_photo_hashes(pairs: List[Tuple[int, int]]) -> None:
+    """
+    Добавляет хэши фотографий нового объявления в индекс этого и всех
+    остальных процессов.
+    """
+    photo_index.add(pairs)
+    events.emit("photo_hashes", pairs)
+
+
+events.on("photo_hashes", photo_index.add)
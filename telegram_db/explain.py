@@ -0,0 +1,106 @@
+"""
+Проверка планов выполнения основных запросов бота.
+
+Запуск: ``python -m telegram_db.explain``. Печатает план каждого запроса и
+завершается с кодом 1, если какой-либо из них читает таблицу целиком
+вместо индекса — так регрессия схемы или запроса видна сразу.
+"""
+import asyncio
+import datetime
+import sys
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from telegram_db.db import engine
+from telegram_db.models import Apartment, Photo
+from telegram_db.search import (
+    FUZZY_FILTER, KEYWORDS_FILTER, POINT_FILTER, RADIUS_FILTER,
+    apply_search_filters, search_page_statement)
+
+
+SAMPLE_CURSOR = (datetime.datetime(2024, 1, 1).isoformat(), 1000)
+
+
+def plan_queries(dialect_name: str) -> dict[str, Select]:
+    """Возвращает запросы, планы которых нужно проверить."""
+    queries = {
+        "поиск: первая страница": search_page_statement({}),
+        "поиск: страница по курсору": search_page_statement(
+            {}, after=SAMPLE_CURSOR),
+        "поиск: город и цена": search_page_statement(
+            {"город": "Москва", "цена мин": "30000", "цена макс": "60000"}),
+        "поиск: комнаты и цена": search_page_statement(
+            {"комнаты": "2", "цена макс": "60000"}),
+        "поиск: этаж": search_page_statement({"этаж": "3"}),
+        "поиск: в радиусе": search_page_statement(
+            {POINT_FILTER: "55.75,37.61", RADIUS_FILTER: "3"}),
+        "поиск: количество": apply_search_filters(
+            select(func.count()).select_from(Apartment),
+            {"комнаты": "2", "цена мин": "30000"}),
+        "мои публикации": (
+            select(Apartment)
+            .where(Apartment.owner_id == "1")
+            .order_by(Apartment.id)
+        ),
+        "фотографии объявлений": (
+            select(Photo).where(Photo.apartment_id.in_([1, 2, 3, 4, 5]))
+        ),
+    }
+    if dialect_name == "postgresql":
+        # Триграммные и полнотекстовый индексы есть только в PostgreSQL.
+        queries["поиск: подстрока адреса"] = search_page_statement(
+            {"адрес": "Тверская"})
+        queries["поиск: нечеткий город"] = search_page_statement(
+            {"город": "Моска", FUZZY_FILTER: "да"})
+        queries["поиск: ключевые слова"] = search_page_statement(
+            {KEYWORDS_FILTER: "балкон с мебелью", "цена макс": "60000"})
+    return queries
+
+
+async def explain(conn: AsyncConnection, stmt: Select) -> list[str]:
+    """Возвращает строки плана выполнения запроса."""
+    sql = str(stmt.compile(
+        dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in result]
+    result = await conn.exec_driver_sql(f"EXPLAIN {sql}")
+    return [row[0] for row in result]
+
+
+def is_full_scan(plan: list[str]) -> bool:
+    """Проверяет, есть ли в плане полный проход по таблице."""
+    for line in plan:
+        line = line.strip()
+        if "Seq Scan on" in line:
+            return True
+        if line.startswith("SCAN") and "USING" not in line:
+            return True
+    return False
+
+
+async def main() -> int:
+    regressions = []
+    async with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # На маленькой таблице планировщик предпочтет Seq Scan даже при
+            # наличии индекса; здесь проверяется, что индекс вообще применим.
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+        for name, stmt in plan_queries(conn.dialect.name).items():
+            plan = await explain(conn, stmt)
+            print(f"== {name}")
+            print("\n".join(plan), end="\n\n")
+            if is_full_scan(plan):
+                regressions.append(name)
+    await engine.dispose()
+
+    if regressions:
+        print("Полный проход по таблице:", ", ".join(regressions))
+        return 1
+    print("Все запросы используют индексы.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
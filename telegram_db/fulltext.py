@@ -0,0 +1,190 @@
+"""
+Полнотекстовый поиск по описаниям объявлений с русской морфологией.
+
+В PostgreSQL описание разбирается to_tsvector('russian', ...), запрос —
+websearch_to_tsquery('russian', ...), совпадения ищутся по GIN-индексу
+выражения, а релевантность считает ts_rank. В остальных СУБД (SQLite в
+тестах) совпадения ищутся по обратному индексу в памяти процесса (см.
+telegram_db.keyword_index), построенному функциями этого модуля: слова
+приводятся к основе стеммером Snowball для русского языка (пакет
+snowballstemmer, тот же алгоритм, что у словаря russian_stem). Пакет
+необязателен: без него слова не приводятся к основе, и слово запроса
+совпадает со всеми словами описания, которые с него начинаются.
+
+Запрос понимает тот же синтаксис, что и websearch_to_tsquery: слова
+через пробел должны встретиться все, «or» разделяет варианты, «-слово»
+исключает описания с этим словом, кавычки допускаются.
+"""
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Iterable
+
+from sqlalchemy import Boolean, Float
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+
+TEXT_SEARCH_CONFIG = "russian"
+
+_WORD_RE = re.compile(r"-?\w+")
+
+STEMMING_AVAILABLE = snowballstemmer is not None
+_stemmer = (snowballstemmer.stemmer(TEXT_SEARCH_CONFIG)
+            if STEMMING_AVAILABLE else None)
+
+STOP_WORDS = frozenset({
+    "и", "в", "во", "не", "что", "он", "на", "я", "с", "со", "как", "а",
+    "то", "все", "она", "так", "его", "но", "да", "ты", "к", "у", "же",
+    "вы", "за", "бы", "по", "только", "ее", "мне", "было", "вот", "от",
+    "меня", "еще", "нет", "о", "из", "ему", "теперь", "когда", "уже",
+    "для", "до", "или", "ни", "быть", "был", "него", "вас", "нибудь",
+    "уж", "вам", "ведь", "там", "потом", "себя", "ничего", "ей", "может",
+    "они", "тут", "где", "есть", "надо", "ней", "мы", "тебя", "их", "чем",
+    "была", "сам", "чтоб", "без", "будто", "чего", "раз", "тоже", "себе",
+    "под", "будет", "ж", "тогда", "кто", "этот", "того", "потому",
+    "этого", "какой", "совсем", "ним", "здесь", "этом", "один", "почти",
+    "мой", "тем", "чтобы", "нее", "были", "куда", "зачем", "всех",
+    "никогда", "можно", "при", "наконец", "два", "об", "другой", "хоть",
+    "после", "над", "больше", "тот", "через", "эти", "нас", "про", "всего",
+    "них", "какая", "много", "разве", "три", "эту", "моя", "впрочем",
+    "хорошо", "свою", "этой", "перед", "иногда", "лучше", "чуть", "том",
+    "нельзя", "такой", "им", "более", "всегда", "конечно", "всю", "между",
+})
+
+
+def stem(word: str) -> str:
+    """
+    Основа русского слова по алгоритму Snowball — та же, что дает словарь
+    russian_stem в PostgreSQL. Без snowballstemmer слово только
+    приводится к нижнему регистру, а совпадения ищутся по префиксу.
+    """
+    word = word.lower().replace("ё", "е")
+    return _stemmer.stemWord(word) if _stemmer is not None else word
+
+
+def _terms(text: str) -> list:
+    return [stem(word) for word in _WORD_RE.findall(
+        (text or "").lower().replace("-", " ")) if word not in STOP_WORDS]
+
+
+@lru_cache(maxsize=10000)
+def document_terms(text: str) -> Counter:
+    """Основы слов описания с числом вхождений (как в tsvector)."""
+    return Counter(_terms(text))
+
+
+@lru_cache(maxsize=256)
+def parse_query(query: str) -> tuple:
+    """
+    Разбирает запрос как websearch_to_tsquery: кортеж вариантов, каждый —
+    (основы, которые должны быть, основы, которых быть не должно).
+    """
+    variants = []
+    required, excluded = set(), set()
+    for word in _WORD_RE.findall((query or "").lower().replace('"', " ")):
+        if word == "or":
+            variants.append((frozenset(required), frozenset(excluded)))
+            required, excluded = set(), set()
+            continue
+        negated = word.startswith("-")
+        word = word.lstrip("-")
+        if not word or word in STOP_WORDS:
+            continue
+        (excluded if negated else required).add(stem(word))
+    variants.append((frozenset(required), frozenset(excluded)))
+    return tuple(variant for variant in variants if variant[0])
+
+
+def _count(terms: Counter, query_term: str) -> int:
+    if STEMMING_AVAILABLE:
+        return terms[query_term]
+    return sum(count for term, count in terms.items()
+               if term.startswith(query_term))
+
+
+def query_terms(query: str) -> frozenset:
+    """Основы всех искомых (не исключенных) слов запроса."""
+    return frozenset().union(
+        *(required for required, _ in parse_query(query)))
+
+
+def rank_score(counts: Iterable[int]) -> float:
+    """
+    Релевантность по числу вхождений каждого искомого слова, как ts_rank
+    без нормализации: растет с числом вхождений, с убывающей отдачей.
+    """
+    return sum(0.1 * (1 - math.exp(-count)) for count in counts)
+
+
+def text_matches(text: str, query: str) -> bool:
+    """Подходит ли текст под запрос (аналог @@ websearch_to_tsquery)."""
+    terms = document_terms(text or "")
+    return any(
+        all(_count(terms, term) for term in required)
+        and not any(_count(terms, term) for term in excluded)
+        for required, excluded in parse_query(query))
+
+
+def text_rank(text: str, query: str) -> float:
+    """Релевантность текста запросу (см. rank_score)."""
+    if not text_matches(text, query):
+        return 0.0
+    terms = document_terms(text or "")
+    return rank_score(_count(terms, term) for term in query_terms(query))
+
+
+def description_tsvector(column) -> str:
+    """SQL выражения tsvector описания, как в GIN-индексе."""
+    return f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce({column}, ''))"
+
+
+class keyword_match(FunctionElement):
+    """
+    Условие «column подходит под запрос value» по GIN-индексу PostgreSQL.
+    В остальных СУБД вместо него используется KeywordIndex (см.
+    telegram_db.keyword_index).
+    """
+    type = Boolean()
+    inherit_cache = True
+
+
+class keyword_rank(FunctionElement):
+    """Релевантность column запросу value (ts_rank) в PostgreSQL."""
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(keyword_match)
+@compiles(keyword_rank)
+def _compile_without_postgres(element, compiler, **kw):
+    raise CompileError(
+        "Полнотекстовый поиск в SQL есть только в PostgreSQL; в других "
+        "СУБД используется telegram_db.keyword_index.")
+
+
+@compiles(keyword_match, "postgresql")
+def _compile_keyword_match_pg(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return (
+        f"({description_tsvector(compiler.process(column, **kw))} @@ "
+        f"websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', "
+        f"{compiler.process(value, **kw)}))"
+    )
+
+
+@compiles(keyword_rank, "postgresql")
+def _compile_keyword_rank_pg(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return (
+        f"ts_rank({description_tsvector(compiler.process(column, **kw))}, "
+        f"websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', "
+        f"{compiler.process(value, **kw)}))"
+    )
@@ -0,0 +1,117 @@
+"""
+Поиск объявлений в радиусе от точки.
+
+Каждое объявление с координатами относится к ячейке сетки размером
+GEO_CELL_SIZE градусов (колонка ``geo_cell`` с индексом). Запрос по
+радиусу перечисляет ячейки, покрывающие описанный вокруг круга
+прямоугольник, отсекает по ним и по прямоугольнику кандидатов через
+индекс и только для них проверяет расстояние.
+"""
+import math
+from typing import Optional, Tuple
+
+from sqlalchemy import ColumnElement, and_
+
+from telegram_db.models import Apartment
+
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+GEO_CELL_SIZE = 0.1
+MAX_RADIUS_KM = 100
+
+_CELLS_PER_ROW = round(360 / GEO_CELL_SIZE)
+
+
+def geo_cell(latitude: float, longitude: float) -> int:
+    """Возвращает номер ячейки сетки, в которую попадает точка."""
+    row = math.floor((latitude + 90) / GEO_CELL_SIZE)
+    column = math.floor((longitude + 180) / GEO_CELL_SIZE) % _CELLS_PER_ROW
+    return row * _CELLS_PER_ROW + column
+
+
+def bounding_box(
+    latitude: float,
+    longitude: float,
+    radius_km: float
+) -> Tuple[float, float, float, float]:
+    """
+    Возвращает прямоугольник (мин. широта, макс. широта, мин. долгота,
+    макс. долгота), в который вписан круг радиуса radius_km.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    lon_delta = min(radius_km / (KM_PER_DEGREE * cos_lat), 180)
+    return (
+        max(latitude - lat_delta, -90),
+        min(latitude + lat_delta, 90),
+        longitude - lon_delta,
+        longitude + lon_delta,
+    )
+
+
+def cells_in_box(box: Tuple[float, float, float, float]) -> list[int]:
+    """Перечисляет ячейки сетки, пересекающиеся с прямоугольником."""
+    lat_min, lat_max, lon_min, lon_max = box
+    row_min = math.floor((lat_min + 90) / GEO_CELL_SIZE)
+    row_max = math.floor((lat_max + 90) / GEO_CELL_SIZE)
+    col_min = math.floor((lon_min + 180) / GEO_CELL_SIZE)
+    col_max = math.floor((lon_max + 180) / GEO_CELL_SIZE)
+    return [
+        row * _CELLS_PER_ROW + column % _CELLS_PER_ROW
+        for row in range(row_min, row_max + 1)
+        for column in range(col_min, col_max + 1)
+    ]
+
+
+def distance_km(
+    lat1: float, lon1: float, lat2: float, lon2: float
+) -> float:
+    """Расстояние между двумя точками по формуле гаверсинусов."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (math.sin(dphi / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def within_radius(
+    latitude: float,
+    longitude: float,
+    radius_km: float
+) -> ColumnElement:
+    """
+    Условие «объявление не дальше radius_km от точки». Расстояние
+    считается в равнопромежуточной проекции с косинусом широты центра:
+    для радиусов до MAX_RADIUS_KM этого достаточно, и выражение остается
+    арифметическим, то есть работает в любой СУБД.
+    """
+    radius_km = min(radius_km, MAX_RADIUS_KM)
+    box = bounding_box(latitude, longitude, radius_km)
+    cos_lat = math.cos(math.radians(latitude))
+    dlat = Apartment.latitude - latitude
+    dlon = (Apartment.longitude - longitude) * cos_lat
+    return and_(
+        Apartment.geo_cell.in_(cells_in_box(box)),
+        Apartment.latitude.between(box[0], box[1]),
+        Apartment.longitude.between(box[2], box[3]),
+        dlat * dlat + dlon * dlon <= (radius_km / KM_PER_DEGREE) ** 2,
+    )
+
+
+def parse_point(text: str) -> Optional[Tuple[float, float]]:
+    """
+    Разбирает координаты вида «55.75, 37.61». Возвращает None, если
+    строка не похожа на координаты.
+    """
+    parts = text.replace(";", ",").split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        latitude, longitude = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
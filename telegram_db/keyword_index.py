@@ -0,0 +1,162 @@
+"""
+Обратный индекс описаний объявлений для поиска по ключевым словам там,
+где нет полнотекстового поиска PostgreSQL (SQLite в тестах и небольших
+установках).
+
+KeywordIndex хранит для каждой основы слова (см. telegram_db.fulltext)
+id объявлений, в описаниях которых она встречается, с числом вхождений.
+Запрос разбирается как websearch_to_tsquery, и подходящие id находятся
+пересечением списков — без просмотра описаний; в SQL они передаются
+условием id IN (...). Релевантность считается по тем же спискам функцией
+SQLite keyword_rank.
+
+Индекс загружается из базы при запуске (только не в PostgreSQL), новые
+объявления добавляются в него, удаленные — удаляются после фиксации
+транзакции; изменения рассылаются остальным процессам событием. Снятые с
+публикации объявления остаются в индексе: их отсекает условие
+is_available запроса.
+"""
+import bisect
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import ColumnElement, event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from telegram import events
+from telegram_db.fulltext import (
+    STEMMING_AVAILABLE, document_terms, keyword_match, keyword_rank,
+    parse_query, query_terms, rank_score)
+from telegram_db.models import Apartment
+
+
+class KeywordIndex:
+    """Обратный индекс «основа слова → id объявлений»."""
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # Основы по алфавиту для поиска по префиксу без стеммера.
+        self._terms: List[str] = []
+        self._documents: Dict[int, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def clear(self) -> None:
+        """Очищает индекс; до следующей загрузки он не используется."""
+        self.loaded = False
+        self._postings.clear()
+        self._terms.clear()
+        self._documents.clear()
+
+    def add(self, pairs: Iterable[Tuple[int, str]]) -> None:
+        """Добавляет пары (id объявления, описание)."""
+        for apartment_id, description in pairs:
+            self.remove([apartment_id])
+            counts = document_terms(description or "")
+            for term, count in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    bisect.insort(self._terms, term)
+                postings[apartment_id] = count
+            self._documents[apartment_id] = tuple(counts)
+
+    def remove(self, apartment_ids: Iterable[int]) -> None:
+        """Удаляет объявления из индекса."""
+        for apartment_id in apartment_ids:
+            for term in self._documents.pop(apartment_id, ()):
+                postings = self._postings[term]
+                del postings[apartment_id]
+                if not postings:
+                    del self._postings[term]
+                    del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _matching_terms(self, query_term: str) -> List[str]:
+        if STEMMING_AVAILABLE:
+            return [query_term] if query_term in self._postings else []
+        start = bisect.bisect_left(self._terms, query_term)
+        end = bisect.bisect_left(self._terms, query_term + "\uffff")
+        return self._terms[start:end]
+
+    def _ids(self, query_term: str) -> Set[int]:
+        ids = set()
+        for term in self._matching_terms(query_term):
+            ids.update(self._postings[term])
+        return ids
+
+    def search(self, query: str) -> Set[int]:
+        """Возвращает id объявлений, описания которых подходят под запрос."""
+        found = set()
+        for required, excluded in parse_query(query):
+            # Пересечение начинаем с самого короткого списка.
+            lists = sorted((self._ids(term) for term in required), key=len)
+            ids = set.intersection(*lists) if lists else set()
+            for term in excluded:
+                ids -= self._ids(term)
+            found |= ids
+        return found
+
+    def rank(self, apartment_id: int, query: str) -> float:
+        """Релевантность описания объявления запросу (см. rank_score)."""
+        return rank_score(
+            sum(self._postings[term].get(apartment_id, 0)
+                for term in self._matching_terms(query_term))
+            for query_term in query_terms(query))
+
+    async def load(self, session: AsyncSession) -> int:
+        """Загружает описания всех объявлений и возвращает их число."""
+        count = 0
+        result = await session.stream(
+            select(Apartment.id, Apartment.description)
+            .execution_options(yield_per=10000))
+        async for partition in result.partitions():
+            self.add(partition)
+            count += len(partition)
+        self.loaded = True
+        return count
+
+
+keyword_index = KeywordIndex()
+
+
+def keyword_condition(query: str) -> ColumnElement:
+    """Условие поиска по ключевым словам: по индексу или по GIN."""
+    if keyword_index.loaded:
+        return Apartment.id.in_(keyword_index.search(query))
+    return keyword_match(Apartment.description, query)
+
+
+def keyword_relevance(query: str) -> ColumnElement:
+    """Релевантность объявления ключевым словам: по индексу или ts_rank."""
+    if keyword_index.loaded:
+        return func.keyword_rank(Apartment.id, query)
+    return keyword_rank(Apartment.description, query)
+
+
+def index_descriptions(pairs: List[Tuple[int, str]]) -> None:
+    """
+    Добавляет описания новых объявлений в индекс этого и всех остальных
+    процессов.
+    """
+    keyword_index.add(pairs)
+    events.emit("keyword_index_add", pairs)
+
+
+def unindex_apartments(apartment_ids: List[int]) -> None:
+    """Удаляет объявления из индекса этого и всех остальных процессов."""
+    keyword_index.remove(apartment_ids)
+    events.emit("keyword_index_remove", apartment_ids)
+
+
+events.on("keyword_index_add", keyword_index.add)
+events.on("keyword_index_remove", keyword_index.remove)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record) -> None:
+    """Регистрирует keyword_rank в соединениях SQLite."""
+    if not hasattr(dbapi_connection, "create_function"):
+        return
+    dbapi_connection.create_function("keyword_rank", 2, keyword_index.rank)
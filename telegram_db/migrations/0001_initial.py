@@ -0,0 +1,43 @@
+import datetime
+
+from sqlalchemy import (
+    Boolean, Column, Connection, DateTime, Float, ForeignKey, Integer,
+    MetaData, String, Table)
+
+
+# Схема таблиц на момент этой миграции. Она не зависит от моделей: их
+# изменения вносят следующие миграции.
+_metadata = MetaData()
+
+apartments = Table(
+    "apartments",
+    _metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("owner_id", String, nullable=False),
+    Column("city", String, nullable=False),
+    Column("street", String, nullable=True),
+    Column("address", String, nullable=False),
+    Column("price", Float, nullable=False),
+    Column("storey", Integer, nullable=True, default=0),
+    Column("rooms", Integer, nullable=False),
+    Column("description", String, nullable=True),
+    Column("created_at", DateTime, default=datetime.datetime.utcnow),
+    Column("is_available", Boolean, default=True, nullable=False),
+)
+
+photos = Table(
+    "photos",
+    _metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("apartment_id", Integer, ForeignKey("apartments.id"),
+           nullable=False),
+    Column("file_id", String, nullable=False),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Создает исходные таблицы объявлений и фотографий. Индексы добавляются
+    последующими миграциями.
+    """
+    _metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,29 @@
+from sqlalchemy import Connection
+
+from telegram_db.migrations import create_index
+from telegram_db.models import Apartment, Photo
+
+
+INDEXES = (
+    "ix_apartments_available_created",
+    "ix_apartments_available_city_price",
+    "ix_apartments_available_price",
+    "ix_apartments_available_rooms_price",
+    "ix_apartments_available_storey",
+    "ix_apartments_owner_id",
+    "ix_photos_apartment_id",
+)
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Добавляет индексы под запросы поиска, «Мои публикации» и подгрузку
+    фотографий объявления.
+    """
+    indexes = {
+        ix.name: ix
+        for model in (Apartment, Photo)
+        for ix in model.__table__.indexes
+    }
+    for name in INDEXES:
+        create_index(conn, indexes[name])
@@ -0,0 +1,23 @@
+from sqlalchemy import Connection
+
+from telegram_db.migrations import create_index
+from telegram_db.models import Apartment
+
+
+INDEXES = (
+    "ix_apartments_city_trgm",
+    "ix_apartments_address_trgm",
+)
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Подключает pg_trgm и добавляет GIN-индексы по триграммам города и
+    адреса. В других СУБД нечеткий поиск работает без индекса.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    indexes = {ix.name: ix for ix in Apartment.__table__.indexes}
+    for name in INDEXES:
+        create_index(conn, indexes[name])
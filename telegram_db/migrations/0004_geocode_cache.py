@@ -0,0 +1,8 @@
+from sqlalchemy import Connection
+
+from telegram_db.models import GeocodeCache
+
+
+def upgrade(conn: Connection) -> None:
+    """Создает таблицу постоянного кэша результатов геокодирования."""
+    GeocodeCache.__table__.create(conn, checkfirst=True)
@@ -0,0 +1,16 @@
+from sqlalchemy import Connection
+
+from telegram_db.migrations import add_column, create_index
+from telegram_db.models import Apartment
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Добавляет координаты объявления и индексируемую ячейку сетки для
+    поиска в радиусе.
+    """
+    table = Apartment.__table__
+    for column in ("latitude", "longitude", "geo_cell"):
+        add_column(conn, table, column)
+    indexes = {ix.name: ix for ix in table.indexes}
+    create_index(conn, indexes["ix_apartments_available_geo_cell"])
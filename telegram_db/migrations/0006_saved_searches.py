@@ -0,0 +1,12 @@
+from sqlalchemy import Connection
+
+from telegram_db.migrations import create_index
+from telegram_db.models import SavedSearch
+
+
+def upgrade(conn: Connection) -> None:
+    """Создает таблицу сохраненных поисков (подписок на объявления)."""
+    table = SavedSearch.__table__
+    table.create(conn, checkfirst=True)
+    for index in table.indexes:
+        create_index(conn, index)
@@ -0,0 +1,11 @@
+from sqlalchemy import Connection
+
+from telegram_db.models import FilterSet
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Создает таблицу наборов фильтров, на которые ссылаются кнопки
+    перелистывания результатов поиска.
+    """
+    FilterSet.__table__.create(conn, checkfirst=True)
@@ -0,0 +1,48 @@
+from sqlalchemy import Connection, inspect
+from sqlalchemy.schema import CreateTable
+
+from telegram_db.migrations import create_index
+from telegram_db.models import Photo
+
+
+def _apartment_fk(conn: Connection) -> dict:
+    for foreign_key in inspect(conn).get_foreign_keys("photos"):
+        if foreign_key["referred_table"] == "apartments":
+            return foreign_key
+    return {}
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Фотографии удаляются вместе с объявлением на стороне базы
+    (ON DELETE CASCADE). SQLite не умеет менять внешний ключ, поэтому там
+    таблица фотографий пересоздается с переносом данных.
+    """
+    foreign_key = _apartment_fk(conn)
+    if foreign_key.get("options", {}).get("ondelete", "").upper() == "CASCADE":
+        return
+
+    if conn.dialect.name != "sqlite":
+        if foreign_key.get("name"):
+            conn.exec_driver_sql(
+                f"ALTER TABLE photos DROP CONSTRAINT {foreign_key['name']}")
+        conn.exec_driver_sql(
+            "ALTER TABLE photos ADD CONSTRAINT photos_apartment_id_fkey "
+            "FOREIGN KEY (apartment_id) REFERENCES apartments (id) "
+            "ON DELETE CASCADE")
+        return
+
+    inspector = inspect(conn)
+    old_columns = {col["name"] for col in inspector.get_columns("photos")}
+    for index in inspector.get_indexes("photos"):
+        conn.exec_driver_sql(f"DROP INDEX {index['name']}")
+    conn.exec_driver_sql("ALTER TABLE photos RENAME TO _photos_old")
+    table = Photo.__table__
+    conn.execute(CreateTable(table))
+    columns = ", ".join(
+        column.name for column in table.columns if column.name in old_columns)
+    conn.exec_driver_sql(
+        f"INSERT INTO photos ({columns}) SELECT {columns} FROM _photos_old")
+    conn.exec_driver_sql("DROP TABLE _photos_old")
+    for index in table.indexes:
+        create_index(conn, index)
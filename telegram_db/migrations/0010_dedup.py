@@ -0,0 +1,47 @@
+from sqlalchemy import Connection, bindparam, select, update
+
+from telegram_db.dedup import listing_fingerprint
+from telegram_db.migrations import add_column, create_index
+from telegram_db.models import Apartment, Photo
+
+
+BATCH_SIZE = 1000
+
+# executemany обновляет по строке на набор параметров; имена параметров
+# не совпадают с колонками, иначе id попал бы в SET.
+_SET_FINGERPRINT = (
+    update(Apartment.__table__)
+    .where(Apartment.__table__.c.id == bindparam("b_id"))
+    .values(fingerprint=bindparam("b_fingerprint")))
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Добавляет отпечатки объявлений, file_unique_id и перцептивные хэши
+    фотографий для поиска повторов и заполняет отпечатки существующих
+    объявлений. У старых фотографий file_unique_id и хэша нет.
+    """
+    add_column(conn, Apartment.__table__, "fingerprint")
+    for column in ("file_unique_id", "phash"):
+        add_column(conn, Photo.__table__, column)
+    indexes = {ix.name: ix for ix in Apartment.__table__.indexes}
+    create_index(conn, indexes["ix_apartments_available_fingerprint"])
+    indexes = {ix.name: ix for ix in Photo.__table__.indexes}
+    create_index(conn, indexes["ix_photos_file_unique_id"])
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(Apartment.id, Apartment.address, Apartment.price,
+                   Apartment.rooms, Apartment.storey)
+            .where(Apartment.id > last_id, Apartment.fingerprint.is_(None))
+            .order_by(Apartment.id)
+            .limit(BATCH_SIZE)).all()
+        if not rows:
+            return
+        conn.execute(
+            _SET_FINGERPRINT,
+            [{"b_id": row.id, "b_fingerprint": listing_fingerprint(
+                row.address, row.price, row.rooms, row.storey)}
+             for row in rows])
+        last_id = rows[-1].id
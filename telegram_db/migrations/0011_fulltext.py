@@ -0,0 +1,15 @@
+from sqlalchemy import Connection
+
+from telegram_db.migrations import create_index
+from telegram_db.models import Apartment
+
+
+def upgrade(conn: Connection) -> None:
+    """
+    Добавляет GIN-индекс полнотекстового поиска по описаниям. В других
+    СУБД поиск по ключевым словам работает без индекса.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    indexes = {ix.name: ix for ix in Apartment.__table__.indexes}
+    create_index(conn, indexes["ix_apartments_description_fts"])
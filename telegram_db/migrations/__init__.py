@@ -0,0 +1,139 @@
+"""
+Версионированные миграции схемы базы данных.
+
+Каждая миграция — модуль вида ``NNNN_описание.py`` в этом пакете с
+синхронной функцией ``upgrade(conn)``. Примененные версии хранятся в
+таблице ``schema_migrations``; каждая миграция выполняется в отдельной
+транзакции.
+
+Миграции можно применять к работающей базе: в PostgreSQL индексы,
+заказанные через create_index, строятся после фиксации транзакции
+миграции командой CREATE INDEX CONCURRENTLY, которая не блокирует запись
+в таблицу. Версия миграции записывается только после того, как построены
+все ее индексы; недостроенный (INVALID) индекс при повторном запуске
+удаляется и строится заново.
+"""
+import datetime
+import importlib
+import pkgutil
+import re
+from types import ModuleType
+
+from sqlalchemy import (
+    Column, Connection, DateTime, Index, Integer, MetaData, String, Table,
+    inspect, select, text)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateIndex
+
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.datetime.utcnow),
+)
+
+
+def discover_migrations() -> list[tuple[int, str, ModuleType]]:
+    """
+    Возвращает отсортированный по версии список миграций пакета.
+    """
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        version, _, name = module_info.name.partition("_")
+        if not version.isdigit():
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append((int(version), name, module))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+def _applied_versions(conn: Connection) -> set[int]:
+    _metadata.create_all(conn)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+# Ключ conn.info: индексы, которые migrate построит после фиксации.
+_CONCURRENT_INDEXES = "concurrent_indexes"
+
+
+def create_index(conn: Connection, index: Index) -> None:
+    """
+    Создает индекс, если его еще нет в базе. В PostgreSQL индекс только
+    заказывается: его строит migrate после фиксации миграции.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.info.setdefault(_CONCURRENT_INDEXES, []).append(index)
+        return
+    existing = {
+        ix["name"] for ix in inspect(conn).get_indexes(index.table.name)}
+    if index.name not in existing:
+        index.create(conn)
+
+
+def concurrent_index_ddl(index: Index) -> str:
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS для индекса в PostgreSQL."""
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(
+        dialect=postgresql.dialect()))
+    return re.sub(r"^CREATE (UNIQUE )?INDEX ", r"\g<0>CONCURRENTLY ", ddl)
+
+
+async def _create_indexes_concurrently(
+    engine: AsyncEngine,
+    indexes: list[Index]
+) -> None:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index in indexes:
+            invalid = await conn.scalar(
+                text("SELECT NOT indisvalid FROM pg_index "
+                     "WHERE indexrelid = to_regclass(:name)"),
+                {"name": index.name})
+            if invalid:
+                await conn.exec_driver_sql(
+                    f'DROP INDEX CONCURRENTLY "{index.name}"')
+            await conn.exec_driver_sql(concurrent_index_ddl(index))
+
+
+def add_column(conn: Connection, table: Table, column_name: str) -> None:
+    """
+    Добавляет в существующую таблицу колонку, объявленную в модели,
+    если ее еще нет в базе.
+    """
+    existing = {col["name"] for col in inspect(conn).get_columns(table.name)}
+    if column_name in existing:
+        return
+    column = table.c[column_name]
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.exec_driver_sql(
+        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+
+async def migrate(engine: AsyncEngine) -> list[int]:
+    """
+    Применяет все еще не примененные миграции по порядку.
+
+    Возвращает:
+      List[int]: версии примененных миграций.
+    """
+    async with engine.begin() as conn:
+        applied = await conn.run_sync(_applied_versions)
+
+    newly_applied = []
+    for version, name, module in discover_migrations():
+        if version in applied:
+            continue
+        async with engine.begin() as conn:
+            await conn.run_sync(module.upgrade)
+            indexes = conn.info.pop(_CONCURRENT_INDEXES, [])
+        if indexes:
+            await _create_indexes_concurrently(engine, indexes)
+        async with engine.begin() as conn:
+            await conn.execute(
+                schema_migrations.insert().values(version=version, name=name))
+        newly_applied.append(version)
+    return newly_applied
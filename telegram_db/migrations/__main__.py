@@ -0,0 +1,17 @@
+import asyncio
+
+from telegram_db.db import engine
+from telegram_db.migrations import migrate
+
+
+async def main() -> None:
+    applied = await migrate(engine)
+    if applied:
+        print("Применены миграции:", ", ".join(map(str, applied)))
+    else:
+        print("Схема актуальна.")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
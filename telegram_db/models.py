@@ -1,15 +1,74 @@
 import datetime
 
 from sqlalchemy import (
-    Column, Integer, String, Float, DateTime, ForeignKey, Boolean)
+    BigInteger, Column, Integer, String, Float, DateTime, ForeignKey,
+    Boolean, Index, LargeBinary, Text, text)
 from sqlalchemy.orm import declarative_base, relationship
 
+from telegram_db.fulltext import description_tsvector
+
 
 Base = declarative_base()
 
 
+def available_index(name: str, *columns: str) -> Index:
+    """
+    Частичный индекс только по доступным объявлениям — именно их
+    просматривает поиск.
+    """
+    return Index(
+        name,
+        *columns,
+        postgresql_where=text("is_available"),
+        sqlite_where=text("is_available = 1"))
+
+
+def trigram_index(name: str, column: str) -> Index:
+    """
+    GIN-индекс pg_trgm по доступным объявлениям для ILIKE '%...%' и
+    нечеткого сравнения. Создается только в PostgreSQL.
+    """
+    return Index(
+        name,
+        column,
+        postgresql_using="gin",
+        postgresql_ops={column: "gin_trgm_ops"},
+        postgresql_where=text("is_available"),
+    ).ddl_if(dialect="postgresql")
+
+
+def fulltext_index(name: str, column: str) -> Index:
+    """
+    GIN-индекс tsvector колонки по доступным объявлениям для
+    полнотекстового поиска. Создается только в PostgreSQL.
+    """
+    return Index(
+        name,
+        text(description_tsvector(column)),
+        postgresql_using="gin",
+        postgresql_where=text("is_available"),
+    ).ddl_if(dialect="postgresql")
+
+
 class Apartment(Base):
     __tablename__ = 'apartments'
+    __table_args__ = (
+        available_index(
+            "ix_apartments_available_created", "created_at", "id"),
+        available_index(
+            "ix_apartments_available_city_price", "city", "price"),
+        available_index("ix_apartments_available_price", "price"),
+        available_index(
+            "ix_apartments_available_rooms_price", "rooms", "price"),
+        available_index("ix_apartments_available_storey", "storey"),
+        available_index("ix_apartments_available_geo_cell", "geo_cell"),
+        available_index(
+            "ix_apartments_available_fingerprint", "fingerprint"),
+        Index("ix_apartments_owner_id", "owner_id", "id"),
+        trigram_index("ix_apartments_city_trgm", "city"),
+        trigram_index("ix_apartments_address_trgm", "address"),
+        fulltext_index("ix_apartments_description_fts", "description"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     owner_id = Column(String, nullable=False)
@@ -22,18 +81,78 @@ class Apartment(Base):
     description = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     is_available = Column(Boolean, default=True, nullable=False)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geo_cell = Column(Integer, nullable=True)
+    # Отпечаток адреса, цены, комнат и этажа для поиска повторов
+    # (см. telegram_db.dedup).
+    fingerprint = Column(String(16), nullable=True)
 
+    # Фотографии удаляет сама база (ON DELETE CASCADE), в том числе при
+    # удалении объявлений одним запросом DELETE.
     photos = relationship(
         "Photo",
         back_populates="apartment",
-        cascade="all, delete-orphan")
+        cascade="all, delete-orphan",
+        passive_deletes=True)
 
 
 class Photo(Base):
     __tablename__ = 'photos'
+    __table_args__ = (
+        Index("ix_photos_apartment_id", "apartment_id"),
+        Index("ix_photos_file_unique_id", "file_unique_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    apartment_id = Column(Integer, ForeignKey("apartments.id"), nullable=False)
+    apartment_id = Column(
+        Integer,
+        ForeignKey("apartments.id", ondelete="CASCADE"),
+        nullable=False)
     file_id = Column(String, nullable=False)
+    file_unique_id = Column(String, nullable=True)
+    # Перцептивный хэш (dHash) как 64-битное число со знаком.
+    phash = Column(BigInteger, nullable=True)
 
     apartment = relationship("Apartment", back_populates="photos")
+
+
+class GeocodeCache(Base):
+    __tablename__ = 'geocode_cache'
+
+    query = Column(String, primary_key=True)
+    result = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class SavedSearch(Base):
+    __tablename__ = 'saved_searches'
+    __table_args__ = (
+        Index("ix_saved_searches_user_id", "user_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    chat_id = Column(String, nullable=False)
+    filters = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class FilterSet(Base):
+    __tablename__ = 'filter_sets'
+
+    hash = Column(String(16), primary_key=True)
+    filters = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class FSMRecord(Base):
+    __tablename__ = 'fsm_states'
+    __table_args__ = (
+        Index("ix_fsm_states_expires_at", "expires_at"),
+    )
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(LargeBinary, nullable=True)
+    expires_at = Column(DateTime, nullable=False)
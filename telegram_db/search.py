@@ -0,0 +1,426 @@
+import datetime
+import hashlib
+import json
+import operator
+from functools import reduce
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    ColumnElement, Integer, Select, cast, func, or_, select, tuple_)
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from telegram_db.fulltext import text_matches
+from telegram_db.geo import (
+    MAX_RADIUS_KM, distance_km, parse_point, within_radius)
+from telegram_db.keyword_index import keyword_condition, keyword_relevance
+from telegram_db.models import Apartment
+from telegram_db.search_cache import CityKey, search_cache
+from telegram_db.trigram import (
+    SIMILARITY_THRESHOLD, WORD_SIMILARITY_THRESHOLD, similarity,
+    trigram_match, word_similarity, word_trigram_match)
+
+
+PAGE_SIZE = 5
+FUZZY_FILTER = "нечеткий поиск"
+KEYWORDS_FILTER = "ключевые слова"
+NEAR_FILTER = "рядом с"
+RADIUS_FILTER = "радиус км"
+# Координаты точки из NEAR_FILTER, «широта,долгота».
+POINT_FILTER = "точка"
+DEFAULT_RADIUS_KM = 2.0
+FILTERS_HASH_LENGTH = 10
+
+Cursor = Tuple
+
+
+class SearchPage(NamedTuple):
+    apartments: list[Apartment]
+    first_cursor: Optional[Cursor]
+    last_cursor: Optional[Cursor]
+
+
+def normalize_filters(filters: dict) -> tuple:
+    """
+    Приводит фильтры к ключу кэша: без пустых полей и подписи к точке,
+    без лишних пробелов, город, адрес и ключевые слова — в нижнем
+    регистре.
+    """
+    items = []
+    for field, value in filters.items():
+        value = str(value or "").strip()
+        if not value or field == NEAR_FILTER:
+            continue
+        if field in ("город", "адрес", KEYWORDS_FILTER):
+            value = value.lower()
+        items.append((field, value))
+    return tuple(sorted(items))
+
+
+def filters_hash(filters: dict) -> str:
+    """
+    Короткий хэш набора фильтров для callback data: одинаковые после
+    normalize_filters наборы дают одинаковый хэш.
+    """
+    key = json.dumps(normalize_filters(filters), ensure_ascii=False)
+    return hashlib.sha1(key.encode()).hexdigest()[:FILTERS_HASH_LENGTH]
+
+
+def is_fuzzy(filters: dict) -> bool:
+    """Проверяет, включен ли нечеткий поиск по городу и адресу."""
+    return bool(filters.get(FUZZY_FILTER))
+
+
+def apply_search_filters(stmt: Select, filters: dict) -> Select:
+    """
+    Добавляет к запросу условия из словаря фильтров поиска.
+    Некорректные числовые значения игнорируются.
+    """
+    stmt = stmt.where(Apartment.is_available)
+    fuzzy = is_fuzzy(filters)
+    if filters.get("город"):
+        city = filters["город"]
+        condition = Apartment.city.ilike(f"%{city}%")
+        if fuzzy:
+            condition = or_(condition, trigram_match(Apartment.city, city))
+        stmt = stmt.where(condition)
+    if filters.get("адрес"):
+        address = filters["адрес"]
+        condition = Apartment.address.ilike(f"%{address}%")
+        if fuzzy:
+            condition = or_(
+                condition, word_trigram_match(Apartment.address, address))
+        stmt = stmt.where(condition)
+    if filters.get(KEYWORDS_FILTER):
+        stmt = stmt.where(keyword_condition(filters[KEYWORDS_FILTER]))
+    if filters.get("цена мин"):
+        try:
+            price_min = float(filters["цена мин"])
+            stmt = stmt.where(Apartment.price >= price_min)
+        except ValueError:
+            pass
+    if filters.get("цена макс"):
+        try:
+            price_max = float(filters["цена макс"])
+            stmt = stmt.where(Apartment.price <= price_max)
+        except ValueError:
+            pass
+    if filters.get("комнаты"):
+        try:
+            rooms = int(filters["комнаты"])
+            stmt = stmt.where(Apartment.rooms == rooms)
+        except ValueError:
+            pass
+    if filters.get("этаж"):
+        try:
+            storey = int(filters["этаж"])
+            stmt = stmt.where(Apartment.storey == storey)
+        except ValueError:
+            pass
+    point = parse_point(filters.get(POINT_FILTER) or "")
+    if point:
+        try:
+            radius = float(filters.get(RADIUS_FILTER) or DEFAULT_RADIUS_KM)
+        except ValueError:
+            radius = DEFAULT_RADIUS_KM
+        stmt = stmt.where(within_radius(*point, radius))
+    return stmt
+
+
+def _number(filters: dict, key: str, cast_to: type):
+    try:
+        return cast_to(filters[key]) if filters.get(key) else None
+    except ValueError:
+        return None
+
+
+def filters_match(filters: dict, apartment: Apartment) -> bool:
+    """
+    Проверяет одно объявление по фильтрам поиска без обращения к базе —
+    те же условия, что и apply_search_filters.
+    """
+    if not apartment.is_available:
+        return False
+    fuzzy = is_fuzzy(filters)
+    city = filters.get("город")
+    if city and city.lower() not in (apartment.city or "").lower():
+        if not (fuzzy and similarity(apartment.city, city)
+                >= SIMILARITY_THRESHOLD):
+            return False
+    address = filters.get("адрес")
+    if address and address.lower() not in (apartment.address or "").lower():
+        if not (fuzzy and word_similarity(address, apartment.address)
+                >= WORD_SIMILARITY_THRESHOLD):
+            return False
+    keywords = filters.get(KEYWORDS_FILTER)
+    if keywords and not text_matches(apartment.description, keywords):
+        return False
+
+    price_min = _number(filters, "цена мин", float)
+    if price_min is not None and apartment.price < price_min:
+        return False
+    price_max = _number(filters, "цена макс", float)
+    if price_max is not None and apartment.price > price_max:
+        return False
+    rooms = _number(filters, "комнаты", int)
+    if rooms is not None and apartment.rooms != rooms:
+        return False
+    storey = _number(filters, "этаж", int)
+    if storey is not None and apartment.storey != storey:
+        return False
+
+    point = parse_point(filters.get(POINT_FILTER) or "")
+    if point:
+        if apartment.latitude is None or apartment.longitude is None:
+            return False
+        radius = _number(filters, RADIUS_FILTER, float) or DEFAULT_RADIUS_KM
+        distance = distance_km(*point, apartment.latitude, apartment.longitude)
+        if distance > min(radius, MAX_RADIUS_KM):
+            return False
+    return True
+
+
+def search_rank(filters: dict) -> Optional[ColumnElement]:
+    """
+    Возвращает выражение релевантности в тысячных долях — сумму
+    триграммного сходства города и адреса с запросом при нечетком поиске
+    и релевантности описания ключевым словам — или None, если
+    ранжировать нечего.
+    """
+    parts = []
+    if is_fuzzy(filters) and filters.get("город"):
+        parts.append(func.similarity(Apartment.city, filters["город"]))
+    if is_fuzzy(filters) and filters.get("адрес"):
+        parts.append(
+            func.word_similarity(filters["адрес"], Apartment.address))
+    if filters.get(KEYWORDS_FILTER):
+        parts.append(keyword_relevance(filters[KEYWORDS_FILTER]))
+    if not parts:
+        return None
+    return cast(reduce(operator.add, parts) * 1000, Integer)
+
+
+def make_cursor(
+    created_at: datetime.datetime,
+    apartment_id: int,
+    rank: Optional[int] = None
+) -> Cursor:
+    """
+    Возвращает курсор объявления, пригодный для хранения в FSM:
+    (created_at, id) или (created_at, id, rank) при ранжированном поиске.
+    """
+    cursor = (created_at.isoformat(), apartment_id)
+    if rank is not None:
+        cursor += (rank,)
+    return cursor
+
+
+def encode_cursor(apartment: Apartment, rank: Optional[int] = None) -> Cursor:
+    """Возвращает курсор объявления (см. make_cursor)."""
+    return make_cursor(apartment.created_at, apartment.id, rank)
+
+
+def decode_cursor(cursor: Sequence) -> tuple:
+    """
+    Восстанавливает значения ключа сортировки из сохраненного курсора
+    в порядке сортировки: ([rank,] created_at, id).
+    """
+    created_at, apartment_id, *rank = cursor
+    key = (datetime.datetime.fromisoformat(created_at), int(apartment_id))
+    return tuple(int(value) for value in rank) + key
+
+
+def _sort_columns(filters: dict) -> tuple:
+    """
+    Возвращает колонки сортировки результатов и выражение релевантности
+    (NULL, если поиск не ранжируется).
+    """
+    rank = search_rank(filters)
+    sort_columns = [Apartment.created_at, Apartment.id]
+    if rank is not None:
+        sort_columns.insert(0, rank)
+    else:
+        rank = cast(None, Integer)
+    return sort_columns, rank.label("rank")
+
+
+def search_page_statement(
+    filters: dict,
+    after: Optional[Cursor] = None,
+    before: Optional[Cursor] = None,
+    limit: int = PAGE_SIZE
+) -> Select:
+    """
+    Строит запрос одной страницы поиска (см. search_apartments_page).
+    Вторая колонка результата — релевантность или NULL.
+    """
+    sort_columns, rank = _sort_columns(filters)
+    sort_key = tuple_(*sort_columns)
+    stmt = apply_search_filters(
+        select(Apartment, rank).options(selectinload(Apartment.photos)),
+        filters)
+
+    if before is not None:
+        stmt = stmt.where(sort_key > tuple_(*decode_cursor(before)))
+        stmt = stmt.order_by(*sort_columns)
+    else:
+        if after is not None:
+            stmt = stmt.where(sort_key < tuple_(*decode_cursor(after)))
+        stmt = stmt.order_by(*(column.desc() for column in sort_columns))
+    return stmt.limit(limit)
+
+
+def search_cursors_statement(filters: dict, limit: int) -> Select:
+    """
+    Строит запрос курсоров (created_at, id, rank) первых limit
+    результатов поиска — без строк объявлений и фотографий.
+    """
+    sort_columns, rank = _sort_columns(filters)
+    stmt = apply_search_filters(
+        select(Apartment.created_at, Apartment.id, rank), filters)
+    stmt = stmt.order_by(*(column.desc() for column in sort_columns))
+    return stmt.limit(limit)
+
+
+def _cache_city_key(filters: dict) -> CityKey:
+    city = (filters.get("город") or "").strip().lower()
+    return (city, is_fuzzy(filters)) if city else None
+
+
+async def count_apartments(session: AsyncSession, filters: dict) -> int:
+    """
+    Возвращает количество доступных объявлений, подходящих под фильтры.
+
+    Если результатов не больше search_cache.max_ids, их упорядоченные
+    курсоры вторым запросом сохраняются в кэш результатов, и страницы
+    этого поиска потом отдаются из кэша. Большой результат стоит одного
+    COUNT(*).
+    """
+    key = normalize_filters(filters)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return len(cached[0])
+
+    generation = search_cache.generation
+    stmt = apply_search_filters(
+        select(func.count()).select_from(Apartment), filters)
+    count = (await session.execute(stmt)).scalar_one()
+    if count > search_cache.max_ids:
+        return count
+
+    # Лишний курсор не даст закэшировать урезанный результат, если между
+    # запросами объявлений стало больше max_ids (put такой отбросит).
+    result = await session.execute(
+        search_cursors_statement(filters, search_cache.max_ids + 1))
+    cursors = [make_cursor(*row) for row in result]
+    search_cache.put(key, _cache_city_key(filters), cursors, generation)
+    return len(cursors)
+
+
+def _slice_cursors(
+    cursors: list,
+    positions: dict,
+    after: Optional[Cursor],
+    before: Optional[Cursor],
+    limit: int
+) -> Optional[list]:
+    """
+    Вырезает из закэшированного результата страницу после after или
+    перед before. None — курсора нет в результате.
+    """
+    if before is not None:
+        end = positions.get(int(before[1]))
+        if end is None:
+            return None
+        return cursors[max(end - limit, 0):end]
+    start = 0
+    if after is not None:
+        start = positions.get(int(after[1]))
+        if start is None:
+            return None
+        start += 1
+    return cursors[start:start + limit]
+
+
+async def load_apartments(
+    session: AsyncSession,
+    apartment_ids: list[int]
+) -> list[Apartment]:
+    """
+    Возвращает объявления с фотографиями в порядке apartment_ids.
+    Уже загруженные берутся из кэша, остальные — одним запросом.
+    """
+    apartments = {}
+    missing = []
+    for apartment_id in apartment_ids:
+        apartment = search_cache.get_listing(apartment_id)
+        if apartment is None:
+            missing.append(apartment_id)
+        else:
+            apartments[apartment_id] = apartment
+
+    if missing:
+        generation = search_cache.generation
+        result = await session.execute(
+            select(Apartment)
+            .options(selectinload(Apartment.photos))
+            .where(Apartment.id.in_(missing))
+        )
+        for apartment in result.scalars():
+            apartments[apartment.id] = apartment
+            search_cache.put_listing(apartment, generation)
+
+    return [
+        apartments[apartment_id] for apartment_id in apartment_ids
+        if apartment_id in apartments
+    ]
+
+
+async def search_apartments_page(
+    session: AsyncSession,
+    filters: dict,
+    after: Optional[Cursor] = None,
+    before: Optional[Cursor] = None,
+    limit: int = PAGE_SIZE
+) -> SearchPage:
+    """
+    Возвращает одну страницу объявлений, отсортированных от новых к старым
+    (при нечетком поиске и поиске по ключевым словам — сначала по
+    релевантности), используя keyset-пагинацию по ([rank,] created_at, id).
+
+    Параметры:
+      session (AsyncSession): асинхронная сессия SQLAlchemy.
+      filters (dict): фильтры поиска.
+      after (Cursor): курсор последнего объявления предыдущей страницы —
+        для перехода вперед.
+      before (Cursor): курсор первого объявления текущей страницы —
+        для перехода назад.
+      limit (int): размер страницы.
+
+    Возвращает:
+      SearchPage: объявления страницы с загруженными фотографиями и
+      курсоры первого и последнего из них. Стоимость запроса не зависит
+      от номера страницы; если результат поиска есть в кэше, страница
+      собирается из кэша.
+    """
+    cached = search_cache.get(normalize_filters(filters))
+    if cached is not None:
+        page_cursors = _slice_cursors(*cached, after, before, limit)
+        if page_cursors is not None:
+            apartments = await load_apartments(
+                session, [cursor[1] for cursor in page_cursors])
+            if not page_cursors:
+                return SearchPage([], None, None)
+            return SearchPage(apartments, page_cursors[0], page_cursors[-1])
+
+    stmt = search_page_statement(filters, after, before, limit)
+    result = await session.execute(stmt)
+    rows = list(result.all())
+    if before is not None:
+        rows.reverse()
+    if not rows:
+        return SearchPage([], None, None)
+    return SearchPage(
+        [apartment for apartment, _ in rows],
+        encode_cursor(*rows[0]),
+        encode_cursor(*rows[-1]))
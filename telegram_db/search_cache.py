@@ -0,0 +1,156 @@
+"""
+Кэш результатов поиска.
+
+Для набора фильтров хранится упорядоченный список курсоров найденных
+объявлений (в курсоре есть id), а для самих объявлений — отдельный
+LRU-кэш загруженных строк с фотографиями. Оба кэша сбрасываются при
+изменении объявлений: create_apartment, delete_apartment и
+update_apartment_availability сбрасывают только наборы фильтров, под
+которые может попасть город измененного объявления, и саму строку.
+В многопроцессном режиме invalidate_search_cache рассылает сброс
+остальным воркерам.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from telegram import events
+from telegram.config import (
+    SEARCH_CACHE_LISTINGS, SEARCH_CACHE_MAX_IDS, SEARCH_CACHE_SIZE)
+from telegram_db.models import Apartment
+from telegram_db.trigram import SIMILARITY_THRESHOLD, similarity
+
+
+# Фильтр города результата: (значение в нижнем регистре, нечеткий ли
+# поиск) или None, если город не задан.
+CityKey = Optional[Tuple[str, bool]]
+
+
+def _city_matches(city_filter: str, fuzzy: bool, city: str) -> bool:
+    city = (city or "").lower()
+    if city_filter in city:
+        return True
+    return fuzzy and similarity(city, city_filter) >= SIMILARITY_THRESHOLD
+
+
+class SearchResultCache:
+    """
+    LRU-кэш результатов поиска с точечной инвалидацией по городу.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        max_ids: int,
+        max_listings: int
+    ) -> None:
+        self.maxsize = maxsize
+        self.max_ids = max_ids
+        self.max_listings = max_listings
+        self.hits = 0
+        self.misses = 0
+        # Увеличивается при каждой инвалидации: результат запроса,
+        # начатого до нее, сохранять нельзя.
+        self.generation = 0
+        self._results: OrderedDict = OrderedDict()
+        # Фильтр города (None — без фильтра) → ключи результатов.
+        self._by_city: Dict[tuple, set] = {}
+        self._listings: OrderedDict = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        """
+        Возвращает (курсоры, позиции id) для ключа фильтров или None.
+        """
+        entry = self._results.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._results.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(
+        self,
+        key: tuple,
+        city_key: CityKey,
+        cursors: list,
+        generation: int
+    ) -> None:
+        """
+        Сохраняет упорядоченные курсоры результата поиска. city_key —
+        фильтр города, по которому результат будет сбрасываться;
+        generation — значение self.generation до начала запроса.
+        """
+        if generation != self.generation or len(cursors) > self.max_ids:
+            return
+        positions = {cursor[1]: index for index, cursor in enumerate(cursors)}
+        self._drop(key)
+        self._results[key] = (city_key, cursors, positions)
+        self._by_city.setdefault(city_key, set()).add(key)
+        while len(self._results) > self.maxsize:
+            self._drop(next(iter(self._results)))
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._results.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_city[entry[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_city[entry[0]]
+
+    def get_listing(self, apartment_id: int) -> Optional[Apartment]:
+        apartment = self._listings.get(apartment_id)
+        if apartment is not None:
+            self._listings.move_to_end(apartment_id)
+        return apartment
+
+    def put_listing(self, apartment: Apartment, generation: int) -> None:
+        if generation != self.generation:
+            return
+        self._listings[apartment.id] = apartment
+        self._listings.move_to_end(apartment.id)
+        while len(self._listings) > self.max_listings:
+            self._listings.popitem(last=False)
+
+    def invalidate(self, apartment_id: Optional[int], city: str) -> None:
+        """
+        Сбрасывает закэшированную строку объявления и результаты всех
+        поисков, в которые объявление из города city может попасть
+        (или из которых выпасть). apartment_id = None — новые объявления,
+        строк которых в кэше еще нет.
+        """
+        self.generation += 1
+        self._listings.pop(apartment_id, None)
+        for city_key in list(self._by_city):
+            if city_key is None or _city_matches(*city_key, city):
+                for key in list(self._by_city.get(city_key, ())):
+                    self._drop(key)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._by_city.clear()
+        self._listings.clear()
+
+    def stats(self) -> dict:
+        return {
+            "results": len(self._results),
+            "listings": len(self._listings),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+search_cache = SearchResultCache(
+    maxsize=SEARCH_CACHE_SIZE,
+    max_ids=SEARCH_CACHE_MAX_IDS,
+    max_listings=SEARCH_CACHE_LISTINGS,
+)
+
+
+def invalidate_search_cache(apartment_id: Optional[int], city: str) -> None:
+    """Сбрасывает кэш поиска в этом и во всех остальных процессах."""
+    search_cache.invalidate(apartment_id, city)
+    events.emit("search_invalidate", apartment_id, city)
+
+
+events.on("search_invalidate", search_cache.invalidate)
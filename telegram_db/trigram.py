@@ -0,0 +1,119 @@
+"""
+Нечеткое сравнение строк по триграммам.
+
+В PostgreSQL используется расширение pg_trgm и его GIN-индексы. Для
+остальных бэкендов (SQLite в тестах) функции ``similarity`` и
+``word_similarity`` реализованы на Python с той же семантикой и
+регистрируются в каждом новом соединении.
+"""
+import re
+
+from sqlalchemy import Boolean, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+# Значения по умолчанию pg_trgm.similarity_threshold и
+# pg_trgm.word_similarity_threshold.
+SIMILARITY_THRESHOLD = 0.3
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall((text or "").lower())
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Возвращает множество триграмм строки так же, как pg_trgm: каждое слово
+    дополняется двумя пробелами слева и одним справа.
+    """
+    result = set()
+    for word in _words(text):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(left: str, right: str) -> float:
+    """Доля общих триграмм двух строк (аналог similarity из pg_trgm)."""
+    left_set, right_set = trigrams(left), trigrams(right)
+    if not left_set or not right_set:
+        return 0.0
+    return len(left_set & right_set) / len(left_set | right_set)
+
+
+def word_similarity(query: str, text: str) -> float:
+    """
+    Наибольшее сходство запроса с непрерывным фрагментом текста из
+    целых слов (приближение word_similarity из pg_trgm).
+    """
+    words = _words(text)
+    width = max(len(_words(query)), 1)
+    best = 0.0
+    for size in range(1, width + 1):
+        for start in range(len(words) - size + 1):
+            best = max(
+                best, similarity(query, " ".join(words[start:start + size])))
+    return best
+
+
+class trigram_match(FunctionElement):
+    """
+    Условие «column похожа на value»: в PostgreSQL — оператор ``%``,
+    использующий GIN-индекс, в остальных СУБД — сравнение similarity
+    с порогом.
+    """
+    type = Boolean()
+    inherit_cache = True
+
+
+class word_trigram_match(FunctionElement):
+    """
+    Условие «value похожа на часть column»: в PostgreSQL — оператор
+    ``<%``, в остальных СУБД — сравнение word_similarity с порогом.
+    """
+    type = Boolean()
+    inherit_cache = True
+
+
+@compiles(trigram_match)
+def _compile_trigram_match(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return (
+        f"(similarity({compiler.process(column, **kw)}, "
+        f"{compiler.process(value, **kw)}) >= {SIMILARITY_THRESHOLD})"
+    )
+
+
+@compiles(trigram_match, "postgresql")
+def _compile_trigram_match_pg(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return compiler.process(column.op("%")(value), **kw)
+
+
+@compiles(word_trigram_match)
+def _compile_word_trigram_match(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return (
+        f"(word_similarity({compiler.process(value, **kw)}, "
+        f"{compiler.process(column, **kw)}) >= {WORD_SIMILARITY_THRESHOLD})"
+    )
+
+
+@compiles(word_trigram_match, "postgresql")
+def _compile_word_trigram_match_pg(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return compiler.process(value.op("<%")(column), **kw)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record) -> None:
+    """Регистрирует триграммные функции в соединениях SQLite."""
+    if not hasattr(dbapi_connection, "create_function"):
+        return
+    dbapi_connection.create_function("similarity", 2, similarity)
+    dbapi_connection.create_function("word_similarity", 2, word_similarity)
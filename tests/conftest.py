@@ -0,0 +1,34 @@
+import asyncio
+import os
+
+import pytest
+
+# Токен нужен telegram.config при импорте модулей бота.
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:TEST-TOKEN")
+
+from aiogram import Bot  # noqa: E402
+from sqlalchemy.ext.asyncio import (  # noqa: E402
+    AsyncSession, async_sessionmaker, create_async_engine)
+
+from telegram_db.models import Base  # noqa: E402
+from tests.helpers import RecordingSession  # noqa: E402
+
+
+@pytest.fixture
+def bot() -> Bot:
+    return Bot(token=os.environ["TELEGRAM_TOKEN"], session=RecordingSession())
+
+
+@pytest.fixture
+def session_factory():
+    """Фабрика сессий чистой базы SQLite в памяти."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+
+    async def create() -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    yield async_sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession)
+    asyncio.run(engine.dispose())
@@ -0,0 +1,44 @@
+import datetime
+
+from aiogram import types
+from aiogram.client.session.base import BaseSession
+
+from telegram_db.models import Apartment
+
+
+class RecordingSession(BaseSession):
+    """Сессия бота без сети: запоминает вызовы Bot API."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append(method)
+        return None
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def message_update(update_id: int = 1, **fields) -> types.Update:
+    """Апдейт с сообщением пользователя 1 в личном чате 1."""
+    return types.Update(
+        update_id=update_id,
+        message=types.Message(
+            message_id=update_id,
+            date=datetime.datetime.now(),
+            chat=types.Chat(id=1, type="private"),
+            from_user=types.User(id=1, is_bot=False, first_name="Тест"),
+            **fields))
+
+
+def make_apartment(**fields) -> Apartment:
+    values = dict(
+        owner_id="1", city="Москва", address="Тверская, 1", price=30000,
+        storey=1, rooms=1, description="", is_available=True)
+    values.update(fields)
+    return Apartment(**values)
@@ -0,0 +1,105 @@
+import asyncio
+import datetime
+
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import func, select
+
+from telegram.handlers.address import (
+    choose_address, confirm_address, publish_duplicate)
+from telegram.handlers.basic import process_basic_info
+from telegram.states import Form
+from telegram_db.models import Apartment
+from tests.helpers import message_update
+
+
+ADDRESS = {
+    "house_number": "1", "road": "Тверская улица", "region": "Москва",
+    "city": "Москва", "display_name": "Тверская улица, 1, Москва",
+    "lat": 55.76, "lon": 37.61,
+}
+DRAFT = {
+    "owner_id": "1", "price": 30000.0, "storey": 1.0, "rooms": 1,
+    "description": "Светлая квартира", "photo_file_ids": ["photo"],
+    "photo_unique_ids": ["unique"], "photo_hashes": [None],
+    "all_addresses": [ADDRESS], "current_index": 0,
+}
+
+
+def context(bot) -> FSMContext:
+    return FSMContext(
+        storage=MemoryStorage(),
+        key=StorageKey(bot_id=bot.id, chat_id=1, user_id=1))
+
+
+def callback(bot, data: str) -> types.CallbackQuery:
+    message = types.Message(
+        message_id=1, date=datetime.datetime.now(),
+        chat=types.Chat(id=1, type="private")).as_(bot)
+    return types.CallbackQuery(
+        id="1", chat_instance="1", data=data, message=message,
+        from_user=types.User(id=1, is_bot=False, first_name="Тест"),
+    ).as_(bot)
+
+
+async def count_apartments(session) -> int:
+    return await session.scalar(select(func.count(Apartment.id)))
+
+
+async def choose_duplicate(bot, session) -> FSMContext:
+    """Публикует черновик и выбирает тот же адрес для его копии."""
+    state = context(bot)
+    for _ in range(2):
+        await state.set_state(Form.confirm_address)
+        await state.set_data(DRAFT)
+        await choose_address(callback(bot, "addr|0"), state, session)
+    return state
+
+
+def test_duplicate_keeps_draft_and_publishes_on_request(
+    bot, session_factory
+):
+    async def run() -> None:
+        async with session_factory() as session:
+            state = await choose_duplicate(bot, session)
+            assert await count_apartments(session) == 1
+            assert await state.get_state() == Form.confirm_address.state
+            data = await state.get_data()
+            assert data["duplicate_id"] is not None
+            assert data["photo_file_ids"] == ["photo"]
+            markup = bot.session.requests[-2].reply_markup
+            assert [row[0].callback_data for row in markup.inline_keyboard] \
+                == ["dup_publish", "dup_edit"]
+
+            await publish_duplicate(
+                callback(bot, "dup_publish"), state, session)
+            assert await count_apartments(session) == 2
+            assert await state.get_state() is None
+
+    asyncio.run(run())
+
+
+def test_duplicate_edit_returns_to_basic_data_keeping_photos(
+    bot, session_factory
+):
+    async def run() -> None:
+        async with session_factory() as session:
+            state = await choose_duplicate(bot, session)
+            await confirm_address(callback(bot, "dup_edit"), state)
+            assert await state.get_state() == Form.basic.state
+
+            message = message_update(text="35000, 2, 1, Другая").message
+            await process_basic_info(message.as_(bot), state)
+            data = await state.get_data()
+            assert await state.get_state() == Form.photos.state
+            assert data["price"] == 35000
+            assert data["photo_file_ids"] == ["photo"]
+            assert data["photo_unique_ids"] == ["unique"]
+
+            await publish_duplicate(
+                callback(bot, "dup_publish"), state, session)
+            assert await count_apartments(session) == 1
+
+    asyncio.run(run())
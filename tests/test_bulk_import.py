@@ -0,0 +1,85 @@
+import asyncio
+import datetime
+import io
+
+import pytest
+from aiogram import Bot, types
+from aiogram.methods import DeleteMessage, SendMessage
+
+from telegram.handlers import bulk_import
+from telegram.listing_import import (
+    ImportResult, import_listings, needs_geocoding)
+from telegram.main import dp
+from tests.helpers import RecordingSession, message_update
+
+
+CSV = "цена;этаж;комнаты;описание;адрес;город;широта;долгота\n".encode()
+
+
+class MessageSession(RecordingSession):
+    """Отвечает на SendMessage сообщением, как Bot API."""
+
+    async def make_request(self, bot, method, timeout=None):
+        await super().make_request(bot, method, timeout)
+        if isinstance(method, SendMessage):
+            return types.Message(
+                message_id=len(self.requests) + 100,
+                date=datetime.datetime.now(),
+                chat=types.Chat(id=method.chat_id, type="private"),
+                text=method.text).as_(bot)
+        return True
+
+
+def test_rows_without_city_or_latitude_need_geocoding():
+    assert needs_geocoding({"city": "Москва", "lat": "55.7"}) is False
+    assert needs_geocoding({"city": "Москва", "lat": ""}) is True
+    assert needs_geocoding({"lat": 55.7}) is True
+
+
+def test_import_rejects_file_with_too_many_rows_to_geocode():
+    rows = CSV + (
+        "30000;1;1;;Тверская, 1;Москва;55.7;37.6\n"
+        "30000;1;1;;Тверская, 2;;;\n"
+        "30000;1;1;;Тверская, 3;Москва;;\n").encode()
+
+    with pytest.raises(ValueError, match="без города или широты — 2"):
+        asyncio.run(import_listings(rows, "a.csv", "1", max_geocoded=1))
+
+
+def test_document_is_imported_in_background(monkeypatch):
+    bot = Bot(token="123456:TEST-TOKEN", session=MessageSession())
+    release = asyncio.Event()
+    calls = []
+
+    async def download(self, file, *args, **kwargs):
+        return io.BytesIO(CSV)
+
+    async def fake_import(data, filename, owner_id, progress=None):
+        calls.append((data, filename, owner_id))
+        await release.wait()
+        return ImportResult(3, 2, [(3, "Повтор объявления.")], 1.0)
+
+    monkeypatch.setattr(Bot, "download", download)
+    monkeypatch.setattr(bulk_import, "import_listings", fake_import)
+    document = types.Document(
+        file_id="file", file_unique_id="unique", file_name="a.csv",
+        file_size=100)
+
+    async def run() -> None:
+        await dp.feed_update(bot, message_update(document=document))
+        requests = bot.session.requests
+        assert "Импорт запущен" in requests[0].text
+        await dp.feed_update(bot, message_update(2, document=document))
+        assert "Предыдущий импорт еще идет" in requests[1].text
+
+        task = bulk_import._imports[1]
+        await asyncio.sleep(0)
+        assert calls == [(CSV, "a.csv", "1")]
+        release.set()
+        await task
+        assert isinstance(requests[2], DeleteMessage)
+        assert "Импортировано 2 из 3" in requests[3].text
+        assert "Строка 3: Повтор объявления." in requests[3].text
+        assert bulk_import._imports == {}
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import (
+    AsyncSession, async_sessionmaker, create_async_engine)
+
+from telegram_db.crud import (
+    ApartmentAccessError, ApartmentNotFoundError, delete_apartment,
+    delete_apartments, get_apartment_photo_ids,
+    update_apartment_availability)
+from telegram_db.models import Apartment, Base, Photo
+from tests.helpers import make_apartment
+
+
+async def add_apartment(session_factory, **fields) -> int:
+    async with session_factory() as session:
+        apartment = make_apartment(owner_id="1", **fields)
+        session.add(apartment)
+        await session.commit()
+        return apartment.id
+
+
+async def is_available(session_factory, apartment_id: int):
+    async with session_factory() as session:
+        return await session.scalar(
+            select(Apartment.is_available).where(
+                Apartment.id == apartment_id))
+
+
+def test_photos_of_hidden_listing_are_visible_only_to_owner(
+    session_factory
+):
+    async def run() -> None:
+        async with session_factory() as session:
+            shown = make_apartment(owner_id="1")
+            hidden = make_apartment(owner_id="1", is_available=False)
+            session.add_all([shown, hidden])
+            await session.flush()
+            session.add_all([
+                Photo(apartment_id=apartment.id, file_id=file_id)
+                for apartment in (shown, hidden)
+                for file_id in (f"{apartment.id}-a", f"{apartment.id}-b")])
+            await session.commit()
+
+            assert await get_apartment_photo_ids(
+                session, shown.id, "2") == [f"{shown.id}-a", f"{shown.id}-b"]
+            assert await get_apartment_photo_ids(
+                session, hidden.id, "2") == []
+            assert await get_apartment_photo_ids(
+                session, hidden.id, "1") == [
+                    f"{hidden.id}-a", f"{hidden.id}-b"]
+            assert await get_apartment_photo_ids(session, 999, "1") == []
+
+    asyncio.run(run())
+
+
+def test_toggle_checks_owner(session_factory):
+    async def run() -> None:
+        apartment_id = await add_apartment(session_factory)
+        async with session_factory() as session:
+            with pytest.raises(ApartmentAccessError):
+                await update_apartment_availability(
+                    session, apartment_id, "2")
+            with pytest.raises(ApartmentNotFoundError):
+                await update_apartment_availability(session, 999, "1")
+            await session.commit()
+        assert await is_available(session_factory, apartment_id) is True
+
+        async with session_factory() as session:
+            apartment = await update_apartment_availability(
+                session, apartment_id, "1")
+            await session.commit()
+        assert apartment.is_available is False
+        assert await is_available(session_factory, apartment_id) is False
+
+    asyncio.run(run())
+
+
+def test_delete_checks_owner_and_existence(session_factory):
+    async def run() -> None:
+        apartment_id = await add_apartment(session_factory)
+        async with session_factory() as session:
+            with pytest.raises(ApartmentAccessError):
+                await delete_apartment(session, apartment_id, "2")
+            await delete_apartment(session, apartment_id, "1")
+            await session.commit()
+
+        async with session_factory() as session:
+            # Повторное удаление (например, двойное нажатие кнопки).
+            with pytest.raises(ApartmentNotFoundError):
+                await delete_apartment(session, apartment_id, "1")
+            assert await delete_apartments(
+                session, [apartment_id], "1") == []
+        assert await is_available(session_factory, apartment_id) is None
+
+    asyncio.run(run())
+
+
+def test_concurrent_toggles_both_apply(tmp_path):
+    # Файл, а не :memory:, чтобы у каждой сессии было свое соединение.
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    session_factory = async_sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession)
+
+    async def toggle(apartment_id: int) -> bool:
+        async with session_factory() as session:
+            apartment = await update_apartment_availability(
+                session, apartment_id, "1")
+            await session.commit()
+        return apartment.is_available
+
+    async def run() -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        apartment_id = await add_apartment(session_factory)
+        results = await asyncio.gather(
+            toggle(apartment_id), toggle(apartment_id))
+        assert sorted(results) == [False, True]
+        assert await is_available(session_factory, apartment_id) is True
+
+    asyncio.run(run())
+    asyncio.run(engine.dispose())
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from telegram_db.crud import find_duplicate
+from telegram_db.dedup import PhotoHashIndex, listing_fingerprint
+from telegram_db.models import Photo
+from tests.helpers import make_apartment
+
+
+BASE_HASH = 0x0123_4567_89AB_CDEF
+
+
+def flip(value: int, *bits: int) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+@pytest.mark.parametrize("bits, found", [
+    ((), True),
+    ((0,), True),
+    # Все отличия в одной 16-битной части.
+    ((0, 1, 2, 3, 4), True),
+    # По одному отличию в каждой части и еще одно.
+    ((1, 17, 33, 49, 63), True),
+    ((0, 1, 2, 3, 4, 5), False),
+    ((1, 17, 33, 49, 62, 63), False),
+])
+def test_photo_index_finds_hashes_within_distance(bits, found):
+    index = PhotoHashIndex(max_distance=5)
+    index.add([(BASE_HASH, 1), (~BASE_HASH, 2)])
+    assert index.search(flip(BASE_HASH, *bits)) == ({1} if found else set())
+
+
+def test_photo_index_handles_signed_hashes():
+    index = PhotoHashIndex(max_distance=2)
+    signed = BASE_HASH - (1 << 64)
+    index.add([(signed, 1), (signed, 2)])
+    assert len(index) == 1
+    assert index.search(BASE_HASH) == {1, 2}
+    assert index.search(flip(signed, 63)) == {1, 2}
+
+
+def test_fingerprint_ignores_address_form():
+    assert listing_fingerprint("ул. Тверская, 1", 30000, 1, 2) == \
+        listing_fingerprint("тверская улица 1", 30000.0, 1, 2)
+    assert listing_fingerprint("Тверская, 1", 30000, 1, 2) != \
+        listing_fingerprint("Тверская, 1", 31000, 1, 2)
+
+
+def test_find_duplicate_by_photo_hash(session_factory, monkeypatch):
+    index = PhotoHashIndex(max_distance=5)
+    monkeypatch.setattr("telegram_db.crud.photo_index", index)
+
+    async def run() -> None:
+        async with session_factory() as session:
+            apartment = make_apartment(address="Арбат, 2")
+            session.add(apartment)
+            await session.flush()
+            session.add(Photo(
+                apartment_id=apartment.id, file_id="f", phash=BASE_HASH))
+            index.add([(BASE_HASH, apartment.id)])
+
+            fields = dict(
+                session=session, address="Тверская, 1", price=1, rooms=1,
+                storey=1)
+            assert await find_duplicate(
+                **fields, photo_hashes=[flip(BASE_HASH, 3)]) == apartment.id
+            assert await find_duplicate(
+                **fields, photo_hashes=[~BASE_HASH, None]) is None
+
+    asyncio.run(run())
@@ -0,0 +1,225 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from telegram import fsm_storage
+from telegram.fsm_storage import (
+    COMPRESS_THRESHOLD, ENTRY_OVERHEAD, BoundedMemoryStorage,
+    FSMSnapshotMiddleware, SQLStorage, pack_data, refresh_snapshot,
+    unpack_data)
+from telegram.states import Form
+
+
+KEY = StorageKey(bot_id=1, chat_id=1, user_id=1)
+OTHER_KEY = StorageKey(bot_id=1, chat_id=2, user_id=2)
+
+
+def run_update(storage: SQLStorage, handler) -> None:
+    """Обрабатывает «апдейт» handler'ом под снимком, как telegram.main."""
+    middleware = FSMSnapshotMiddleware(storage)
+
+    async def call(event, data) -> None:
+        await handler(FSMContext(storage, KEY), FSMContext(storage, OTHER_KEY))
+
+    asyncio.run(middleware(call, None, {}))
+
+
+def outside_update(coro) -> asyncio.Task:
+    """Задача вне снимка апдейта, как у отложенного обработчика альбома."""
+    return contextvars.Context().run(asyncio.create_task, coro)
+
+
+def test_pack_data_round_trip():
+    small = {"price": 30000}
+    large = {"description": "квартира " * COMPRESS_THRESHOLD}
+    assert pack_data({}) is None
+    assert pack_data(small)[:1] == b"j"
+    assert pack_data(large)[:1] == b"z"
+    for data in (small, large):
+        assert unpack_data(pack_data(data)) == data
+
+
+def test_update_costs_one_read_and_one_write(session_factory):
+    storage = SQLStorage(session_factory)
+
+    async def handler(state: FSMContext, other: FSMContext) -> None:
+        assert await state.get_state() is None
+        await state.set_state(Form.basic)
+        await state.update_data(price=30000)
+        await state.update_data(rooms=2)
+        assert await state.get_state() == Form.basic.state
+        assert await state.get_data() == {"price": 30000, "rooms": 2}
+        # Нетронутый на запись ключ читается, но не записывается.
+        assert await other.get_data() == {}
+
+    run_update(storage, handler)
+    assert storage.stats() == {"reads": 2, "writes": 1, "merges": 0}
+
+    async def check(state: FSMContext, other: FSMContext) -> None:
+        assert await state.get_state() == Form.basic.state
+        assert await state.get_data() == {"price": 30000, "rooms": 2}
+
+    run_update(storage, check)
+    assert storage.stats() == {"reads": 3, "writes": 1, "merges": 0}
+
+
+def test_clear_deletes_record(session_factory):
+    storage = SQLStorage(session_factory)
+
+    async def fill(state: FSMContext, other: FSMContext) -> None:
+        await state.set_state(Form.photos)
+        await state.set_data({"photo_file_ids": ["photo"]})
+
+    async def clear(state: FSMContext, other: FSMContext) -> None:
+        await state.clear()
+
+    async def check(state: FSMContext, other: FSMContext) -> None:
+        assert await state.get_state() is None
+        assert await state.get_data() == {}
+
+    for handler in (fill, clear, check):
+        run_update(storage, handler)
+    assert storage.writes == 2
+
+
+def test_refresh_snapshot_rereads_unchanged_keys(session_factory):
+    storage = SQLStorage(session_factory)
+
+    async def handler(state: FSMContext, other: FSMContext) -> None:
+        await state.get_data()
+        await other.set_data({"query": "Москва"})
+        # Изменение вне снимка, как у отложенного обработчика альбома.
+        await outside_update(
+            storage.set_data(KEY, {"photo_file_ids": ["photo"]}))
+        assert await state.get_data() == {}
+        refresh_snapshot()
+        assert await state.get_data() == {"photo_file_ids": ["photo"]}
+        assert await other.get_data() == {"query": "Москва"}
+
+    run_update(storage, handler)
+    assert storage.stats() == {"reads": 4, "writes": 2, "merges": 0}
+
+
+def test_concurrent_updates_of_one_chat_keep_both_changes(session_factory):
+    storage = SQLStorage(session_factory)
+    middleware = FSMSnapshotMiddleware(storage)
+    both_loaded = asyncio.Event()
+    loaded = []
+
+    def update(**fields):
+        async def call(event, data) -> None:
+            state = FSMContext(storage, KEY)
+            await state.get_data()
+            loaded.append(True)
+            if len(loaded) == 2:
+                both_loaded.set()
+            await both_loaded.wait()
+            await state.update_data(**fields)
+        return middleware(call, None, {})
+
+    async def run() -> None:
+        await storage.set_data(KEY, {"price": 30000, "rooms": 1})
+        await asyncio.gather(update(rooms=2), update(city="Москва"))
+        assert await storage.get_data(KEY) == {
+            "price": 30000, "rooms": 2, "city": "Москва"}
+
+    asyncio.run(run())
+    assert storage.merges == 1
+
+
+def test_album_write_is_merged_into_snapshot(session_factory):
+    storage = SQLStorage(session_factory)
+
+    async def handler(state: FSMContext, other: FSMContext) -> None:
+        await state.set_state(Form.photos)
+        await state.update_data(draft=True)
+        # Отложенный обработчик альбома пишет вне снимка.
+        await outside_update(
+            storage.update_data(KEY, {"photo_file_ids": ["photo"]}))
+
+    run_update(storage, handler)
+
+    async def check(state: FSMContext, other: FSMContext) -> None:
+        assert await state.get_state() == Form.photos.state
+        assert await state.get_data() == {
+            "draft": True, "photo_file_ids": ["photo"]}
+
+    run_update(storage, check)
+
+
+def test_failed_update_is_not_written(session_factory):
+    storage = SQLStorage(session_factory)
+
+    async def handler(state: FSMContext, other: FSMContext) -> None:
+        await state.set_state(Form.basic)
+        raise RuntimeError("handler failed")
+
+    with pytest.raises(RuntimeError):
+        run_update(storage, handler)
+    assert storage.writes == 0
+
+
+def memory_key(number: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=number, user_id=number)
+
+
+def test_memory_storage_evicts_least_recently_used():
+    # Бюджет на три записи с небольшими данными.
+    storage = BoundedMemoryStorage(
+        memory_budget=3 * (ENTRY_OVERHEAD + 100), idle_ttl=3600)
+
+    async def run() -> None:
+        for number in range(3):
+            await storage.set_data(memory_key(number), {"n": number})
+        # Чтение делает запись самой свежей: вытеснится вторая.
+        assert await storage.get_data(memory_key(0)) == {"n": 0}
+        await storage.set_data(memory_key(3), {"n": 3})
+        assert await storage.get_data(memory_key(1)) == {}
+        for number in (0, 2, 3):
+            assert await storage.get_data(memory_key(number)) == {
+                "n": number}
+
+    asyncio.run(run())
+    stats = storage.stats()
+    assert stats["entries"] == 3 and stats["evictions"] == 1
+    assert stats["memory"] <= storage.memory_budget
+
+
+def test_memory_storage_expires_idle_records(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fsm_storage.time, "monotonic", lambda: now[0])
+    storage = BoundedMemoryStorage(idle_ttl=60)
+
+    async def run() -> None:
+        await storage.set_state(memory_key(1), Form.basic)
+        await storage.set_data(memory_key(2), {"price": 30000})
+        now[0] += 40
+        assert await storage.get_state(memory_key(1)) == Form.basic.state
+        now[0] += 40
+        # Вторую запись не читали 80 секунд, первую — 40.
+        assert await storage.get_data(memory_key(2)) == {}
+        assert await storage.get_state(memory_key(1)) == Form.basic.state
+
+    asyncio.run(run())
+    assert storage.stats() == {
+        "entries": 1, "memory": storage.memory, "evictions": 0,
+        "expirations": 1}
+
+
+def test_memory_storage_clear_frees_memory():
+    storage = BoundedMemoryStorage()
+
+    async def run() -> None:
+        context = FSMContext(storage, KEY)
+        await context.set_state(Form.photos)
+        await context.update_data(photo_file_ids=["photo"])
+        assert storage.memory > 0
+        await context.clear()
+
+    asyncio.run(run())
+    assert storage.stats()["entries"] == 0
+    assert storage.memory == 0
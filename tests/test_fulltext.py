@@ -0,0 +1,79 @@
+import pytest
+
+from telegram_db import fulltext, keyword_index
+from telegram_db.fulltext import (
+    STEMMING_AVAILABLE, parse_query, stem, text_matches, text_rank)
+
+
+needs_stemmer = pytest.mark.skipif(
+    not STEMMING_AVAILABLE, reason="snowballstemmer не установлен")
+
+
+@pytest.fixture
+def without_stemmer(monkeypatch):
+    """Режим без snowballstemmer: совпадения по префиксу."""
+    monkeypatch.setattr(fulltext, "STEMMING_AVAILABLE", False)
+    monkeypatch.setattr(keyword_index, "STEMMING_AVAILABLE", False)
+    monkeypatch.setattr(fulltext, "_stemmer", None)
+    fulltext.document_terms.cache_clear()
+    fulltext.parse_query.cache_clear()
+    yield
+    fulltext.document_terms.cache_clear()
+    fulltext.parse_query.cache_clear()
+
+
+# Лексемы, которые дает to_tsvector('russian', слово) в PostgreSQL
+# (словарь russian_stem, алгоритм Snowball).
+@needs_stemmer
+@pytest.mark.parametrize("word, lexeme", [
+    ("балкон", "балкон"),
+    ("балконом", "балкон"),
+    ("балконы", "балкон"),
+    ("мебель", "мебел"),
+    ("мебелью", "мебел"),
+    ("квартиры", "квартир"),
+    ("квартира", "квартир"),
+    ("евроремонтом", "евроремонт"),
+    ("светлая", "светл"),
+    ("светлую", "светл"),
+    ("красивейший", "красив"),
+    ("осторожность", "осторожн"),
+    ("парковкой", "парковк"),
+    ("стиральная", "стиральн"),
+    ("одеваться", "одева"),
+    ("Ёлка", "елк"),
+])
+def test_stem_matches_postgres_russian_config(word, lexeme):
+    assert stem(word) == lexeme
+
+
+@needs_stemmer
+def test_query_syntax():
+    assert parse_query('с мебелью -балкон or "евроремонт"') == (
+        (frozenset({"мебел"}), frozenset({"балкон"})),
+        (frozenset({"евроремонт"}), frozenset()),
+    )
+    assert parse_query("и в на") == ()
+
+
+@needs_stemmer
+def test_text_matches_word_forms_and_negation():
+    text = "Светлая квартира с балконом и мебелью"
+    assert text_matches(text, "балкон мебель")
+    assert not text_matches(text, "балкон -мебель")
+    assert text_matches(text, "студия or квартиры")
+    assert not text_matches(text, "и")
+
+
+def test_rank_grows_with_occurrences():
+    assert text_rank("мебель, мебель", "мебель") > text_rank(
+        "мебель", "мебель") > text_rank("балкон", "мебель") == 0
+
+
+def test_prefix_matching_without_stemmer(without_stemmer):
+    text = "Светлая квартира с балконом и мебелью"
+    assert text_matches(text, "балкон мебел")
+    assert not text_matches(text, "балконы")
+    assert not text_matches(text, "балкон -мебел")
+    assert text_rank("мебель, мебелью", "мебел") > text_rank(
+        "мебель", "мебел")
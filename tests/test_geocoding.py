@@ -0,0 +1,101 @@
+import asyncio
+import datetime
+
+import pytest
+
+from telegram import cache, geocoding
+from telegram.geocoding import GeocodingError, NominatimClient
+from telegram_db.crud import get_cached_geocode
+from telegram_db.models import GeocodeCache
+
+
+class SlowClient(NominatimClient):
+    """Клиент, запрос которого выполняется, пока его не отпустят."""
+
+    def __init__(self) -> None:
+        super().__init__("http://nominatim.test", user_agent="tests")
+        self.requests = 0
+        self.release = asyncio.Event()
+
+    async def _request(self, address: str) -> list:
+        self.requests += 1
+        await self.release.wait()
+        return [{"display_name": address}]
+
+
+def test_concurrent_searches_share_one_request():
+    async def run() -> list:
+        client = SlowClient()
+        tasks = [asyncio.create_task(client.search(address))
+                 for address in ("Москва, Тверская 1", "москва тверская 1")]
+        await asyncio.sleep(0)
+        client.release.set()
+        results = await asyncio.gather(*tasks)
+        assert client.requests == 1
+        return results
+
+    first, second = asyncio.run(run())
+    assert first == second
+
+
+def test_leader_cancellation_does_not_cancel_followers():
+    async def run() -> None:
+        client = SlowClient()
+        leader = asyncio.create_task(client.search("Москва, Тверская 1"))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(client.search("Москва, Тверская 1"))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        with pytest.raises(GeocodingError):
+            await follower
+        assert not client._inflight
+
+    asyncio.run(run())
+
+
+def test_empty_result_expires_sooner(session_factory, monkeypatch):
+    now = [1000.0]
+    found = [[], [{"city": "Москва"}]]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(geocoding, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(geocoding, "_cache", cache.TTLCache(10, ttl=3600))
+
+    async def search(address: str) -> list:
+        return found.pop(0)
+
+    monkeypatch.setattr(geocoding.nominatim, "search", search)
+
+    async def run() -> None:
+        assert await geocoding.geocode_address("Нигде, 1") == []
+        assert await geocoding.geocode_address("Нигде, 1") == []
+        now[0] += geocoding.GEOCODE_NEGATIVE_TTL + 1
+        # Запись в базе моложе GEOCODE_NEGATIVE_TTL: ее берем снова.
+        assert await geocoding.geocode_address("Нигде, 1") == []
+        assert found == [[{"city": "Москва"}]]
+
+    asyncio.run(run())
+
+
+def test_db_cache_drops_stale_empty_results(session_factory):
+    hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    week = datetime.timedelta(days=7)
+    ten_minutes = datetime.timedelta(minutes=10)
+
+    async def run() -> None:
+        async with session_factory() as session:
+            session.add_all([
+                GeocodeCache(query="пусто", result="[]", created_at=hour_ago),
+                GeocodeCache(
+                    query="москва", result='[{"city": "Москва"}]',
+                    created_at=hour_ago)])
+            await session.commit()
+            assert await get_cached_geocode(
+                session, "пусто", week, ten_minutes) is None
+            assert await get_cached_geocode(session, "пусто", week) == []
+            assert await get_cached_geocode(
+                session, "москва", week, ten_minutes) == [{"city": "Москва"}]
+
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from telegram_db.crud import create_apartment, delete_apartments
+from telegram_db.fulltext import text_rank
+from telegram_db.keyword_index import KeywordIndex, keyword_index
+from tests.test_fulltext import needs_stemmer, without_stemmer  # noqa: F401
+
+
+DESCRIPTIONS = {
+    1: "Светлая квартира с балконом",
+    2: "Квартира с мебелью, без балкона",
+    3: "Студия с мебелью и балконами, балкон застеклен",
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_keyword_index():
+    yield
+    keyword_index.clear()
+
+
+def make_index() -> KeywordIndex:
+    index = KeywordIndex()
+    index.add(DESCRIPTIONS.items())
+    return index
+
+
+@needs_stemmer
+def test_search_intersects_and_excludes_terms():
+    index = make_index()
+    assert index.search("балконы") == {1, 2, 3}
+    assert index.search("балкон мебель") == {2, 3}
+    assert index.search("балкон -мебель") == {1}
+    assert index.search("студия or светлые") == {1, 3}
+    assert index.search("парковка") == set()
+    assert index.search("и") == set()
+
+
+@needs_stemmer
+def test_rank_matches_text_rank():
+    index = make_index()
+    for apartment_id in index.search("балкон мебель"):
+        assert index.rank(apartment_id, "балкон мебель") == text_rank(
+            DESCRIPTIONS[apartment_id], "балкон мебель") > 0
+
+
+def test_remove_and_readd_update_postings():
+    index = make_index()
+    index.remove([3, 42])
+    assert len(index) == 2
+    assert index.search("студия") == set()
+    index.add([(1, "Студия")])
+    assert index.search("студия") == {1}
+    assert index.search("светлая") == set()
+    index.remove([1, 2])
+    assert len(index) == 0
+    assert not index._postings and not index._terms
+
+
+def test_prefix_search_without_stemmer(without_stemmer):  # noqa: F811
+    index = make_index()
+    assert index.search("балкон") == {1, 2, 3}
+    assert index.search("балконам") == {3}
+    assert index.search("мебел -студ") == {2}
+
+
+def test_crud_keeps_index_in_sync_after_commit(session_factory):
+    async def run() -> None:
+        async with session_factory() as session:
+            await keyword_index.load(session)
+            apartment = await create_apartment(
+                session, owner_id="1", city="Москва", street="Тверская",
+                address="Тверская, 1", price=30000, storey=1, rooms=1,
+                description="Уютная студия")
+            apartment_id = apartment.id
+            assert keyword_index.search("студия") == set()
+            await session.commit()
+            assert keyword_index.search("студия") == {apartment_id}
+
+            await delete_apartments(session, [apartment_id], "1")
+            await session.rollback()
+            assert keyword_index.search("студия") == {apartment_id}
+            await delete_apartments(session, [apartment_id], "1")
+            await session.commit()
+            assert keyword_index.search("студия") == set()
+
+    asyncio.run(run())
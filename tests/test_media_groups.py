@@ -0,0 +1,116 @@
+import asyncio
+import datetime
+
+from aiogram import types
+
+from telegram.fsm_storage import _snapshot
+from telegram.media_groups import MediaGroupBuffer
+
+
+def photo_message(message_id: int, group: str = "album", chat_id: int = 1):
+    return types.Message(
+        message_id=message_id, date=datetime.datetime.now(),
+        chat=types.Chat(id=chat_id, type="private"), media_group_id=group)
+
+
+def test_album_is_handled_once_in_message_order():
+    buffer = MediaGroupBuffer(delay=0.01)
+    calls = []
+
+    async def handler(messages) -> None:
+        calls.append([message.message_id for message in messages])
+
+    async def run() -> None:
+        for message_id in (3, 1, 2):
+            buffer.add(photo_message(message_id), handler)
+            await asyncio.sleep(0)
+        buffer.add(photo_message(7, group="other"), handler)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert sorted(calls) == [[1, 2, 3], [7]]
+
+
+def test_flush_handles_pending_album_at_once():
+    buffer = MediaGroupBuffer(delay=60)
+    calls = []
+
+    async def handler(messages) -> None:
+        calls.append(len(messages))
+
+    async def run() -> None:
+        buffer.add(photo_message(1), handler)
+        buffer.add(photo_message(2), handler)
+        buffer.add(photo_message(3, chat_id=2), handler)
+        await buffer.flush(1)
+        assert calls == [2]
+        await buffer.flush(2)
+
+    asyncio.run(run())
+    assert calls == [2, 1]
+
+
+def test_album_handler_holds_chat_lock():
+    buffer = MediaGroupBuffer(delay=0)
+    order = []
+    release = asyncio.Event()
+
+    async def album(messages) -> None:
+        order.append("album start")
+        await release.wait()
+        order.append("album end")
+
+    async def run() -> None:
+        buffer.add(photo_message(1), album)
+        await asyncio.sleep(0.01)
+        single = asyncio.create_task(single_photo())
+        await asyncio.sleep(0.01)
+        release.set()
+        await single
+
+    async def single_photo() -> None:
+        async with buffer.lock(1):
+            order.append("single")
+
+    asyncio.run(run())
+    assert order == ["album start", "album end", "single"]
+
+
+def test_album_handler_runs_outside_update_snapshot():
+    buffer = MediaGroupBuffer(delay=0)
+    seen = []
+
+    async def handler(messages) -> None:
+        seen.append(_snapshot.get())
+
+    async def run() -> None:
+        token = _snapshot.set({})
+        try:
+            buffer.add(photo_message(1), handler)
+        finally:
+            _snapshot.reset(token)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert seen == [None]
+
+
+def test_failing_album_handler_does_not_break_buffer():
+    buffer = MediaGroupBuffer(delay=0)
+    calls = []
+
+    async def failing(messages) -> None:
+        raise RuntimeError("boom")
+
+    async def handler(messages) -> None:
+        calls.append(len(messages))
+
+    async def run() -> None:
+        buffer.add(photo_message(1, group="a"), failing)
+        await asyncio.sleep(0.01)
+        buffer.add(photo_message(2, group="b"), handler)
+        await asyncio.sleep(0.01)
+        assert not buffer.lock(1).locked()
+
+    asyncio.run(run())
+    assert calls == [1]
@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy import event, select
+
+from telegram.middlewares import DbSessionMiddleware
+from telegram_db.models import Apartment
+
+
+def run(middleware, handler, params=("event", "session")):
+    data = {"handler": SimpleNamespace(params=dict.fromkeys(params))}
+    return asyncio.run(middleware(handler, object(), data))
+
+
+def count_checkouts(session_factory) -> list:
+    checkouts = []
+    event.listen(
+        session_factory.kw["bind"].sync_engine.pool, "checkout",
+        lambda *args: checkouts.append(1))
+    return checkouts
+
+
+def test_connection_is_not_taken_before_first_query(session_factory):
+    middleware = DbSessionMiddleware(session_factory)
+    checkouts = count_checkouts(session_factory)
+
+    async def handler(event, data):
+        assert not checkouts
+        return "ok"
+
+    assert run(middleware, handler) == "ok"
+    assert checkouts == []
+    assert middleware.stats()["sessions"] == 0
+
+
+def test_update_uses_one_connection(session_factory):
+    middleware = DbSessionMiddleware(session_factory)
+    checkouts = count_checkouts(session_factory)
+
+    async def handler(event, data):
+        session = data["session"]
+        await session.scalar(select(Apartment.id))
+        session.add(Apartment(
+            owner_id="1", city="Москва", address="a", price=1, rooms=1))
+        await session.flush()
+
+    run(middleware, handler)
+    assert len(checkouts) == 1
+    stats = middleware.stats()
+    assert stats["sessions"] == 1
+    assert stats["hold_max"] >= stats["pool_wait_max"] >= 0
+
+
+def test_handler_without_session_parameter_gets_no_session(session_factory):
+    middleware = DbSessionMiddleware(session_factory)
+
+    async def handler(event, data):
+        return "session" in data
+
+    assert run(middleware, handler, params=("event",)) is False
@@ -0,0 +1,126 @@
+import asyncio
+
+from sqlalchemy import Column, Index, Integer, MetaData, Table, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from telegram_db.dedup import listing_fingerprint
+from telegram_db.migrations import (
+    concurrent_index_ddl, discover_migrations, migrate)
+from telegram_db.models import Base
+
+
+# Схема исходной версии бота, до версионированных миграций.
+BASELINE_SCHEMA = (
+    """
+    CREATE TABLE apartments (
+        id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        owner_id VARCHAR NOT NULL,
+        city VARCHAR NOT NULL,
+        street VARCHAR,
+        address VARCHAR NOT NULL,
+        price FLOAT NOT NULL,
+        storey INTEGER,
+        rooms INTEGER NOT NULL,
+        description VARCHAR,
+        created_at DATETIME,
+        is_available BOOLEAN NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE photos (
+        id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        apartment_id INTEGER NOT NULL REFERENCES apartments (id),
+        file_id VARCHAR NOT NULL
+    )
+    """,
+)
+LISTINGS = [
+    ("1", "Москва", "Тверская, 1", 30000, 1, 1),
+    ("2", "Москва", "Арбат, 2", 45000, 3, 2),
+    ("3", "Казань", "Баумана, 3", 25000, None, 1),
+]
+
+
+def test_migrations_upgrade_populated_baseline_database(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+
+    async def run() -> None:
+        async with engine.begin() as conn:
+            for statement in BASELINE_SCHEMA:
+                await conn.exec_driver_sql(statement)
+            for number, listing in enumerate(LISTINGS, start=1):
+                await conn.execute(text(
+                    "INSERT INTO apartments (owner_id, city, address, price, "
+                    "storey, rooms, description, created_at, is_available) "
+                    "VALUES (:owner, :city, :address, :price, :storey, "
+                    ":rooms, '', '2024-01-01 00:00:00', 1)"),
+                    dict(zip(("owner", "city", "address", "price", "storey",
+                              "rooms"), listing)))
+                await conn.execute(text(
+                    "INSERT INTO photos (apartment_id, file_id) "
+                    "VALUES (:id, :file_id)"),
+                    {"id": number, "file_id": f"photo-{number}"})
+
+        applied = await migrate(engine)
+        assert applied == [version for version, _, _ in discover_migrations()]
+        assert await migrate(engine) == []
+
+        async with engine.connect() as conn:
+            rows = (await conn.execute(text(
+                "SELECT address, price, rooms, storey, fingerprint "
+                "FROM apartments ORDER BY id"))).all()
+            photos = (await conn.execute(text(
+                "SELECT apartment_id, file_id FROM photos ORDER BY id"))).all()
+            photo_columns = await conn.run_sync(
+                lambda sync: {column["name"] for column in
+                              inspect(sync).get_columns("photos")})
+        assert [row.fingerprint for row in rows] == [
+            listing_fingerprint(row.address, row.price, row.rooms, row.storey)
+            for row in rows]
+        assert len({row.fingerprint for row in rows}) == len(LISTINGS)
+        assert [tuple(photo) for photo in photos] == [
+            (1, "photo-1"), (2, "photo-2"), (3, "photo-3")]
+        assert {"file_unique_id", "phash"} <= photo_columns
+
+    asyncio.run(run())
+    asyncio.run(engine.dispose())
+
+
+def test_fresh_database_matches_models(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+
+    def schema(conn) -> dict:
+        inspector = inspect(conn)
+        return {
+            table.name: (
+                {column["name"] for column in
+                 inspector.get_columns(table.name)},
+                {index["name"] for index in
+                 inspector.get_indexes(table.name)})
+            for table in Base.metadata.sorted_tables}
+
+    async def run() -> None:
+        await migrate(engine)
+        async with engine.connect() as conn:
+            migrated = await conn.run_sync(schema)
+        for table in Base.metadata.sorted_tables:
+            columns, indexes = migrated[table.name]
+            assert columns == {column.name for column in table.columns}
+            assert indexes == {
+                index.name for index in table.indexes
+                if index._ddl_if is None}
+
+    asyncio.run(run())
+    asyncio.run(engine.dispose())
+
+
+def test_postgres_indexes_are_built_concurrently():
+    table = Table(
+        "things", MetaData(), Column("id", Integer), Column("code", Integer))
+    assert concurrent_index_ddl(Index("ix_things_id", table.c.id)) == (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_things_id "
+        "ON things (id)")
+    assert concurrent_index_ddl(
+        Index("ix_things_code", table.c.code, unique=True)) == (
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_things_code "
+        "ON things (code)")
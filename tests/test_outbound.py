@@ -0,0 +1,40 @@
+import asyncio
+
+from aiogram.methods import SendMediaGroup, SendMessage
+from aiogram.types import InputMediaPhoto
+
+from telegram import cache, ratelimit
+from telegram.outbound import OutboundDispatcher
+
+
+def test_chat_bucket_is_kept_while_chat_is_active(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    dispatcher = OutboundDispatcher()
+    bucket = dispatcher._chat_bucket(1)
+    for _ in range(3):
+        now[0] += 50
+        assert dispatcher._chat_bucket(1) is bucket
+
+
+def test_media_group_costs_token_per_message(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: 1000.0)
+    dispatcher = OutboundDispatcher(rate=30, chat_rate=1, chat_burst=20)
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method)
+        return True
+
+    album = SendMediaGroup(chat_id=1, media=[
+        InputMediaPhoto(media=f"photo-{number}") for number in range(3)])
+
+    async def run() -> None:
+        await dispatcher(make_request, None, album)
+        await dispatcher(make_request, None, SendMessage(chat_id=1, text="x"))
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    assert sent[0] is album
+    assert dispatcher._chat_bucket(1)._tokens == 20 - 4
+    assert dispatcher.bot_bucket._tokens == 30 - 4
@@ -0,0 +1,59 @@
+import asyncio
+
+from aiogram import types
+from aiogram.methods import SendMessage
+
+from telegram.main import dp
+from telegram.states import Form
+from tests.helpers import message_update
+
+
+def feed(bot, update: types.Update) -> list:
+    asyncio.run(dp.feed_update(bot, update))
+    return bot.session.requests
+
+
+def set_state(bot, state, **data) -> None:
+    context = dp.fsm.get_context(bot, chat_id=1, user_id=1)
+
+    async def apply() -> None:
+        await context.set_state(state)
+        await context.set_data(data)
+
+    asyncio.run(apply())
+
+
+def big_document(name: str) -> types.Document:
+    return types.Document(
+        file_id="file", file_unique_id="unique", file_name=name,
+        file_size=100 * 1024 * 1024)
+
+
+def test_import_command_reaches_bulk_import(bot):
+    requests = feed(bot, message_update(text="/import"))
+    assert isinstance(requests[0], SendMessage)
+    assert "Массовый импорт" in requests[0].text
+
+
+def test_document_reaches_bulk_import(bot):
+    requests = feed(bot, message_update(document=big_document("a.csv")))
+    assert "больше 20 МБ" in requests[0].text
+
+
+def test_document_in_search_state_reaches_bulk_import(bot):
+    set_state(bot, Form.search_filters, search_filters={})
+    requests = feed(bot, message_update(document=big_document("a.json")))
+    assert "больше 20 МБ" in requests[0].text
+
+
+def test_unrelated_text_is_not_taken_by_search_form(bot):
+    set_state(bot, Form.search_filters, search_filters={})
+    assert feed(bot, message_update(text="привет")) == []
+
+
+def test_search_form_takes_value_of_edited_field(bot):
+    set_state(
+        bot, Form.search_filters, search_filters={},
+        current_edit_field="комнаты")
+    requests = feed(bot, message_update(text="2"))
+    assert requests[0].text == "Значение для 'комнаты' обновлено."
@@ -0,0 +1,134 @@
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy import event
+
+from telegram_db.fulltext import text_rank
+from telegram_db.search import (
+    KEYWORDS_FILTER, count_apartments, search_apartments_page)
+from telegram_db.keyword_index import keyword_index
+from telegram_db.search_cache import search_cache
+from tests.helpers import make_apartment
+
+
+START = datetime.datetime(2024, 1, 1)
+DESCRIPTIONS = [
+    "балкон", "балкон и ещё балкон", "без мебели", "балкон, балконы",
+    "балкон", "мебель", "балкон балкон балкон", "балкон",
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_search_cache():
+    search_cache.clear()
+    yield
+    search_cache.clear()
+    keyword_index.clear()
+
+
+async def add_apartments(session) -> list:
+    # Одинаковое время у пар объявлений проверяет разбор ничьих по id.
+    apartments = [
+        make_apartment(
+            description=description,
+            created_at=START + datetime.timedelta(hours=index // 2))
+        for index, description in enumerate(DESCRIPTIONS)]
+    session.add_all(apartments)
+    await session.commit()
+    return apartments
+
+
+def expected_order(apartments: list, keywords: str = None) -> list:
+    def key(apartment) -> tuple:
+        rank = (int(text_rank(apartment.description, keywords) * 1000)
+                if keywords else 0)
+        return rank, apartment.created_at, apartment.id
+
+    return [apartment.id for apartment in sorted(
+        apartments, key=key, reverse=True)]
+
+
+async def walk(session, filters: dict, limit: int) -> list:
+    """Листает вперед до конца, затем назад до начала."""
+    forward = []
+    page = await search_apartments_page(session, filters, limit=limit)
+    while page.apartments:
+        forward.append([apartment.id for apartment in page.apartments])
+        last = page
+        page = await search_apartments_page(
+            session, filters, after=page.last_cursor, limit=limit)
+
+    backward = [[apartment.id for apartment in last.apartments]]
+    page = last
+    while True:
+        page = await search_apartments_page(
+            session, filters, before=page.first_cursor, limit=limit)
+        if not page.apartments:
+            break
+        backward.append([apartment.id for apartment in page.apartments])
+    return forward, backward[::-1]
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_pages_follow_creation_order(session_factory, cached):
+    async def run() -> None:
+        async with session_factory() as session:
+            apartments = await add_apartments(session)
+            if cached:
+                assert await count_apartments(session, {}) == 8
+            forward, backward = await walk(session, {}, limit=3)
+            assert sum(forward, []) == expected_order(apartments)
+            assert [len(page) for page in forward] == [3, 3, 2]
+            assert backward == forward
+            assert search_cache.stats()["results"] == int(cached)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_ranked_pages_follow_relevance(session_factory, cached):
+    async def run() -> None:
+        async with session_factory() as session:
+            apartments = await add_apartments(session)
+            await keyword_index.load(session)
+            filters = {KEYWORDS_FILTER: "балкон"}
+            matching = [apartment for apartment in apartments
+                        if "балкон" in apartment.description]
+            if cached:
+                assert await count_apartments(session, filters) == 6
+            forward, backward = await walk(session, filters, limit=2)
+            assert sum(forward, []) == expected_order(matching, "балкон")
+            assert backward == forward
+
+            page = await search_apartments_page(session, filters, limit=2)
+            assert len(page.first_cursor) == 3
+            assert page.first_cursor[2] > 0
+
+    asyncio.run(run())
+
+
+def test_large_result_is_counted_with_one_query(
+    session_factory, monkeypatch
+):
+    monkeypatch.setattr(search_cache, "max_ids", 3)
+    statements = []
+
+    async def run() -> None:
+        async with session_factory() as session:
+            await add_apartments(session)
+            engine = session.bind.sync_engine
+            event.listen(
+                engine, "before_cursor_execute",
+                lambda *args: statements.append(args[2]))
+            assert await count_apartments(session, {}) == 8
+            assert len(statements) == 1
+            assert search_cache.stats()["results"] == 0
+
+            monkeypatch.setattr(search_cache, "max_ids", 8)
+            statements.clear()
+            assert await count_apartments(session, {}) == 8
+            assert len(statements) == 2
+            assert search_cache.stats()["results"] == 1
+
+    asyncio.run(run())
@@ -0,0 +1,141 @@
+import asyncio
+import datetime
+import random
+from types import SimpleNamespace
+
+import pytest
+from aiogram import types
+
+from telegram.callbacks import ListingAction
+from telegram.handlers.publications import toggle_availability
+from telegram.middlewares import DbSessionMiddleware
+from telegram.subscriptions import IntervalTree, SubscriptionIndex, notifier
+from tests.helpers import make_apartment
+
+
+def matched(index: SubscriptionIndex, **fields) -> set:
+    apartment = make_apartment(id=100, **fields)
+    return {search_id for search_id, _, _ in index.match(apartment)}
+
+
+def test_interval_tree_matches_brute_force():
+    rng = random.Random(1)
+    intervals = []
+    for value in range(200):
+        low = rng.randint(0, 100)
+        intervals.append((low, low + rng.randint(-5, 30), value))
+    tree = IntervalTree(intervals)
+    for point in range(-1, 140):
+        assert sorted(tree.stab(point)) == sorted(
+            value for low, high, value in intervals if low <= point <= high)
+
+
+@pytest.mark.parametrize("price, found", [
+    (29999, False), (30000, True), (35000, True), (40000, True),
+    (40001, False),
+])
+def test_price_range_includes_both_bounds(price, found):
+    index = SubscriptionIndex()
+    index.add(1, "2", "2", {"цена мин": "30000", "цена макс": "40000"})
+    index.add(2, "3", "3", {"цена мин": "30000"})
+    index.add(3, "4", "4", {"цена макс": "40000"})
+    # Пустой диапазон ничему не соответствует.
+    index.add(4, "5", "5", {"цена мин": "40000", "цена макс": "30000"})
+    assert (1 in matched(index, price=price)) is found
+    assert (2 in matched(index, price=price)) is (price >= 30000)
+    assert (3 in matched(index, price=price)) is (price <= 40000)
+    assert 4 not in matched(index, price=price)
+
+
+def test_city_and_rooms_buckets():
+    index = SubscriptionIndex()
+    index.add(1, "2", "2", {"город": "Москва"})
+    index.add(2, "2", "2", {"город": "москв", "комнаты": "2"})
+    index.add(3, "2", "2", {"комнаты": "1"})
+    index.add(4, "2", "2", {"город": "Казань"})
+    index.add(5, "2", "2", {"город": "Масква", "нечеткий поиск": "да"})
+    index.add(6, "2", "2", {})
+
+    assert matched(index, city="Москва", rooms=1) == {1, 3, 5, 6}
+    assert matched(index, city="Москва", rooms=2) == {1, 2, 5, 6}
+    assert matched(index, city="Казань", rooms=1) == {3, 4, 6}
+    assert matched(index, city="Казань", rooms=1, is_available=False) == set()
+
+
+def test_removed_subscription_is_not_matched():
+    index = SubscriptionIndex()
+    index.add(1, "2", "2", {"город": "Москва", "цена макс": "40000"})
+    index.add(2, "3", "3", {"город": "Москва"})
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 1
+    assert matched(index, city="Москва") == {2}
+    index.remove(2)
+    assert matched(index, city="Москва") == set()
+    assert index._buckets == {} and index._city_lengths == {}
+
+
+def test_replaced_subscription_uses_new_filters():
+    index = SubscriptionIndex()
+    index.add(1, "2", "2", {"город": "Москва"})
+    index.add(1, "2", "2", {"город": "Казань"})
+    assert len(index) == 1
+    assert matched(index, city="Москва") == set()
+    assert matched(index, city="Казань") == {1}
+
+
+def test_listing_toggled_back_to_available_notifies_again(
+    session_factory, bot, monkeypatch
+):
+    index = SubscriptionIndex()
+    index.add(1, "2", "20", {"город": "Москва"})
+    monkeypatch.setattr(notifier, "index", index)
+    middleware = DbSessionMiddleware(session_factory)
+
+    async def run() -> None:
+        monkeypatch.setattr(notifier, "_queue", asyncio.Queue())
+        async with session_factory() as session:
+            apartment = make_apartment(owner_id="1")
+            session.add(apartment)
+            await session.commit()
+
+        chat = types.Chat(id=1, type="private")
+        callback = types.CallbackQuery(
+            id="1", chat_instance="1", data="toggle",
+            from_user=types.User(id=1, is_bot=False, first_name="Тест"),
+            message=types.Message(
+                message_id=1, date=datetime.datetime.now(), chat=chat,
+            ).as_(bot),
+        ).as_(bot)
+        data = {
+            "handler": SimpleNamespace(params={"session": None}),
+            "callback_data": ListingAction(action="toggle", id=apartment.id),
+        }
+
+        async def handler(event, data) -> None:
+            await toggle_availability(
+                event, data["callback_data"], data["session"])
+
+        queued = []
+        for _ in range(4):
+            await middleware(handler, callback, data)
+            queued.append(notifier._queue.qsize())
+        # Уведомление уходит при каждом возврате в доступные и только
+        # после фиксации транзакции.
+        assert queued == [0, 1, 1, 2]
+        chat_id, text = notifier._queue.get_nowait()
+        assert chat_id == "20" and f"ID:</b> {apartment.id}" in text
+
+    asyncio.run(run())
+
+
+def test_owner_is_not_notified(monkeypatch):
+    index = SubscriptionIndex()
+    index.add(1, "1", "10", {})
+    index.add(2, "2", "20", {})
+    index.add(3, "3", "20", {})
+    monkeypatch.setattr(notifier, "index", index)
+    monkeypatch.setattr(notifier, "_queue", asyncio.Queue())
+    # Владелец не получает уведомление, чат — только одно.
+    assert notifier._notify(make_apartment(id=1, owner_id="1")) == 1
+    assert notifier._queue.get_nowait()[0] == "20"